@@ -0,0 +1,507 @@
+"""One task for each game, which applies the commands of its players in order.
+
+The connection handlers only parse the messages of the players and queue them as commands. The actor of the game takes
+all the queued commands, applies them one after the other and then lets the bots play, so the game and its connections
+are only changed by one task. The messages produced by a batch of commands are sent by the writers of the connections
+(see :mod:`apuestas.outbox`) once the batch has been applied.
+"""
+import asyncio
+import json
+import logging
+import secrets
+import time
+from dataclasses import dataclass, field
+from typing import ClassVar
+
+from apuestas.connections import Connections
+from apuestas.metrics import METRICS
+from apuestas.models.game import Game
+from apuestas.simulation.policies import LowestCardPolicy, Policy
+from apuestas.timers import Timer, TimingWheel
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Command:
+    player: str
+    connection: object
+    # time.perf_counter() when it was queued, to measure the latency
+    received: float = field(default_factory=time.perf_counter, kw_only=True)
+    # the type of the event of the command, its latency is recorded in the metrics
+    event_type: ClassVar[str] = None
+
+
+@dataclass
+class Ready(Command):
+    """The player acknowledged the start of the game ("start_ack")"""
+    game_key: str
+    event_type: ClassVar[str] = "start_ack"
+
+
+@dataclass
+class Bet(Command):
+    bet: int
+    event_type: ClassVar[str] = "bet"
+
+
+@dataclass
+class Play(Command):
+    number: int
+    suit: str
+    event_type: ClassVar[str] = "play"
+
+
+@dataclass
+class Info(Command):
+    """The player asks for the game information ("game_info" or "resync")"""
+    event_type: str = "game_info"
+
+
+@dataclass
+class Join(Command):
+    """A player joins the game. The bots have no connection"""
+    deltas: bool = False
+    bot: object = None
+    # set to True if the player joined the game, or to False
+    result: asyncio.Future = None
+    # the key of the seat of the player, to join a restored game again
+    seat_key: str = None
+
+
+@dataclass
+class Leave(Command):
+    pass
+
+
+@dataclass
+class Evict(Command):
+    """The game expired, the players are disconnected"""
+    player: str = None
+    connection: object = None
+
+
+@dataclass
+class Timeout(Command):
+    """The deadline of a move or a turn expired. version is the move or turn it was armed for"""
+    player: str = None
+    connection: object = None
+    kind: str = "move"
+    version: int = 0
+
+
+@dataclass
+class Timeouts:
+    """
+    Deadlines (in seconds, None for no deadline) of each move and of each turn.
+
+    When a deadline expires, policy plays the missing moves of the players
+    (the bots play their own moves).
+
+    """
+    wheel: TimingWheel
+    move: float = None
+    turn: float = None
+    policy: Policy = field(default_factory=LowestCardPolicy)
+
+
+# plays the moves of the players that left the games without timeouts
+_LEFT_POLICY = LowestCardPolicy()
+
+
+@dataclass
+class ActorStats:
+    commands: int = 0
+    batches: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        return self.total_latency / self.commands if self.commands else 0.0
+
+    def to_json(self):
+        return {
+            "commands": self.commands,
+            "batches": self.batches,
+            "mean_latency": self.mean_latency,
+            "max_latency": self.max_latency,
+        }
+
+
+async def error(websocket, message, kind: str = "other"):
+    """
+    Send an error message. It is counted in the metrics by its kind (see
+    :data:`apuestas.metrics.ERROR_KINDS`).
+
+    """
+    METRICS.count_error(kind)
+    event = {
+        "type": "error",
+        "message": message,
+    }
+    await websocket.send(json.dumps(event))
+
+
+class GameActor:
+    """
+    Runs a game: apply the commands of its players with :meth:`submit`.
+
+    The first player of the game starts it when it acknowledges the start.
+    The moves of a player that left are played by the timeout policy (the
+    lowest legal move if there are no timeouts) as soon as it is its turn.
+    The task finishes when all the players have left.
+
+    If event_log is given, the accepted moves are appended to it with the
+    game_id (see :mod:`apuestas.eventlog`). A game rebuilt from the log
+    (restored) has already started: its players only have to join it again,
+    with the key of their seat (seat_keys), which only they received.
+
+    """
+
+    def __init__(self, game: Game, game_key: str, bots: dict = None, timeouts: Timeouts = None,
+                 event_log=None, game_id: int = None, seat_keys: dict[str, str] = None, restored: bool = False):
+        self.game = game
+        self.game_key = game_key
+        self.bots = {} if bots is None else bots
+        self.timeouts = timeouts
+        self.event_log = event_log
+        self.game_id = game_id
+        self.seat_keys = {} if seat_keys is None else seat_keys
+        self.restored = restored
+        # a restored game waits for its players until one of them joins it again, or it is evicted
+        self.waiting = restored
+        # moves and turns played, the timeouts of the previous ones are ignored
+        self.moves = 0
+        self.turns = 0
+        self._armed_moves = None
+        self._move_timer = Timer(lambda: self.submit(Timeout(kind="move", version=self._armed_moves)))
+        self._turn_timer = Timer(lambda: self.submit(Timeout(kind="turn", version=self.turns)))
+        self.connected = Connections()
+        # players that left the game, their seats are played by the timeout policy
+        self.left = set()
+        self.ready = set() if game.current_muestra is None else set(game.players)
+        self.stats = ActorStats()
+        self.last_activity = time.monotonic()
+        self._queue = asyncio.Queue()
+        self._task = None
+        self._closing = set()
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    def submit(self, command: Command):
+        self._queue.put_nowait(command)
+
+    def evict(self):
+        self.submit(Evict())
+
+    async def join(self, player, connection, deltas: bool=False, bot=None, seat_key: str = None) -> bool:
+        """
+        Add a player (or a bot) to the game. The players of a restored game
+        join it again with the key of their seat. Returns False if it
+        couldn't join.
+
+        """
+        if self._task is not None and self._task.done():
+            await error(connection, "Game not found.", "game_not_found")
+            return False
+        result = asyncio.get_running_loop().create_future()
+        self.submit(Join(player, connection, deltas, bot, result, seat_key))
+        return await result
+
+    async def run(self):
+        while True:
+            commands = [await self._queue.get()]
+            while not self._queue.empty():
+                commands.append(self._queue.get_nowait())
+            for command in commands:
+                try:
+                    await self.apply(command)
+                except Exception:
+                    logger.exception("Error applying %s", command)
+                    if command.connection is not None:
+                        await error(command.connection, "Internal error.", "internal")
+                latency = time.perf_counter() - command.received
+                self.stats.commands += 1
+                self.stats.total_latency += latency
+                self.stats.max_latency = max(self.stats.max_latency, latency)
+                METRICS.observe_command(command.event_type, latency)
+            self.stats.batches += 1
+            self.last_activity = time.monotonic()
+            if not self.connected and not self.waiting:
+                break
+            await self.play_bots()
+            self.arm_timers()
+        self._move_timer.cancel()
+        self._turn_timer.cancel()
+        self.log_end()
+        # the players that were joining find the game finished
+        while not self._queue.empty():
+            command = self._queue.get_nowait()
+            if isinstance(command, Join):
+                await error(command.connection, "Game not found.", "game_not_found")
+                command.result.set_result(False)
+
+    async def apply(self, command: Command):
+        game = self.game
+        connection = command.connection
+        if isinstance(command, Join):
+            if (command.player in self.connected or command.player in self.bots
+                    or (command.player in game.players and not self.can_rejoin(command.player, command.seat_key))):
+                await error(connection, "The game is full.", "game_full")
+                command.result.set_result(False)
+                return
+            if command.bot is not None:
+                self.bots[command.player] = command.bot
+            else:
+                self.connected[command.player] = connection
+                if command.deltas:
+                    self.connected.enable_deltas(command.player)
+            if command.player in game.players:
+                # the player joins again the restored game
+                self.waiting = False
+                self.left.discard(command.player)
+                command.result.set_result(True)
+                return
+            game.add_player(command.player)
+            if self.event_log is not None:
+                self.event_log.add_player(self.game_id, command.player)
+            if len(game.players) == 2:
+                event = {
+                    "type": "start",
+                    "game_key": self.game_key,
+                }
+                self.connected.broadcast(event)
+            command.result.set_result(True)
+        elif isinstance(command, Leave):
+            if command.player in self.connected:
+                del self.connected[command.player]
+            if command.player in game.players and not game.has_game_ended():
+                self.left.add(command.player)
+                event = {
+                    "type": "left",
+                    "player": command.player,
+                }
+                self.connected.broadcast(event)
+        elif isinstance(command, Evict):
+            self.waiting = False
+            event = {
+                "type": "error",
+                "message": "The game has expired.",
+            }
+            self.connected.broadcast(event)
+            # the players leave when their connections are closed
+            for connection in self.connected.values():
+                task = asyncio.create_task(connection.shutdown(1001, "The game has expired."))
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+        elif isinstance(command, Timeout):
+            if command.kind == "move" and command.version == self.moves:
+                await self.play_timeout()
+            elif command.kind == "turn" and command.version == self.turns:
+                while self.turns == command.version and not game.has_game_ended():
+                    await self.play_timeout()
+        elif command.player not in self.ready:
+            if not isinstance(command, Ready):
+                await error(connection, "Invalid event type. We are in state 'start_ack'", "invalid_state")
+            elif command.game_key != self.game_key:
+                await error(connection, "Invalid game_key", "invalid_game_key")
+            else:
+                self.ready.add(command.player)
+                if command.player == game.current_player_order[0]:
+                    # we start the game and we broadcast the information
+                    self.start_turn()
+        elif game.current_muestra is None:
+            await error(connection, "The game has not started.", "not_started")
+        elif isinstance(command, Bet):
+            if game.current_state != "bet":
+                await error(connection, "Invalid event type. We are in state 'bet'", "invalid_state")
+                return
+            try:
+                # Play the move.
+                self.apply_bet(command.player, command.bet)
+            except ValueError as exc:
+                # Send an "error" event if the move was illegal.
+                await error(connection, str(exc), "illegal_move")
+        elif isinstance(command, Play):
+            if game.current_state != "play":
+                await error(connection, "Invalid event type. We are in state 'play'", "invalid_state")
+                return
+            try:
+                # Play the move.
+                self.apply_play(command.player, command.number, command.suit)
+            except ValueError as exc:
+                # Send an "error" event if the move was illegal.
+                await error(connection, str(exc), "illegal_move")
+        elif isinstance(command, Info):
+            # "resync" is sent by the clients that use deltas when they miss
+            # a sequence number: they receive the full information again. It
+            # is not published, the sequence of the other players goes on.
+            event = {
+                "type": command.event_type,
+            }
+            connection.put(self.connected.encode(command.player, event, game, game.players[command.player], full=True))
+
+    def can_rejoin(self, player: str, seat_key: str) -> bool:
+        """Returns True if the player of the restored game can take its seat again with seat_key"""
+        expected_key = self.seat_keys.get(player)
+        return self.restored and expected_key is not None and seat_key is not None and secrets.compare_digest(
+            seat_key.encode(), expected_key.encode()
+        )
+
+    def arm_timers(self):
+        """Sets the deadline of the next move, if it changed"""
+        timeouts = self.timeouts
+        if timeouts is None:
+            return
+        game = self.game
+        if game.current_muestra is None or game.has_game_ended():
+            self._move_timer.cancel()
+            self._turn_timer.cancel()
+        elif timeouts.move is not None and self._armed_moves != self.moves:
+            self._armed_moves = self.moves
+            timeouts.wheel.reschedule(self._move_timer, timeouts.move)
+
+    async def play_timeout(self):
+        """Plays the move of the current player, who missed its deadline"""
+        game = self.game
+        player = game.current_player
+        policy = self.bots.get(player.name)
+        if policy is None:
+            policy = self.timeouts.policy
+            event = {
+                "type": "timeout",
+                "player": player.name,
+            }
+            self.connected.broadcast(event)
+        if game.current_state == "bet":
+            self.apply_bet(player.name, await asyncio.to_thread(policy.bet, game, player))
+        else:
+            card = await asyncio.to_thread(policy.play, game, player)
+            self.apply_play(player.name, card.number, card.suit)
+
+    def log_end(self):
+        """The game is not rebuilt from the event log anymore"""
+        if self.event_log is not None:
+            self.event_log.end_game(self.game_id)
+            self.event_log = None
+
+    def start_turn(self):
+        game = self.game
+        connected = self.connected
+        game.begin_turn()
+        if self.event_log is not None:
+            self.event_log.begin_turn(self.game_id)
+        self.turns += 1
+        if self.timeouts is not None and self.timeouts.turn is not None:
+            self.timeouts.wheel.reschedule(self._turn_timer, self.timeouts.turn)
+        first_player = game.current_player
+        connected.publish(game)
+        event = {
+            "type": "start_turn",
+            "first_player": first_player.name,
+        }
+        for player_name, connection in connected.items():
+            connection.put(connected.encode(player_name, event, game, game.players[player_name]))
+
+    def apply_bet(self, player, player_bet):
+        """
+        Play a bet and broadcast it.
+
+        Raises :exc:`ValueError` if the bet is illegal.
+
+        """
+        game = self.game
+        player_index = game.current_player_index
+        game.bet(player, player_bet)
+        if self.event_log is not None:
+            self.event_log.bet(self.game_id, player_index, player_bet)
+        self.moves += 1
+        next_player = game.next_player()
+        if next_player is None:
+            game.finish_bet_tour()
+
+        # Send a "bet" event to update the UI.
+        event = {
+            "type": "bet",
+            "player": player,
+            "bet": player_bet,
+        }
+        self.connected.broadcast(event, game)
+
+    def apply_play(self, player, card_number, card_suit):
+        """
+        Play a card, broadcast it and finish the round and the turn if needed.
+
+        Raises :exc:`ValueError` if the move is illegal.
+
+        """
+        game = self.game
+        player_index = game.current_player_index
+        card = game.play(player, card_number, card_suit)
+        if self.event_log is not None:
+            self.event_log.play(self.game_id, player_index, card.id)
+        self.moves += 1
+        next_player = game.next_player()
+        round_ended = next_player is None
+
+        # Send a "play" event to update the UI.
+        event = {
+            "type": "play",
+            "player": player,
+            "card": card.to_json(),
+            "round_ended": round_ended,
+        }
+        self.connected.broadcast(event, game)
+
+        if next_player is None:
+            # Send a "round_ended" event to update the UI.
+            round_winner = game.end_round()
+            event = {
+                "type": "round_ended",
+                "round_winner": round_winner.name,
+            }
+            self.connected.broadcast(event, game)
+
+        if game.has_turn_finished():
+            # Send a "turn_ended" event to update the UI.
+            game.end_turn()
+            METRICS.turns_completed += 1
+            if game.has_game_ended():
+                METRICS.games_completed += 1
+                self.log_end()
+                event = {
+                    "type": "game_ended",
+                }
+                self.connected.broadcast(event, game)
+            else:
+                self.start_turn()
+
+    async def play_bots(self):
+        """
+        Play the moves of the bots, and of the players that left, while it is
+        their turn.
+
+        The bots search their moves in a thread, so the other games are not
+        blocked. The game doesn't change meanwhile: the commands of the
+        players wait in the queue.
+
+        """
+        game = self.game
+        if not self.ready or game.current_muestra is None:
+            # the game has not started
+            return
+        left_policy = self.timeouts.policy if self.timeouts is not None else _LEFT_POLICY
+        while not game.has_game_ended() and (game.current_player.name in self.bots
+                                             or game.current_player.name in self.left):
+            player = game.current_player
+            bot = self.bots.get(player.name, left_policy)
+            if game.current_state == "bet":
+                player_bet = await asyncio.to_thread(bot.bet, game, player)
+                self.apply_bet(player.name, player_bet)
+            else:
+                card = await asyncio.to_thread(bot.play, game, player)
+                self.apply_play(player.name, card.number, card.suit)
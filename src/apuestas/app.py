@@ -1,11 +1,23 @@
 import asyncio
 import json
+import os
 import secrets
 
-from websockets.asyncio.server import broadcast, serve
+from websockets.asyncio.server import serve
+from websockets.exceptions import InvalidHandshake
 
+from apuestas.actor import Bet, GameActor, Info, Leave, Play, Ready, Timeouts, error
+from apuestas.bots.equity import EquityTable
+from apuestas.bots.montecarlo import MonteCarloBot
+from apuestas.eventlog import EventLog, LoggedGame
+from apuestas.metrics import METRICS, serve_metrics
 from apuestas.models.game import Game
-from apuestas.models.card import Card
+from apuestas import outbox
+from apuestas.outbox import Connection
+from apuestas.registry import GameRegistry
+from apuestas.sharding import forward, get_key_prefix, get_shard, run_supervisor
+from apuestas.simulation.policies import LowestCardPolicy
+from apuestas.timers import TimingWheel
 
 # TODO: change it so we can have multiple players
 PLAYER1, PLAYER2 = "red", "blue"
@@ -18,21 +30,63 @@ logging.basicConfig(
 )
 
 
-JOIN = {}
+# Time (in seconds) after which the games without activity are evicted, and
+# the maximum amount of live games
+GAME_TTL = float(os.environ.get("APUESTAS_GAME_TTL", 3600))
+MAX_GAMES = int(os.environ.get("APUESTAS_MAX_GAMES", 10_000))
 
-WATCH = {}
+# The games that can be joined and watched, by their keys
+REGISTRY = GameRegistry(GAME_TTL, MAX_GAMES)
 
+# Time (in seconds, 0 for no limit) a player has for each move and for each
+# turn. When it expires, its move is played with the lowest legal card (or
+# bet), or by a bot if APUESTAS_TIMEOUT_ACTION is "bot".
+MOVE_TIMEOUT = float(os.environ.get("APUESTAS_MOVE_TIMEOUT", 60))
+TURN_TIMEOUT = float(os.environ.get("APUESTAS_TURN_TIMEOUT", 600))
+TIMEOUT_ACTION = os.environ.get("APUESTAS_TIMEOUT_ACTION", "lowest")
 
-async def error(websocket, message):
-    """
-    Send an error message.
+# The deadlines of all the games
+TIMERS = TimingWheel(tick=0.1)
 
-    """
-    event = {
-        "type": "error",
-        "message": message,
-    }
-    await websocket.send(json.dumps(event))
+# Time (in seconds) a bot can spend choosing a move
+BOT_TIME_LIMIT = 0.05
+
+# Precomputed bets used by the bots (see apuestas.bots.equity). It is only read on the first lookup
+EQUITY_TABLE_PATH = os.environ.get("APUESTAS_EQUITY_TABLE", "bet_equity.bin")
+EQUITY_TABLE = EquityTable(EQUITY_TABLE_PATH) if os.path.exists(EQUITY_TABLE_PATH) else None
+
+# Messages that can be pending in each connection, and what to do with the
+# clients that don't read them fast enough (see apuestas.outbox)
+OUTBOX_SIZE = int(os.environ.get("APUESTAS_OUTBOX_SIZE", 64))
+SLOW_CONSUMER_POLICY = os.environ.get("APUESTAS_SLOW_CONSUMER_POLICY", "drop_oldest")
+
+# File where the moves of the games are logged, to rebuild them when the
+# server starts again (no log if it is empty), the time (in seconds) between
+# the writes of the log and between the snapshots of the live games, after
+# which the previous moves are deleted (see apuestas.eventlog)
+EVENT_LOG_PATH = os.environ.get("APUESTAS_EVENT_LOG", "")
+EVENT_LOG_INTERVAL = float(os.environ.get("APUESTAS_EVENT_LOG_INTERVAL", 0.005))
+SNAPSHOT_INTERVAL = float(os.environ.get("APUESTAS_SNAPSHOT_INTERVAL", 60))
+
+# The log is opened by main, with the games it has rebuilt
+EVENT_LOG: EventLog = None
+# The games in the event log, by their id in it
+LOGGED_GAMES: dict[int, LoggedGame] = {}
+
+# Port of the server. With more than one worker process, each one owns the
+# games started in it and listens on its own local port (the first one is
+# APUESTAS_SHARD_PORT) to receive the players that join them from the other
+# workers (see apuestas.sharding)
+PORT = int(os.environ.get("APUESTAS_PORT", 8001))
+WORKERS = int(os.environ.get("APUESTAS_WORKERS", 1))
+SHARD_PORT = int(os.environ.get("APUESTAS_SHARD_PORT", 9001))
+
+# The shard of this process, set by main in the worker processes
+SHARD: int = None
+
+# Local port where the metrics are served in the Prometheus text format (0 for
+# none). The worker of each shard uses the next ones (see apuestas.metrics)
+METRICS_PORT = int(os.environ.get("APUESTAS_METRICS_PORT", 8002))
 
 
 async def replay(websocket, game):
@@ -53,38 +107,6 @@ async def replay(websocket, game):
         }
         await websocket.send(json.dumps(event))
 
-async def start_turn(game, connected):
-    game.begin_turn()
-    first_player = game.current_player
-    for player_name, connection in connected.items():
-        event = {
-            "type": "start_turn",
-            "first_player": first_player.name,
-            "player": game.players[player_name].to_json(),
-            "game_info": game.to_json()
-        }
-        await connection.send(json.dumps(event))
-
-async def waiting_players(websocket, game, game_key, connected, send_message: bool=False):
-    async for message in websocket:
-        event, error_message = parse_event(message)
-        if error_message:
-            await error(websocket, error_message)
-            continue
-        event_type = event["type"]
-        if event_type != "start_ack":
-            await error(websocket, "Invalid event type. We are in state 'start_ack'")
-            continue
-        # assert len(connected) == 2
-        if event["game_key"] != game_key:
-            await error(websocket, "Invalid game_key")
-            continue
-
-        if send_message:
-            # we start the game and we broadcast the information
-            await start_turn(game, connected)
-        break
-
 def parse_event(message):
     try:
         return json.loads(message), None
@@ -92,168 +114,225 @@ def parse_event(message):
         return None, str(e)
 
 
-async def play(websocket, game, player, connected):
+def create_timeouts():
+    if TIMEOUT_ACTION == "bot":
+        timeout_policy = MonteCarloBot(time_limit=BOT_TIME_LIMIT, equity_table=EQUITY_TABLE)
+    else:
+        timeout_policy = LowestCardPolicy()
+    return Timeouts(TIMERS, MOVE_TIMEOUT or None, TURN_TIMEOUT or None, timeout_policy)
+
+
+def register(actor, keys: tuple[str, str] = None, bot_players: tuple[str, ...] = ()):
     """
-    Receive and process moves from a player.
+    Register a game and start its actor. Returns its join and watch keys.
+    The seats of bot_players are played by bots, which are started again
+    with the game when it is restored.
+
+    Raises :exc:`ValueError` if there are too many live games.
 
     """
-    async for message in websocket:
-        # Parse a "play" event from the UI.
-        event, error_message = parse_event(message)
-        if error_message:
-            await error(websocket, error_message)
-            continue
-        event_type = event["type"]
+    join_key, watch_key = REGISTRY.add(actor, keys)
+    if actor.event_log is not None:
+        # the keys of the seats are logged as "player:key", and the seats of the bots as "player:" (without a key)
+        logged_keys = (
+            actor.game_key, join_key, watch_key, *(f"{player}:{key}" for player, key in actor.seat_keys.items()),
+            *(f"{player}:" for player in bot_players),
+        )
+        if actor.game_id is None:
+            actor.game_id = actor.event_log.new_game(actor.game.max_cards, actor.game.rng.seed, *logged_keys)
+        LOGGED_GAMES[actor.game_id] = LoggedGame(actor.game, logged_keys)
+
+    def forget(task):
+        REGISTRY.remove(actor)
+        LOGGED_GAMES.pop(actor.game_id, None)
+
+    # The game is forgotten when all its players have left.
+    actor.start().add_done_callback(forget)
+    return join_key, watch_key
+
+
+def restore_games(games: dict[int, LoggedGame]):
+    """
+    Start the games rebuilt from the event log.
+
+    Their players join them again with the join key of the game and the key
+    of their seat, and the seats of the bots are played by new bots.
+
+    """
+    for game_id, logged in games.items():
+        game_key, join_key, watch_key, *seats = logged.keys
+        seat_keys = {}
+        bots = {}
+        for seat in seats:
+            player, key = seat.split(":", 1)
+            if key:
+                seat_keys[player] = key
+            else:
+                bots[player] = MonteCarloBot(time_limit=BOT_TIME_LIMIT, equity_table=EQUITY_TABLE)
+        actor = GameActor(
+            logged.game, game_key, bots=bots, timeouts=create_timeouts(), event_log=EVENT_LOG, game_id=game_id,
+            seat_keys=seat_keys, restored=True,
+        )
+        try:
+            register(actor, (join_key, watch_key), tuple(bots))
+        except ValueError:
+            logging.warning("Too many games, game %d was not restored", game_id)
+            actor.log_end()
+    logging.info("Restored %d games from the event log", len(games))
+
+
+def add_gauges():
+    """Add the values kept by the server to the metrics"""
+    METRICS.add_gauge(
+        "apuestas_live_games", "Games that can be joined and watched, by their keys.",
+        lambda: {"join": len(REGISTRY.join), "watch": len(REGISTRY.watch)}, label="keys",
+    )
+    METRICS.add_gauge(
+        "apuestas_evicted_games_total", "Games evicted without activity.", lambda: REGISTRY.evicted, kind="counter"
+    )
+    METRICS.add_gauge("apuestas_connected_sockets", "Open connections of the players.", lambda: len(Connection.live))
+    METRICS.add_gauge(
+        "apuestas_outbox_messages_total", "Messages to the players, by what happened to them.",
+        lambda: {"queued": outbox.STATS.queued, "sent": outbox.STATS.sent, "dropped": outbox.STATS.dropped},
+        label="result", kind="counter",
+    )
+
+
+async def start_metrics(port: int):
+    """
+    Serve the metrics on the local port. Returns the server, or None if the
+    port can't be used: the games are served without metrics.
+
+    """
+    add_gauges()
+    try:
+        return await serve_metrics(METRICS, "127.0.0.1", port)
+    except OSError as exc:
+        logging.warning("The metrics are not served on port %d: %s", port, exc)
+        return None
 
+
+def parse_command(player, event, connection):
+    """
+    Returns the command of an event, or None if the event type is unknown.
+
+    Raises :exc:`ValueError` if the event is invalid.
+
+    """
+    try:
+        event_type = event["type"]
+        if event_type == "start_ack":
+            return Ready(player, connection, event["game_key"])
         if event_type == "bet":
-            if game.current_state != "bet":
-                await error(websocket, "Invalid event type. We are in state 'bet'")
-                continue
-            player_bet = event["bet"]
-            try:
-                # Play the move.
-                game.bet(player, player_bet)
-                next_player = game.next_player()
-                if next_player is None:
-                    game.finish_bet_tour()
-            except ValueError as exc:
-                # Send an "error" event if the move was illegal.
-                await error(websocket, str(exc))
-                continue
+            if not isinstance(event["bet"], int):
+                raise ValueError("The bet should be a number.")
+            return Bet(player, connection, event["bet"])
+        if event_type == "play":
+            return Play(player, connection, event["number"], event["suit"])
+        if event_type in ("game_info", "resync"):
+            return Info(player, connection, event_type)
+    except (KeyError, TypeError) as exc:
+        raise ValueError(f"Invalid event: {exc}")
+    return None
+
+
+async def receive(connection, actor, player):
+    """
+    Receive the messages of a player and send them to the actor of the game.
 
-            # Send a "bet" event to update the UI.
-            event = {
-                "type": "bet",
-                "player": player,
-                "bet": player_bet,
-                "game_info": game.to_json(),
-            }
-            broadcast(connected.values(), json.dumps(event))
-        elif event_type == "play":
-            if game.current_state != "play":
-                await error(websocket, "Invalid event type. We are in state 'play'")
+    """
+    try:
+        async for message in connection:
+            event, error_message = parse_event(message)
+            if error_message:
+                await error(connection, error_message, "invalid_json")
                 continue
-            card_number = event["number"]
-            card_suit = event["suit"]
             try:
-                # Play the move.
-                game.play(player, card_number, card_suit)
-                next_player = game.next_player()
-                round_ended = next_player is None
+                command = parse_command(player, event, connection)
             except ValueError as exc:
-                # Send an "error" event if the move was illegal.
-                await error(websocket, str(exc))
+                await error(connection, str(exc), "invalid_event")
                 continue
+            if command is not None:
+                actor.submit(command)
+    finally:
+        actor.submit(Leave(player, connection))
+
 
-            # Send a "play" event to update the UI.
-            event = {
-                "type": "play",
-                "player": player,
-                "card": Card(card_number, card_suit).to_json(),
-                "game_info": game.to_json(),
-                "round_ended": round_ended,
-            }
-            broadcast(connected.values(), json.dumps(event))
-
-            if next_player is None:
-                # Send a "round_ended" event to update the UI.
-                round_winner = game.end_round()
-                event = {
-                    "type": "round_ended",
-                    "round_winner": round_winner.name,
-                    "game_info": game.to_json(),
-                }
-                broadcast(connected.values(), json.dumps(event))
-            
-            if game.has_turn_finished():
-                # Send a "turn_ended" event to update the UI.
-                game.end_turn()
-                if game.has_game_ended():
-                    event = {
-                        "type": "game_ended",
-                        "game_info": game.to_json(),
-                    }
-                    broadcast(connected.values(), json.dumps(event))
-                else:
-                    await start_turn(game, connected)
-        elif event_type == "game_info":
-            event = {
-                "type": "game_info",
-                "player": game.players[player].to_json(),
-                "game_info": game.to_json(),
-            }
-            await websocket.send(json.dumps(event))
-
-
-async def start(websocket):
+async def start(websocket, with_bot: bool=False, deltas: bool=False):
     """
     Handle a connection from the first player: start a new game.
 
+    If with_bot is True, the second player is a bot and the game starts
+    without waiting for another connection. If deltas is True, the player
+    receives the changes of the game information instead of all of it.
+
     """
-    # Initialize a Connect Four game, the set of WebSocket connections
-    # receiving moves from this game, and secret access tokens.
-    
-    game = Game(max_cards=2)
-    game.add_player(PLAYER1)
-    connected = {PLAYER1: websocket}
+    # Initialize a game, the actor that runs it and secret access tokens.
     game_key = secrets.token_urlsafe(12)
-
-    join_key = secrets.token_urlsafe(12)
-    JOIN[join_key] = game, connected, game_key
-
-    watch_key = secrets.token_urlsafe(12)
-    WATCH[watch_key] = game, connected
-
+    # Each player receives the key of its seat, to take it again if the
+    # server is restarted. The seat of a bot has no key.
+    seat_keys = {PLAYER1: secrets.token_urlsafe(12)}
+    if not with_bot:
+        seat_keys[PLAYER2] = secrets.token_urlsafe(12)
+    actor = GameActor(
+        Game(max_cards=2), game_key, timeouts=create_timeouts(), event_log=EVENT_LOG, seat_keys=seat_keys
+    )
     try:
-        # Send the secret access tokens to the browser of the first player,
-        # where they'll be used for building "join" and "watch" links.
-        event = {
-            "type": "init",
-            "join": join_key,
-            "watch": watch_key,
-        }
-        await websocket.send(json.dumps(event))
-        # Receive and process moves from the first player.
-        await waiting_players(websocket, game, game_key, connected, True)
+        join_key, watch_key = register(actor, bot_players=(PLAYER2,) if with_bot else ())
+    except ValueError as exc:
+        await error(websocket, str(exc), "too_many_games")
+        return
+    await actor.join(PLAYER1, websocket, deltas)
 
-        await play(websocket, game, PLAYER1, connected)
-    finally:
-        del JOIN[join_key]
-        del WATCH[watch_key]
+    # Send the secret access tokens to the browser of the first player,
+    # where they'll be used for building "join" and "watch" links.
+    event = {
+        "type": "init",
+        "join": join_key,
+        "watch": watch_key,
+        "deltas": deltas,
+        "seat_key": seat_keys[PLAYER1],
+    }
+    await websocket.send(json.dumps(event))
+    if with_bot:
+        # The bot fills the empty seat, so the game can start.
+        bot = MonteCarloBot(time_limit=BOT_TIME_LIMIT, equity_table=EQUITY_TABLE)
+        await actor.join(PLAYER2, None, bot=bot)
+    # Receive and process the messages of the first player.
+    await receive(websocket, actor, PLAYER1)
 
 
-async def join(websocket, join_key):
+async def join(websocket, join_key, deltas: bool=False, player: str=PLAYER2, seat_key: str=None):
     """
     Handle a connection from the second player: join an existing game.
 
+    When the game was rebuilt from the event log, its players join it again
+    with their player and the key of their seat.
+
     """
-    # Find the Connect Four game.
+    if player not in (PLAYER1, PLAYER2):
+        await error(websocket, "Invalid player.", "invalid_player")
+        return
+    # Find the game.
     try:
-        game, connected, game_key = JOIN[join_key]
+        actor = REGISTRY.join[join_key]
     except KeyError:
-        await error(websocket, "Game not found.")
+        await error(websocket, "Game not found.", "game_not_found")
         return
 
     # Register to receive moves from this game.
-    connected[PLAYER2] = websocket
-    game.add_player(PLAYER2)
-    try:
-        if len(connected) == 2:
-            event = {
-                "type": "start",
-                "game_key": game_key,
-            }
-            broadcast(connected.values(), json.dumps(event))
-        # Send the first move, in case the first player already played it.
-        # await replay(websocket, game)
-        # Receive and process moves from the first player.
-        await waiting_players(websocket, game, game_key, connected)
-
-        # Receive and process moves from the second player.
-        await play(websocket, game, PLAYER2, connected)
-    finally:
-        del connected[PLAYER2]
-        # TODO: remove it from the game
+    if not await actor.join(player, websocket, deltas, seat_key=seat_key):
+        return
+    if seat_key is None and player in actor.seat_keys:
+        # Send the key of the seat to the second player.
+        event = {
+            "type": "seat",
+            "player": player,
+            "seat_key": actor.seat_keys[player],
+        }
+        await websocket.send(json.dumps(event))
+    # Receive and process the messages of the second player.
+    await receive(websocket, actor, player)
 
 
 # async def watch(websocket, watch_key):
@@ -263,7 +342,7 @@ async def join(websocket, join_key):
 #     """
 #     # Find the Connect Four game.
 #     try:
-#         game, connected = WATCH[watch_key]
+#         game, connected = REGISTRY.watch[watch_key]
 #     except KeyError:
 #         await error(websocket, "Game not found.")
 #         return
@@ -289,21 +368,80 @@ async def handler(websocket):
     event = json.loads(message)
     assert event["type"] == "init"
 
-    if "join" in event:
-        # Second player joins an existing game.
-        await join(websocket, event["join"])
-    # elif "watch" in event:
-    #     # Spectator watches an existing game.
-    #     await watch(websocket, event["watch"])
+    if "join" in event and SHARD is not None:
+        shard = get_shard(event["join"])
+        if shard is not None and shard != SHARD:
+            # The game is owned by another worker.
+            try:
+                await forward(websocket, message, f"ws://127.0.0.1:{SHARD_PORT + shard}/")
+            except (OSError, InvalidHandshake) as exc:
+                # The worker is down, its games are gone until it restores them.
+                logging.warning("The connection is not forwarded to worker %d: %s", shard, exc)
+                await error(websocket, "Game not found.", "game_not_found")
+            return
+
+    # The messages to the client are queued and sent by their own task.
+    connection = Connection(websocket, OUTBOX_SIZE, SLOW_CONSUMER_POLICY)
+    try:
+        if "join" in event:
+            # Second player joins an existing game.
+            await join(
+                connection, event["join"], event.get("deltas", False), event.get("player", PLAYER2),
+                event.get("seat_key"),
+            )
+        # elif "watch" in event:
+        #     # Spectator watches an existing game.
+        #     await watch(connection, event["watch"])
+        else:
+            # First player starts a new game, against a bot if requested.
+            await start(connection, event.get("bot", False), event.get("deltas", False))
+    finally:
+        await connection.close()
+
+
+async def main(shard: int = None):
+    """
+    Run the server. In the worker process of a shard, the public port is
+    shared with the other workers and the event log is the one of the shard.
+
+    """
+    global EVENT_LOG, SHARD
+    SHARD = shard
+    event_log_path = EVENT_LOG_PATH
+    if shard is not None:
+        REGISTRY.key_prefix = get_key_prefix(shard)
+        event_log_path = event_log_path and f"{event_log_path}.{shard}"
+    if event_log_path:
+        EVENT_LOG, games = EventLog.recover(event_log_path, EVENT_LOG_INTERVAL)
+        restore_games(games)
+        event_log = asyncio.create_task(EVENT_LOG.run())
+        snapshots = asyncio.create_task(EVENT_LOG.run_snapshots(LOGGED_GAMES, SNAPSHOT_INTERVAL))
+    reaper = asyncio.create_task(REGISTRY.run_reaper())
+    timers = asyncio.create_task(TIMERS.run())
+    metrics_server = await start_metrics(METRICS_PORT + (shard or 0)) if METRICS_PORT else None
+    if shard is None:
+        async with serve(handler, "", PORT) as server:
+            await server.serve_forever()
     else:
-        # First player starts a new game.
-        await start(websocket)
+        async with serve(handler, "", PORT, reuse_port=True) as server, \
+                serve(handler, "127.0.0.1", SHARD_PORT + shard):
+            await server.serve_forever()
+    reaper.cancel()
+    timers.cancel()
+    if metrics_server is not None:
+        metrics_server.close()
+    if EVENT_LOG is not None:
+        event_log.cancel()
+        snapshots.cancel()
+        EVENT_LOG.close()
 
 
-async def main():
-    async with serve(handler, "", 8001) as server:
-        await server.serve_forever()
+def run_worker(shard: int):
+    asyncio.run(main(shard))
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if WORKERS > 1:
+        run_supervisor(WORKERS, run_worker)
+    else:
+        asyncio.run(main())
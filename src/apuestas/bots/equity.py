@@ -0,0 +1,199 @@
+"""Precomputed bets equity tables.
+
+The best bet of a player depends on its hand, the suit of the muestra, its position in the bet order, the amount of
+players and the amount of cards. The tables store, for each of them, how many rounds the player won in simulated
+turns: the expected wins and the probability of winning each amount of rounds (and so of getting each bet right).
+
+To keep the tables small, the hands are reduced to a pattern: for each suit, how many high (1, 3, 12), medium
+(11, 10, 9, 8) and low (7, 6, 5, 4, 2) cards the player has. The muestra suit goes first and the other suits are
+sorted, as they are equivalent.
+
+The table is a binary file with fixed size records sorted by key, so it is memory mapped and searched without
+loading it. Generate it (it needs NumPy) with::
+
+    python -m apuestas.bots.equity bet_equity.bin --games 200000
+"""
+import argparse
+import mmap
+import struct
+from dataclasses import dataclass
+
+from apuestas.models.card import CARD_ID_RANK, CARD_ID_SUIT, CARD_SUITS, Card
+
+
+MAGIC = b"APEQ"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHI4x")
+_RECORD = struct.Struct("<QIf8H")
+_KEY = struct.Struct("<Q")
+MAX_WINS = 7
+PROBABILITY_SCALE = 65535
+
+# high, medium and low cards, by rank
+CARD_ID_CLASS = [0 if rank >= 10 else 1 if rank >= 6 else 2 for rank in CARD_ID_RANK]
+
+
+def _get_suit_code(high: int, medium: int, low: int) -> int:
+    return (high << 6) | (medium << 3) | low
+
+
+def get_hand_pattern(cards, muestra_suit_index: int) -> int:
+    """Returns the pattern of the hand: the amount of high, medium and low cards of the muestra suit and of the
+    other suits (sorted), packed in an integer"""
+    counts = [[0, 0, 0] for _ in CARD_SUITS]
+    for card in cards:
+        relative_suit = (card.suit_index - muestra_suit_index) % len(CARD_SUITS)
+        counts[relative_suit][CARD_ID_CLASS[card.id]] += 1
+    codes = [_get_suit_code(*suit_counts) for suit_counts in counts]
+    other_codes = sorted(codes[1:])
+    return (codes[0] << 27) | (other_codes[0] << 18) | (other_codes[1] << 9) | other_codes[2]
+
+
+def get_key(players: int, amount_cards: int, position: int, pattern: int) -> int:
+    """Returns the key of the table. position is the order of the player in the bets (0 for the first one)"""
+    return (((players << 3 | amount_cards) << 3 | position) << 36) | pattern
+
+
+@dataclass
+class EquityEntry:
+    samples: int
+    expected_wins: float
+    probabilities: list[float]  # probability of winning each amount of rounds, from 0 to the amount of cards
+
+    def expected_points(self, bet: int) -> float:
+        return sum(
+            probability * (10 + wins * 5 if wins == bet else wins)
+            for wins, probability in enumerate(self.probabilities)
+        )
+
+    def best_bet(self, legal_bets) -> int:
+        return max(legal_bets, key=self.expected_points)
+
+
+class EquityTable:
+    """Reads a table file. The file is opened and mapped in memory on the first lookup"""
+
+    def __init__(self, path):
+        self.path = path
+        self._mmap = None
+        self._count = 0
+
+    def _open(self):
+        with open(self.path, "rb") as table_file:
+            table_mmap = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, count = _HEADER.unpack_from(table_mmap)
+        if magic != MAGIC or version != VERSION or record_size != _RECORD.size:
+            table_mmap.close()
+            raise ValueError(f"Invalid bets equity table: {self.path}")
+        self._mmap = table_mmap
+        self._count = count
+
+    def __len__(self):
+        if self._mmap is None:
+            self._open()
+        return self._count
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def get(self, players: int, amount_cards: int, position: int, cards, muestra: Card) -> EquityEntry:
+        """Returns the entry of the hand, or None if it is not in the table"""
+        if self._mmap is None:
+            self._open()
+        key = get_key(players, amount_cards, position, get_hand_pattern(cards, muestra.suit_index))
+        # binary search of the key in the sorted records
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if _KEY.unpack_from(self._mmap, _HEADER.size + middle * _RECORD.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._count:
+            return None
+        record_key, samples, expected_wins, *probabilities = _RECORD.unpack_from(
+            self._mmap, _HEADER.size + low * _RECORD.size
+        )
+        if record_key != key:
+            return None
+        return EquityEntry(
+            samples, expected_wins, [probability / PROBABILITY_SCALE for probability in probabilities[:amount_cards + 1]]
+        )
+
+
+def write_table(path, entries):
+    """Writes the entries, tuples of (key, samples, wins_count) where wins_count has the amount of times the player
+    won each amount of rounds"""
+    entries = sorted(entries)
+    with open(path, "wb") as table_file:
+        table_file.write(_HEADER.pack(MAGIC, VERSION, _RECORD.size, len(entries)))
+        for key, samples, wins_count in entries:
+            expected_wins = sum(wins * count for wins, count in enumerate(wins_count)) / samples
+            probabilities = [round(PROBABILITY_SCALE * count / samples) for count in wins_count]
+            probabilities += [0] * (MAX_WINS + 1 - len(probabilities))
+            table_file.write(_RECORD.pack(key, samples, expected_wins, *probabilities))
+
+
+def generate_entries(players_range=range(2, 9), max_cards: int = MAX_WINS, games: int = 100_000,
+                     min_samples: int = 20, seed: int = 0) -> list:
+    """Simulates ``games`` turns for each amount of players and cards with the batch simulator and returns the
+    entries of the patterns seen at least ``min_samples`` times"""
+    import numpy as np
+
+    from apuestas.simulation.batch import BatchSimulator
+
+    card_suit = np.array(CARD_ID_SUIT)
+    card_class = np.array(CARD_ID_CLASS)
+    entries = []
+    for players in players_range:
+        for amount_cards in range(1, max_cards + 1):
+            if players * amount_cards + 1 > len(CARD_ID_SUIT):
+                break
+            simulator = BatchSimulator(games, players, amount_cards, seed=seed)
+            record = simulator.play_turn(amount_cards, first_player=0)
+            muestra_suit = card_suit[record.decks[:, players * amount_cards]]
+            for position in range(players):
+                # the first player is 0, so the position is the player index
+                cards = record.decks[:, position:players * amount_cards:players]
+                relative_suits = (card_suit[cards] - muestra_suit[:, None]) % len(CARD_SUITS)
+                groups = relative_suits * 3 + card_class[cards]
+                counts = (groups[:, :, None] == np.arange(3 * len(CARD_SUITS))).sum(axis=1)
+                codes = (counts[:, 0::3] << 6) | (counts[:, 1::3] << 3) | counts[:, 2::3]
+                other_codes = np.sort(codes[:, 1:], axis=1)
+                patterns = (codes[:, 0] << 27) | (other_codes[:, 0] << 18) | (other_codes[:, 1] << 9) | other_codes[:, 2]
+                wins = (record.winners == position).sum(axis=1)
+
+                keys, inverse = np.unique(patterns, return_inverse=True)
+                wins_count = np.bincount(
+                    inverse.ravel() * (amount_cards + 1) + wins, minlength=len(keys) * (amount_cards + 1)
+                ).reshape(len(keys), amount_cards + 1)
+                samples = wins_count.sum(axis=1)
+                for pattern, pattern_samples, pattern_wins in zip(keys, samples, wins_count):
+                    if pattern_samples >= min_samples:
+                        key = get_key(players, amount_cards, position, int(pattern))
+                        entries.append((key, int(pattern_samples), [int(count) for count in pattern_wins]))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates the bets equity table.")
+    parser.add_argument("output")
+    parser.add_argument("--games", type=int, default=100_000, help="simulated turns per amount of players and cards")
+    parser.add_argument("--min-players", type=int, default=2)
+    parser.add_argument("--max-players", type=int, default=8)
+    parser.add_argument("--max-cards", type=int, default=MAX_WINS)
+    parser.add_argument("--min-samples", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    entries = generate_entries(
+        range(args.min_players, args.max_players + 1), args.max_cards, args.games, args.min_samples, args.seed
+    )
+    write_table(args.output, entries)
+    print(f"{len(entries)} entries written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
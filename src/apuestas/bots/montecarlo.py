@@ -0,0 +1,194 @@
+"""A computer player that chooses its moves with Monte Carlo rollouts.
+
+The bot does not know the cards of the other players. It samples "worlds": hands for the other players that are
+consistent with its own hand, the muestra and the cards already played. Then it plays the rest of the turn in
+each world with random moves on a copy of the :class:`Game`, and it chooses the move that got more points.
+
+The search is time bounded: it stops sampling worlds once the ``time_limit`` (in seconds) of the decision has
+passed. The sampled worlds are kept during the turn, so the ones sampled while betting are reused to play.
+
+In the last rounds of the turn (``solver_cards`` cards or less in the hand), the cards are evaluated in each world
+with the exact solver instead of random rollouts. If a search visits more than ``solver_nodes`` positions, the turn
+is too large to solve in time and the cards are evaluated with rollouts in all the worlds. The searches also stop at
+the deadline of the decision: the card is chosen with the worlds solved until then (or with rollouts in the current
+world if none was). If a bets equity table is given, the bets are taken from it when the hand was sampled enough
+times.
+"""
+import random
+import time
+
+from apuestas.models.card import CARDS, Card, Hand
+from apuestas.models.game import Game
+from apuestas.models.player import Player
+from apuestas.bots.equity import EquityTable
+from apuestas.bots.solver import SearchLimitExceeded, get_points_utility, solve
+from apuestas.simulation.policies import Policy, get_legal_bets, get_legal_cards
+
+
+def copy_game(game: Game, hands: dict[str, int]) -> Game:
+    """Returns a copy of the game state where the players have the given hands (masks of card ids)"""
+    new_game = game.clone()
+    for player_name, player in new_game.players.items():
+        player.current_hand = Hand.from_mask(hands[player_name])
+    return new_game
+
+
+def play_card(game: Game, player: Player, card: Card):
+    """Plays the card and moves to the next player, finishing the round if it was the last one"""
+    game.play(player.name, card.number, card.suit)
+    if game.next_player() is None:
+        game.end_round()
+
+
+class MonteCarloBot(Policy):
+    def __init__(self, time_limit: float = 0.05, max_worlds: int = 2000, solver_cards: int = 3,
+                 equity_table: EquityTable = None, equity_min_samples: int = 100, seed=None,
+                 solver_nodes: int = 20000):
+        self.time_limit = time_limit
+        self.max_worlds = max_worlds
+        self.solver_cards = solver_cards
+        # positions of each search of the solver, about 0.15 s
+        self.solver_nodes = solver_nodes
+        self.equity_table = equity_table
+        self.equity_min_samples = equity_min_samples
+        self.random = random.Random(seed)
+        # worlds sampled in the current turn: the starting hand of each one of the other players
+        self._worlds: list[dict[str, int]] = []
+        self._worlds_turn = None
+
+    def bet(self, game, player):
+        if self.equity_table is not None:
+            players = len(game.current_player_order)
+            position = (game.current_player_order.index(player.name) - game.first_round_player_index) % players
+            entry = self.equity_table.get(
+                players, game.current_amount_cards, position, player.current_hand, game.current_muestra
+            )
+            if entry is not None and entry.samples >= self.equity_min_samples:
+                return entry.best_bet(get_legal_bets(game))
+
+        deadline = time.perf_counter() + self.time_limit
+        wins_count = [0] * (game.current_amount_cards + 1)
+        for world in self._get_worlds(game, player, deadline):
+            rollout_game = copy_game(game, self._get_hands(game, player, world))
+            rollout_game.finish_bet_tour()
+            self._rollout(rollout_game)
+            wins_count[rollout_game.players[player.name].current_winning_cards] += 1
+
+        def expected_points(bet):
+            # if the bet is right the player gets 10 + wins * 5 points, otherwise the amount of wins
+            return sum(count * (10 + wins * 5 if wins == bet else wins) for wins, count in enumerate(wins_count))
+
+        return max(get_legal_bets(game), key=expected_points)
+
+    def play(self, game, player):
+        legal_cards = get_legal_cards(game, player)
+        if len(legal_cards) == 1:
+            return legal_cards[0]
+        deadline = time.perf_counter() + self.time_limit
+        use_solver = len(player.current_hand) <= self.solver_cards
+        utility = get_points_utility(player.current_bet)
+        points = [0] * len(legal_cards)
+        solved_worlds = 0
+        for world in self._get_worlds(game, player, deadline):
+            hands = self._get_hands(game, player, world)
+            games = []
+            for card in legal_cards:
+                rollout_game = copy_game(game, hands)
+                play_card(rollout_game, rollout_game.players[player.name], card)
+                games.append(rollout_game)
+            if use_solver:
+                try:
+                    values = [
+                        solve(rollout_game, player.name, utility, self.solver_nodes, deadline) for rollout_game in games
+                    ]
+                    solved_worlds += 1
+                except SearchLimitExceeded:
+                    if solved_worlds and time.perf_counter() > deadline:
+                        # out of time, the card is chosen with the worlds solved so far
+                        break
+                    # the points of the solver and the rollouts are not mixed, the worlds solved are discarded
+                    use_solver = False
+                    points = [0] * len(legal_cards)
+            if not use_solver:
+                values = []
+                for rollout_game in games:
+                    self._rollout(rollout_game)
+                    values.append(rollout_game.players[player.name].calculate_round_points())
+            for index, value in enumerate(values):
+                points[index] += value
+        return legal_cards[points.index(max(points))]
+
+    def _rollout(self, game: Game):
+        """Plays random cards until the end of the turn"""
+        while not game.has_turn_finished():
+            player = game.current_player
+            play_card(game, player, self.random.choice(get_legal_cards(game, player)))
+
+    @staticmethod
+    def _get_played_masks(game: Game) -> dict[str, int]:
+        played_masks = dict.fromkeys(game.players, 0)
+        for player_name, card in game.played_cards:
+            played_masks[player_name] |= card.bit
+        return played_masks
+
+    def _get_worlds(self, game: Game, player: Player, deadline: float):
+        """Yields the worlds consistent with the game, first the ones sampled before in this turn and then new ones,
+        until the deadline. It yields at least one world"""
+        played_masks = self._get_played_masks(game)
+        starting_hand = player.current_hand.mask | played_masks[player.name]
+        turn = (game.current_muestra, game.current_amount_cards, player.name, starting_hand)
+        if turn != self._worlds_turn:
+            self._worlds_turn = turn
+            self._worlds = []
+
+        # the world is consistent if the other players had the cards they have already played
+        self._worlds = [
+            world for world in self._worlds
+            if all(played_masks[name] & ~hand == 0 for name, hand in world.items())
+        ]
+        yielded = 0
+        for world in list(self._worlds):
+            yielded += 1
+            yield world
+            if time.perf_counter() > deadline:
+                return
+
+        known_cards = starting_hand | game.current_muestra.bit
+        for played_mask in played_masks.values():
+            known_cards |= played_mask
+        unknown_cards = [card.bit for card in CARDS if card.bit & known_cards == 0]
+        while yielded == 0 or time.perf_counter() <= deadline:
+            world = self._sample_world(game, player, played_masks, unknown_cards)
+            if len(self._worlds) < self.max_worlds:
+                self._worlds.append(world)
+            yielded += 1
+            yield world
+
+    def _sample_world(self, game, player, played_masks, unknown_cards) -> dict[str, int]:
+        self.random.shuffle(unknown_cards)
+        world = {}
+        position = 0
+        for other_player in game.players.values():
+            if other_player.name == player.name:
+                continue
+            # the current card is still in the hand of the player until the end of the round
+            unplayed_cards = len(other_player.current_hand) - (other_player.current_card is not None)
+            hand = played_masks[other_player.name]
+            for card_bit in unknown_cards[position:position + unplayed_cards]:
+                hand |= card_bit
+            position += unplayed_cards
+            world[other_player.name] = hand
+        return world
+
+    def _get_hands(self, game: Game, player: Player, world: dict[str, int]) -> dict[str, int]:
+        """Returns the current hands of all the players in the world"""
+        hands = {player.name: player.current_hand.mask}
+        for player_name, starting_hand in world.items():
+            other_player = game.players[player_name]
+            # remove the cards played in the previous rounds
+            played_mask = 0
+            for name, card in game.played_cards:
+                if name == player_name and card is not other_player.current_card:
+                    played_mask |= card.bit
+            hands[player_name] = starting_hand & ~played_mask
+        return hands
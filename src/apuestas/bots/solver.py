@@ -0,0 +1,311 @@
+"""Exact solver of the cards play when the hands of all the players are known.
+
+It is a "paranoid" alpha-beta search: the player we solve for maximizes its result and all the other players play
+together against it. The result is the amount of rounds the player can win whatever the others do, or the value
+of a ``utility(total_wins)`` function (for example the points it gets for its bet).
+
+The positions between two rounds are stored in a transposition table. Only the order of the cards left inside each
+suit matters there, and the suits other than the muestra one are interchangeable, so the key is the players that hold
+the cards of each suit from the weakest to the strongest one (the other suits sorted) and the player to move. The
+moves are ordered with the cards strength table and the cards that are equivalent (the same suit and no other card
+left between them) are only searched once. The result is found with null window searches (is it greater than each
+of its possible values?), which prune much more than a search with the full window.
+
+The size of the search grows very fast with the cards and the players. The supported range is up to
+``SUPPORTED_CARDS_IN_PLAY`` cards in play (6 players with 3 cards, 4 with 4, 3 with 6 or 2 with 9): any turn of them is
+solved within ``SUPPORTED_NODES`` positions, in milliseconds (``tests/bots/test_solver.py`` enforces it). Bigger turns
+are usually solved in milliseconds too, but some deals take seconds (6 players with 7 cards can take more than 10), so
+the search can be limited to ``max_nodes`` positions or to a ``deadline`` (of ``time.perf_counter``): above them it
+raises :class:`SearchLimitExceeded`, and the caller evaluates the turn in another way (see
+:class:`~apuestas.bots.montecarlo.MonteCarloBot`).
+"""
+import time
+
+from apuestas.models.card import CARD_ID_RANK, CARD_ID_SUIT, CARDS, DECK_SIZE, SUIT_MASKS, TRICK_STRENGTH, Card
+from apuestas.models.game import Game
+
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# any turn with up to these cards in play is solved within these positions
+SUPPORTED_CARDS_IN_PLAY = 18
+SUPPORTED_NODES = 10000
+# the clock is read once every these positions, it is checked about every millisecond
+DEADLINE_CHECK_NODES = 128
+
+# the cards of each suit, from the weakest to the strongest one
+_SUIT_CARDS = [
+    sorted((card_id for card_id in range(DECK_SIZE) if (1 << card_id) & suit_mask), key=CARD_ID_RANK.__getitem__)
+    for suit_mask in SUIT_MASKS
+]
+# the next card of the same suit with a greater rank, or None for the strongest one
+_NEXT_STRONGER_CARD = [None] * DECK_SIZE
+for _suit_cards in _SUIT_CARDS:
+    for _weaker, _stronger in zip(_suit_cards, _suit_cards[1:]):
+        _NEXT_STRONGER_CARD[_weaker] = _stronger
+
+
+class SearchLimitExceeded(Exception):
+    """The search visited more positions than the limit of the solver, or its deadline has passed"""
+
+
+class Solver:
+    """
+    Solves the current turn of the game (it should be in the "play" state)
+    for the given player. With max_nodes or deadline, the search raises
+    SearchLimitExceeded when it visits more positions than that or the
+    deadline has passed, and the solver can't be used anymore.
+
+    """
+
+    def __init__(self, game: Game, player_name: str, utility=None, max_nodes: int = None, deadline: float = None):
+        order = game.current_player_order
+        self.players = len(order)
+        self.target = order.index(player_name)
+        self.muestra_suit = game.current_muestra.suit_index
+        self.hands = []
+        for name in order:
+            player = game.players[name]
+            hand = player.current_hand.mask
+            if player.current_card is not None:
+                # the card is on the table, it is not in the hand anymore
+                hand &= ~player.current_card.bit
+            self.hands.append(hand)
+        # the player of each card (the cards don't change of hands)
+        self.owners = [0] * DECK_SIZE
+        for seat, name in enumerate(order):
+            for card in game.players[name].current_hand:
+                self.owners[card.id] = seat
+        # cards of the current round, in the order they were played
+        self.trick = []
+        seat = game.first_round_player_index
+        while seat != game.current_player_index:
+            self.trick.append(game.players[order[seat]].current_card.id)
+            seat = (seat + 1) % self.players
+        self.to_move = game.current_player_index
+        # cards in the hands or in the current round, and the amount of them
+        self.in_play = 0
+        for hand in self.hands:
+            self.in_play |= hand
+        for card_id in self.trick:
+            self.in_play |= 1 << card_id
+        self.cards_in_play = self.in_play.bit_count()
+        self.utility = utility
+        self.wins = game.players[player_name].current_winning_cards
+        self.table = {}
+        self.utility_ranges = {}
+        self.nodes = 0
+        self.max_nodes = max_nodes
+        self.deadline = deadline
+
+    def solve(self) -> int:
+        """Returns the amount of rounds won by the player in the turn (or the utility of them) with perfect play"""
+        remaining_rounds = self.cards_in_play // self.players
+        if self.utility is None:
+            values = list(range(remaining_rounds + 1))
+        else:
+            values = sorted({self.utility(self.wins + rounds) for rounds in range(remaining_rounds + 1)})
+        # each search tells if the result is greater than a possible value, and a greater result is a lower bound
+        index = 0
+        while index + 1 < len(values):
+            value = self._search(values[index], values[index + 1])
+            if value <= values[index]:
+                break
+            index = values.index(value)
+        return self._value(values[index])
+
+    def best_card(self) -> tuple[Card, int]:
+        """Returns the best card for the player to move and its value. It must be the turn of the solved player"""
+        if self.to_move != self.target:
+            raise ValueError("It isn't the turn of the player.")
+        best = None
+        best_value = float("-inf")
+        for card_id in self._get_moves():
+            value = self._play(card_id, best_value, float("inf"))
+            if best is None or value > best_value:
+                best, best_value = card_id, value
+        return CARDS[best], self._value(best_value)
+
+    def _value(self, search_value):
+        if self.utility is None:
+            # the search only counts the rounds won from now on
+            return self.wins + search_value
+        return search_value
+
+    def _get_moves(self) -> list[int]:
+        hand = self.hands[self.to_move]
+        if self.trick:
+            current_suit = CARD_ID_SUIT[self.trick[0]]
+            same_suit = hand & SUIT_MASKS[current_suit]
+            if same_suit:
+                hand = same_suit
+        in_play = self.in_play
+        moves = []
+        cards = hand
+        while cards:
+            bit = cards & -cards
+            cards ^= bit
+            card_id = bit.bit_length() - 1
+            # if the next stronger card still in play is also in the hand, both cards are equivalent
+            stronger = _NEXT_STRONGER_CARD[card_id]
+            while stronger is not None and not (in_play >> stronger) & 1:
+                stronger = _NEXT_STRONGER_CARD[stronger]
+            if stronger is not None and (hand >> stronger) & 1:
+                continue
+            moves.append(card_id)
+
+        if self.trick:
+            strength = TRICK_STRENGTH[self.muestra_suit][CARD_ID_SUIT[self.trick[0]]]
+            strengths = [strength[card_id] for card_id in self.trick]
+            position = strengths.index(max(strengths))
+            winning_seat = (self.to_move - len(self.trick) + position) % self.players
+            if (winning_seat == self.target) == (self.to_move == self.target):
+                # our side is already winning the round, we try the weakest cards first
+                moves.sort(key=strength.__getitem__)
+            else:
+                moves.sort(key=strength.__getitem__, reverse=True)
+        else:
+            strengths = TRICK_STRENGTH[self.muestra_suit]
+            moves.sort(key=lambda card_id: strengths[CARD_ID_SUIT[card_id]][card_id], reverse=True)
+        return moves
+
+    def _get_utility_range(self, remaining_rounds):
+        """Returns the lowest and the greatest utility of the rounds the player can still win"""
+        range_key = (self.wins, remaining_rounds)
+        utility_range = self.utility_ranges.get(range_key)
+        if utility_range is None:
+            values = [self.utility(self.wins + rounds) for rounds in range(remaining_rounds + 1)]
+            utility_range = self.utility_ranges[range_key] = min(values), max(values)
+        return utility_range
+
+    def _get_key(self):
+        """Returns the key of the position between two rounds in the transposition table"""
+        in_play = self.in_play
+        owners = self.owners
+        suits = [bytes(owners[card_id] for card_id in suit_cards if (in_play >> card_id) & 1) for suit_cards in _SUIT_CARDS]
+        muestra = suits.pop(self.muestra_suit)
+        suits.sort()
+        return muestra, *suits, self.to_move
+
+    def _search(self, alpha, beta):
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchLimitExceeded(f"The search visited more than {self.max_nodes} positions.")
+        if self.deadline is not None and self.nodes % DEADLINE_CHECK_NODES == 0 and time.perf_counter() > self.deadline:
+            raise SearchLimitExceeded("The deadline of the search has passed.")
+        hands = self.hands
+        if not self.trick and hands[self.to_move] == 0:
+            # all the hands are empty
+            return self.utility(self.wins) if self.utility is not None else 0
+
+        # the result is between the lowest and the greatest one of the rounds left
+        remaining_rounds = self.cards_in_play // self.players
+        if self.utility is None:
+            lowest, greatest = 0, remaining_rounds
+        else:
+            lowest, greatest = self._get_utility_range(remaining_rounds)
+        if alpha >= greatest:
+            return greatest
+        if beta <= lowest:
+            return lowest
+
+        # the positions inside a round are not stored, they are rarely reached again
+        key = None
+        if not self.trick:
+            key = self._get_key()
+            if self.utility is not None:
+                key = (key, self.wins)
+            entry = self.table.get(key)
+            if entry is not None:
+                value, flag = entry
+                if flag == EXACT:
+                    return value
+                if flag == LOWER and value >= beta:
+                    return value
+                if flag == UPPER and value <= alpha:
+                    return value
+
+        original_alpha, original_beta = alpha, beta
+        maximizing = self.to_move == self.target
+        best = float("-inf") if maximizing else float("inf")
+        for card_id in self._get_moves():
+            value = self._play(card_id, alpha, beta)
+            if maximizing:
+                if value > best:
+                    best = value
+                    alpha = max(alpha, best)
+            else:
+                if value < best:
+                    best = value
+                    beta = min(beta, best)
+            if alpha >= beta:
+                break
+
+        if key is not None:
+            if best <= original_alpha:
+                self.table[key] = (best, UPPER)
+            elif best >= original_beta:
+                self.table[key] = (best, LOWER)
+            else:
+                self.table[key] = (best, EXACT)
+        return best
+
+    def _play(self, card_id, alpha, beta):
+        """Plays the card of the player to move, searches the position and takes the card back"""
+        seat = self.to_move
+        bit = 1 << card_id
+        self.hands[seat] ^= bit
+        trick = self.trick
+        trick.append(card_id)
+        if len(trick) == self.players:
+            strength = TRICK_STRENGTH[self.muestra_suit][CARD_ID_SUIT[trick[0]]]
+            strengths = [strength[trick_card_id] for trick_card_id in trick]
+            # the last card was played by seat, so the round was started by the next one
+            winner = (seat + 1 + strengths.index(max(strengths))) % self.players
+            self.trick = []
+            self.to_move = winner
+            trick_mask = 0
+            for trick_card_id in trick:
+                trick_mask |= 1 << trick_card_id
+            self.in_play ^= trick_mask
+            self.cards_in_play -= self.players
+            won = 1 if winner == self.target else 0
+            if self.utility is None:
+                value = won + self._search(alpha - won, beta - won)
+            else:
+                self.wins += won
+                value = self._search(alpha, beta)
+                self.wins -= won
+            self.trick = trick
+            self.in_play |= trick_mask
+            self.cards_in_play += self.players
+        else:
+            self.to_move = (seat + 1) % self.players
+            value = self._search(alpha, beta)
+        trick.pop()
+        self.hands[seat] |= bit
+        self.to_move = seat
+        return value
+
+
+def solve(game: Game, player_name: str, utility=None, max_nodes: int = None, deadline: float = None) -> int:
+    """
+    Returns the rounds the player wins in the turn with perfect play against
+    all the other players. Raises SearchLimitExceeded if the search visits
+    more than max_nodes positions or the deadline (of time.perf_counter)
+    passes.
+
+    """
+    return Solver(game, player_name, utility, max_nodes, deadline).solve()
+
+
+def solve_all(game: Game) -> dict[str, int]:
+    """Returns the rounds each player can win in the turn with perfect play against all the other players"""
+    return {player_name: solve(game, player_name) for player_name in game.current_player_order}
+
+
+def get_points_utility(bet: int):
+    """Returns the utility that gives the points of the player with that bet"""
+    def utility(wins):
+        return 10 + wins * 5 if wins == bet else wins
+    return utility
@@ -0,0 +1,120 @@
+import json
+
+from apuestas.delta import DeltaStream
+from apuestas.metrics import METRICS
+from apuestas.models.card import Hand
+
+
+def encode_event(event, **encoded_values) -> str:
+    """Encode the event, adding the values that are already encoded"""
+    text = json.dumps(event)
+    if not encoded_values:
+        return text
+    return text[:-1] + "".join(f', "{key}": {value}' for key, value in encoded_values.items()) + "}"
+
+
+def get_player_to_move(game):
+    """Returns the name of the player that has to move, or None if the game is not waiting for a move"""
+    if game.current_muestra is None or game.has_game_ended() or game.has_turn_finished():
+        return None
+    player = game.current_player
+    if player.current_card is not None:
+        # the last card of the round was played, the round has not been finished yet
+        return None
+    return player.name
+
+
+def encode_legal_moves(game) -> str:
+    """Encode the legal moves of the current player: {"bets": [...]} or {"cards": [...]}"""
+    if game.current_state == "bet":
+        mask = game.legal_bets()
+        return json.dumps({"bets": [bet for bet in range(game.current_amount_cards + 1) if mask >> bet & 1]})
+    return json.dumps({"cards": Hand.from_mask(game.legal_cards(game.current_player)).to_json()})
+
+
+class Connections(dict):
+    """
+    The connections (see :class:`apuestas.outbox.Connection`) of the players
+    of a game, by player name.
+
+    The players that negotiated deltas receive the changes of "game_info"
+    since the previous event ("game_delta") and its sequence number ("seq")
+    instead of the full information. The first time, or after a resync, they
+    receive the full "game_info" with its sequence number (``full``).
+
+    The information of the game and the players is encoded once for each
+    version (see :meth:`Game.to_json_text`), whatever the amount of players.
+    The events of the player that has to move also have its legal moves
+    ("legal"), so it doesn't need to try them.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delta_players = set()
+        self.synced_players = set()
+        self.stream = DeltaStream()
+
+    def __delitem__(self, player_name):
+        super().__delitem__(player_name)
+        self.delta_players.discard(player_name)
+        self.synced_players.discard(player_name)
+
+    def enable_deltas(self, player_name):
+        self.delta_players.add(player_name)
+
+    def publish(self, game):
+        """Registers the current version of the game information, if any player uses deltas"""
+        if self.delta_players:
+            game_info = game.to_json()
+            if game_info is not self.stream.game_info:
+                self.stream.publish(game_info)
+
+    def encode(self, player_name, event, game=None, player=None, full: bool=False) -> str:
+        """
+        Encode an event for the player, with the information of the game (if
+        given, it should have been published before) and the private
+        information of the player (if given).
+
+        """
+        encoded_values = {}
+        if player is not None:
+            encoded_values["player"] = player.to_json_text()
+        if game is not None:
+            if player_name not in self.delta_players:
+                encoded_values["game_info"] = game.to_json_text()
+            elif full or player_name not in self.synced_players:
+                self.synced_players.add(player_name)
+                encoded_values["game_info"] = game.to_json_text()
+                event = {**event, "seq": self.stream.seq}
+            else:
+                event = {**event, "game_delta": self.stream.changes, "seq": self.stream.seq}
+            if player_name == get_player_to_move(game):
+                encoded_values["legal"] = encode_legal_moves(game)
+        return encode_event(event, **encoded_values)
+
+    def broadcast(self, event, game=None):
+        """Send the event to all the players, with the information of the game if given."""
+        if not self:
+            return
+        if game is None:
+            message = json.dumps(event)
+            for connection in self.values():
+                connection.put(message)
+            METRICS.observe_broadcast(len(self), len(message) * len(self))
+            return
+        self.publish(game)
+        # the players that don't use deltas (and don't have to move) share the same message
+        full_message = None
+        player_to_move = get_player_to_move(game)
+        size = 0
+        for player_name, connection in self.items():
+            if player_name in self.delta_players or player_name == player_to_move:
+                message = self.encode(player_name, event, game)
+            else:
+                if full_message is None:
+                    full_message = self.encode(player_name, event, game)
+                message = full_message
+            connection.put(message)
+            size += len(message)
+        METRICS.observe_broadcast(len(self), size)
@@ -0,0 +1,51 @@
+"""Changes between two versions of the game information.
+
+Instead of the full ``game_info`` of every event, the clients that negotiate it receive the changes since the
+previous version and a sequence number. A client that receives a sequence number that is not the next one has lost
+a message, so it asks for a "resync" to receive the full information again.
+"""
+
+
+def diff(old: dict, new: dict) -> dict:
+    """Returns the keys of new that changed from old. Nested dicts only include their changes.
+    The keys removed from old are included with a None value"""
+    changes = {}
+    for key, value in new.items():
+        old_value = old.get(key)
+        if key in old and old_value == value:
+            continue
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            changes[key] = diff(old_value, value)
+        else:
+            changes[key] = value
+    for key in old.keys() - new.keys():
+        changes[key] = None
+    return changes
+
+
+def apply_delta(game_info: dict, changes: dict) -> dict:
+    """Returns a new game_info with the changes applied"""
+    result = dict(game_info)
+    for key, value in changes.items():
+        old_value = result.get(key)
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            result[key] = apply_delta(old_value, value)
+        else:
+            result[key] = value
+    return result
+
+
+class DeltaStream:
+    """Keeps the last version of the game information and its sequence number"""
+
+    def __init__(self):
+        self.seq = 0
+        self.game_info = None
+        self.changes = None
+
+    def publish(self, game_info: dict) -> dict:
+        """Registers a new version. Returns the changes since the previous one"""
+        self.changes = diff(self.game_info or {}, game_info)
+        self.game_info = game_info
+        self.seq += 1
+        return self.changes
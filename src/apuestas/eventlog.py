@@ -0,0 +1,402 @@
+"""An append-only log of the accepted moves of all the games, to rebuild them after a restart.
+
+Each record is a few bytes: its kind, the id of the game and the move (the index of the player in the game, the bet or
+the id of the card). A new game has the seed of its deals (see :class:`~apuestas.models.card.DealRandom`), so the turns
+are dealt again, and its access keys, so it can be joined again.
+The records are appended to a buffer and a single task writes the buffer and syncs the file every ``interval`` seconds
+(group commit): the moves of all the games in that interval cost one write and one fsync, and the players don't wait
+for them. A crash loses at most the moves of the last interval.
+
+The log is split in numbered segments (``events.log.000001``...). :meth:`EventLog.snapshot` starts a new segment and
+saves the state of the live games (see :mod:`apuestas.snapshot`), and then the previous segments are deleted. So
+:func:`replay` only plays the moves after the last snapshot with the :class:`~apuestas.models.game.Game` model to
+rebuild the games that had not finished. Measure its speed with::
+
+    python -m apuestas.eventlog --games 10000 --players 4 --max-cards 7
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import struct
+import tempfile
+import time
+from dataclasses import dataclass
+
+from apuestas.models.card import get_card
+from apuestas.models.game import Game
+from apuestas.snapshot import long_lived_objects, pack_game, read_snapshot, write_snapshot
+
+
+logger = logging.getLogger(__name__)
+
+# kinds of records
+GAME, PLAYER, TURN, BET, PLAY, END = range(1, 7)
+
+# kind, game id, and then the fields of each kind
+_HEADER = struct.Struct("<BI")
+_RECORDS = {
+    # max cards, seed, length of the keys, followed by the keys in UTF-8 separated by spaces
+    GAME: struct.Struct("<BIBQB"),
+    PLAYER: struct.Struct("<BIB"),  # length of the name, followed by the name in UTF-8
+    TURN: _HEADER,
+    BET: struct.Struct("<BIBB"),  # player index, bet
+    PLAY: struct.Struct("<BIBB"),  # player index, card id
+    END: _HEADER,
+}
+
+
+def play_bet(game: Game, player_index: int, bet: int):
+    """Plays a bet and finishes the bets when it is the last one, as the server does"""
+    game.bet(game.current_player_order[player_index], bet)
+    if game.next_player() is None:
+        game.finish_bet_tour()
+
+
+def play_card(game: Game, player_index: int, card_id: int):
+    """Plays a card and finishes the round and the turn when needed, as the server does (without beginning the next
+    turn, it has its own record)"""
+    card = get_card(card_id)
+    game.play(game.current_player_order[player_index], card.number, card.suit)
+    if game.next_player() is None:
+        game.end_round()
+    if game.has_turn_finished():
+        game.end_turn()
+
+
+@dataclass
+class LoggedGame:
+    """A game rebuilt by :func:`replay`"""
+    game: Game
+    # the keys given to new_game
+    keys: tuple[str, ...] = ()
+
+
+@dataclass
+class EventLogStats:
+    records: int = 0
+    bytes: int = 0
+    commits: int = 0
+
+    def to_json(self):
+        return {
+            "records": self.records,
+            "bytes": self.bytes,
+            "commits": self.commits,
+        }
+
+
+def segment_path(path: str, segment: int) -> str:
+    return f"{path}.{segment:06d}"
+
+
+def snapshot_path(path: str) -> str:
+    return f"{path}.snapshot"
+
+
+def list_segments(path: str) -> list[int]:
+    """Returns the numbers of the segments of the log in path, in order"""
+    directory, name = os.path.split(os.path.abspath(path))
+    segments = []
+    for file_name in os.listdir(directory):
+        prefix, _, number = file_name.rpartition(".")
+        if prefix == name and len(number) == 6 and number.isdigit():
+            segments.append(int(number))
+    return sorted(segments)
+
+
+class EventLog:
+    """
+    Appends the records of the games to a new segment of the log in path.
+
+    The records are written by :meth:`run` (or :meth:`flush`). The ids of the
+    new games follow first_game_id, and game_ids are the games already in the
+    log (both are returned by :func:`replay`, see :meth:`recover`).
+
+    """
+
+    def __init__(self, path: str, interval: float = 0.005, first_game_id: int = 0, game_ids=()):
+        self.path = path
+        self.interval = interval
+        self.next_game_id = first_game_id
+        self.stats = EventLogStats()
+        self.snapshots = 0
+        self._buffer = bytearray()
+        # records of each live game since the log was opened, the snapshots skip them in the next segments
+        self._records = dict.fromkeys(game_ids, 0)
+        # the segments are written in order: a write doesn't start before the previous one was synced
+        self._lock = asyncio.Lock()
+        segments = list_segments(path)
+        self.segment = segments[-1] + 1 if segments else 1
+        self._fd = self._open(self.segment)
+
+    @classmethod
+    def recover(cls, path: str, interval: float = 0.005) -> tuple["EventLog", dict[int, LoggedGame]]:
+        """Rebuilds the games of the log in path with :func:`replay`. Returns the log, to continue it, and the games"""
+        games, next_game_id = replay(path)
+        return cls(path, interval, next_game_id, games), games
+
+    def _open(self, segment: int) -> int:
+        return os.open(segment_path(self.path, segment), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _append(self, game_id: int, record: bytes):
+        self._buffer += record
+        self._records[game_id] += 1
+        self.stats.records += 1
+
+    def new_game(self, max_cards: int, seed: int, *keys: str) -> int:
+        """Returns the id of the new game. The keys (without spaces) are returned by :func:`replay`"""
+        data = " ".join(keys).encode()
+        if len(data) > 255:
+            raise ValueError("The keys of the game are too long.")
+        game_id = self.next_game_id
+        self.next_game_id += 1
+        self._records[game_id] = 0
+        self._append(game_id, _RECORDS[GAME].pack(GAME, game_id, max_cards, seed, len(data)) + data)
+        return game_id
+
+    def add_player(self, game_id: int, player_name: str):
+        name = player_name.encode()
+        if len(name) > 255:
+            raise ValueError("The name of the player is too long.")
+        self._append(game_id, _RECORDS[PLAYER].pack(PLAYER, game_id, len(name)) + name)
+
+    def begin_turn(self, game_id: int):
+        self._append(game_id, _HEADER.pack(TURN, game_id))
+
+    def bet(self, game_id: int, player_index: int, bet: int):
+        self._append(game_id, _RECORDS[BET].pack(BET, game_id, player_index, bet))
+
+    def play(self, game_id: int, player_index: int, card_id: int):
+        self._append(game_id, _RECORDS[PLAY].pack(PLAY, game_id, player_index, card_id))
+
+    def end_game(self, game_id: int):
+        """The game is not rebuilt anymore"""
+        self._append(game_id, _HEADER.pack(END, game_id))
+        del self._records[game_id]
+
+    def _write(self, data: bytes, fd: int = None):
+        fd = self._fd if fd is None else fd
+        os.write(fd, data)
+        os.fsync(fd)
+
+    def _take(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        self.stats.bytes += len(data)
+        self.stats.commits += 1
+        return data
+
+    def flush(self):
+        """Writes and syncs the pending records"""
+        if self._buffer:
+            self._write(self._take())
+
+    async def run(self):
+        """Commits the pending records every interval seconds. The file is written in a thread"""
+        while True:
+            await asyncio.sleep(self.interval)
+            async with self._lock:
+                if self._buffer:
+                    await asyncio.to_thread(self._write, self._take())
+
+    async def rotate(self) -> tuple[int, int, dict[int, int]]:
+        """
+        Starts a new segment. Returns its number, the id of the next game and
+        the records of each live game so far.
+
+        """
+        async with self._lock:
+            data = self._take()
+            fd = self._fd
+            self.segment += 1
+            self._fd = self._open(self.segment)
+            records = dict(self._records)
+            next_game_id = self.next_game_id
+            await asyncio.to_thread(self._close_segment, fd, data)
+        return self.segment, next_game_id, records
+
+    def _close_segment(self, fd: int, data: bytes):
+        self._write(data, fd)
+        os.close(fd)
+
+    async def snapshot(self, games: dict[int, LoggedGame], slice_size: int = 1000):
+        """
+        Saves a snapshot of the live games, by their id, and deletes the
+        segments of the log before it.
+
+        The games only have a consistent state between the moves, so they are
+        packed by the event loop, slice_size games at a time to let the other
+        tasks run between the slices. The file is written in a thread. The
+        moves played while the games are packed are in the new segment: the
+        snapshot has the amount of them that each game already has, which
+        :func:`replay` skips.
+
+        """
+        first_segment, next_game_id, first_records = await self.rotate()
+        entries = []
+        for index, (game_id, logged) in enumerate(list(games.items())):
+            if index % slice_size == slice_size - 1:
+                await asyncio.sleep(0)
+            records = self._records.get(game_id)
+            if records is None or game_id not in first_records:
+                # it has ended, or all its records are in the new segment
+                continue
+            entries.append((game_id, records - first_records[game_id], logged.keys, pack_game(logged.game)))
+        await asyncio.to_thread(self._write_snapshot, first_segment, next_game_id, entries)
+        self.snapshots += 1
+        logger.info("Saved a snapshot of %d games", len(entries))
+
+    def _write_snapshot(self, first_segment: int, next_game_id: int, entries):
+        write_snapshot(snapshot_path(self.path), first_segment, next_game_id, entries)
+        for segment in list_segments(self.path):
+            if segment < first_segment:
+                os.remove(segment_path(self.path, segment))
+
+    async def run_snapshots(self, games: dict[int, LoggedGame], interval: float):
+        """Saves a snapshot of the live games every interval seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.snapshot(games)
+            except OSError:
+                logger.exception("Error saving a snapshot")
+
+    def close(self):
+        self.flush()
+        os.close(self._fd)
+
+
+def read_records(data: bytes):
+    """Yields the records in data as (kind, game id, values) tuples. A record cut at the end of data (the crash
+    happened while it was written) is ignored. Raises :exc:`ValueError` if a record is not valid"""
+    offset = 0
+    end = len(data)
+    while offset < end:
+        kind = data[offset]
+        record = _RECORDS.get(kind)
+        if record is None:
+            raise ValueError(f"Invalid record at byte {offset} of the event log.")
+        if offset + record.size > end:
+            return
+        kind, game_id, *values = record.unpack_from(data, offset)
+        offset += record.size
+        if kind == PLAYER or kind == GAME:
+            length = values[-1]
+            if offset + length > end:
+                return
+            values[-1] = data[offset:offset + length].decode()
+            offset += length
+        yield kind, game_id, values
+
+
+def replay(path: str) -> tuple[dict[int, LoggedGame], int]:
+    """Rebuilds the games of the log in path that had not ended, from its last snapshot. Returns them by their id and
+    the id for the next game"""
+    games = {}
+    next_game_id = 0
+    first_segment = 0
+    # records of the games of the snapshot that are already in it
+    skip = {}
+    with long_lived_objects():
+        if os.path.exists(snapshot_path(path)):
+            first_segment, next_game_id, entries = read_snapshot(snapshot_path(path))
+            for game_id, records, keys, game in entries:
+                games[game_id] = LoggedGame(game, keys)
+                skip[game_id] = records
+        for segment in list_segments(path):
+            if segment < first_segment:
+                continue
+            with open(segment_path(path, segment), "rb") as file:
+                data = file.read()
+            for kind, game_id, values in read_records(data):
+                if skip.get(game_id):
+                    skip[game_id] -= 1
+                    continue
+                if kind == GAME:
+                    max_cards, seed, keys = values
+                    games[game_id] = LoggedGame(Game(max_cards, seed), tuple(keys.split()))
+                    next_game_id = max(next_game_id, game_id + 1)
+                    continue
+                logged = games.get(game_id)
+                if logged is None:
+                    # it ended before the snapshot
+                    continue
+                if kind == END:
+                    del games[game_id]
+                elif kind == PLAYER:
+                    logged.game.add_player(values[0])
+                elif kind == TURN:
+                    logged.game.begin_turn()
+                elif kind == BET:
+                    play_bet(logged.game, *values)
+                else:
+                    play_card(logged.game, *values)
+    return games, next_game_id
+
+
+def write_games(log: EventLog, games: int, players: int, max_cards: int, seed: int = 0) -> int:
+    """Logs full games between random policies. Returns the amount of moves"""
+    from apuestas.simulation.policies import RandomPolicy
+
+    rng = random.Random(seed)
+    policy = RandomPolicy(seed)
+    moves = 0
+    for _ in range(games):
+        game = Game(max_cards, rng.getrandbits(64))
+        game_id = log.new_game(max_cards, game.rng.seed)
+        for index in range(players):
+            game.add_player(str(index))
+            log.add_player(game_id, str(index))
+        while not game.has_game_ended():
+            game.begin_turn()
+            log.begin_turn(game_id)
+            while game.current_state == "bet":
+                index = game.current_player_index
+                bet = policy.bet(game, game.current_player)
+                play_bet(game, index, bet)
+                log.bet(game_id, index, bet)
+                moves += 1
+            while not game.has_turn_finished():
+                index = game.current_player_index
+                card = policy.play(game, game.current_player)
+                play_card(game, index, card.id)
+                log.play(game_id, index, card.id)
+                moves += 1
+    log.flush()
+    return moves
+
+
+def benchmark(games: int, players: int = 4, max_cards: int = 7) -> dict:
+    """Logs full games and replays them. Returns the size of the log and the moves replayed per second"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "events.log")
+        log = EventLog(path)
+        moves = write_games(log, games, players, max_cards)
+        log.close()
+        start = time.perf_counter()
+        replayed, _ = replay(path)
+        elapsed = time.perf_counter() - start
+    return {
+        "games": len(replayed),
+        "moves": moves,
+        "bytes": log.stats.bytes,
+        "seconds": elapsed,
+        "moves_per_second": moves / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the speed of replaying the event log.")
+    parser.add_argument("--games", type=int, default=10_000)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--max-cards", type=int, default=7)
+    args = parser.parse_args()
+    report = benchmark(args.games, args.players, args.max_cards)
+    print(f"games: {report['games']}  moves: {report['moves']}  log: {report['bytes'] / 1e6:.1f} MB  "
+          f"replay: {report['seconds']:.2f} s ({report['moves_per_second']:,.0f} moves/s)")
+
+
+if __name__ == "__main__":
+    main()
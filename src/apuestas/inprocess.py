@@ -0,0 +1,172 @@
+"""Websockets in memory, to run the handlers of :mod:`apuestas.app` without sockets.
+
+A :class:`MemoryWebSocket` has the methods of a websocket that the server uses (``send``, ``recv``, iterating the
+messages and ``close``), and its messages are put in the queue of its peer. :class:`InProcessServer` runs a handler
+for each connection opened with :meth:`InProcessServer.connect`, like ``websockets.serve``. The clients of
+:mod:`apuestas.loadtest` play games through it at the highest rate possible, without the costs of the network and
+the framing, so the JSON, the models and the dispatch of the app can be profiled on their own::
+
+    python -m apuestas.inprocess --games 100 --duration 5 --profile
+"""
+import argparse
+import asyncio
+import contextlib
+import cProfile
+import pstats
+import time
+
+from websockets.exceptions import ConnectionClosedOK
+from websockets.frames import Close
+
+from apuestas.loadtest import percentile, run_clients
+
+
+# put in the queue of a websocket when it is closed
+_CLOSED = object()
+
+
+class MemoryWebSocket:
+    """One side of an in-memory connection, see :func:`socket_pair`"""
+
+    def __init__(self):
+        self.peer: MemoryWebSocket = None
+        self.closed = False
+        self.close_code: int = None
+        self.close_reason = ""
+        self._messages = asyncio.Queue()
+
+    def _connection_closed(self):
+        close = Close(self.close_code, self.close_reason)
+        return ConnectionClosedOK(close, close, True)
+
+    async def send(self, message):
+        """Puts the message in the queue of the peer. Raises ConnectionClosed if the connection is closed"""
+        if self.closed:
+            raise self._connection_closed()
+        self.peer._messages.put_nowait(message)
+
+    async def recv(self):
+        """Returns the next message. Raises ConnectionClosed when the connection is closed"""
+        message = await self._messages.get()
+        if message is _CLOSED:
+            # the next calls find it too
+            self._messages.put_nowait(_CLOSED)
+            raise self._connection_closed()
+        return message
+
+    async def __aiter__(self):
+        try:
+            while True:
+                yield await self.recv()
+        except ConnectionClosedOK:
+            return
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        """Closes both sides. The messages already sent are received before"""
+        if self.closed:
+            return
+        for side in (self, self.peer):
+            side.closed = True
+            side.close_code = code
+            side.close_reason = reason
+            side._messages.put_nowait(_CLOSED)
+
+    async def wait_closed(self):
+        while not self.closed:
+            await asyncio.sleep(0)
+
+
+def socket_pair() -> tuple[MemoryWebSocket, MemoryWebSocket]:
+    """Returns the two sides of a connection"""
+    server_side, client_side = MemoryWebSocket(), MemoryWebSocket()
+    server_side.peer, client_side.peer = client_side, server_side
+    return server_side, client_side
+
+
+class InProcessServer:
+    """
+    Runs handler(websocket) for each connection, and closes the connection
+    when it returns (as ``websockets.serve`` does).
+
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.connections = 0
+        self._tasks = set()
+
+    async def _run(self, websocket):
+        try:
+            await self.handler(websocket)
+        finally:
+            await websocket.close()
+
+    @contextlib.asynccontextmanager
+    async def connect(self, uri: str = None):
+        """
+        Opens a connection and returns its client side. The uri is ignored,
+        it is there to replace ``websockets.asyncio.client.connect``.
+
+        """
+        server_side, client_side = socket_pair()
+        self.connections += 1
+        task = asyncio.create_task(self._run(server_side))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        try:
+            yield client_side
+        finally:
+            await client_side.close()
+
+    async def wait_closed(self):
+        """Waits for the handlers of the closed connections"""
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+
+async def run_benchmark(games: int, duration: float, deltas: bool = False, seed: int = 0) -> dict:
+    """Plays games concurrently through the handler of the app for duration seconds and returns the results"""
+    from apuestas.app import handler
+
+    server = InProcessServer(handler)
+    start = time.perf_counter()
+    stats = await run_clients("memory", games, duration, seed=seed, deltas=deltas, connect=server.connect)
+    await server.wait_closed()
+    elapsed = time.perf_counter() - start
+    latencies = sorted(stats.latencies)
+    return {
+        "games": games,
+        "finished_games": stats.games,
+        "moves": stats.moves,
+        "errors": stats.errors,
+        "elapsed": elapsed,
+        "moves_per_second": stats.moves / elapsed,
+        "messages_per_second": stats.messages / elapsed,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p99": percentile(latencies, 0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plays games through the handlers of the app, without sockets.")
+    parser.add_argument("--games", type=int, default=100, help="concurrent games")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--deltas", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--profile", action="store_true", help="print the functions with the most time")
+    args = parser.parse_args()
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    report = asyncio.run(run_benchmark(args.games, args.duration, args.deltas, args.seed))
+    if profiler is not None:
+        profiler.disable()
+        pstats.Stats(profiler).sort_stats("tottime").print_stats(25)
+    print(f"games: {report['finished_games']}  moves/s: {report['moves_per_second']:.0f}  "
+          f"messages/s: {report['messages_per_second']:.0f}  p50: {1000 * report['latency_p50']:.3f} ms  "
+          f"p99: {1000 * report['latency_p99']:.3f} ms  errors: {report['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""Load test of the websocket server: thousands of real clients playing games against a local server.
+
+Each game has two clients, which follow the protocol of the UI (``init``, ``start``/``start_ack``, ``bet`` and
+``play``) and play random moves taken from the legal moves they receive (``legal``). When a game ends, its clients
+start another one. The load is raised in steps of concurrent games; for each one the tool reports the latency from
+sending a move to receiving its broadcast (p50, p99 and p999), the messages per second and the CPU time and memory of
+the server per game. The first step whose p99 is ``--degradation`` times the one of the first step is where the
+latency degrades. Run it with::
+
+    python -m apuestas.loadtest --steps 100 500 1000 2000 --duration 10 --processes 4 --output results.json
+
+It starts the server (``python -m apuestas.app``) on a free port, unless ``--uri`` is given (with ``--pid`` to
+measure its CPU and memory). The CPU and memory are read from ``/proc``, so they are only reported on Linux. With
+``--workers 1 2 4`` the steps are run against a new server for each amount of worker processes
+(``APUESTAS_WORKERS``), and the scaling of the messages per second is reported against the run with the fewest
+workers. The clients need cores too, so they can be the limit before the server.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+
+@dataclass
+class ClientStats:
+    games: int = 0  # finished games
+    moves: int = 0
+    messages: int = 0  # received by the clients
+    errors: int = 0  # "error" events and failed connections
+    latencies: list[float] = field(default_factory=list)  # seconds from a move to its broadcast
+
+    def merge(self, other: "ClientStats"):
+        self.games += other.games
+        self.moves += other.moves
+        self.messages += other.messages
+        self.errors += other.errors
+        self.latencies.extend(other.latencies)
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Returns the value of sorted_values at the fraction (nearest rank), or 0.0 if it is empty"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def choose_move(legal: dict, rng: random.Random) -> dict:
+    """Returns the event of a random move of the legal moves of a message"""
+    if "bets" in legal:
+        return {"type": "bet", "bet": rng.choice(legal["bets"])}
+    card = rng.choice(legal["cards"])
+    return {"type": "play", "number": card["number"], "suit": card["suit"]}
+
+
+async def play_player(websocket, player: str, stats: ClientStats, rng: random.Random, measure):
+    """Plays the moves of a player until the game ends. The latencies are only kept while measure() is true"""
+    sent = None
+    async for message in websocket:
+        stats.messages += 1
+        event = json.loads(message)
+        event_type = event["type"]
+        if event_type == "start":
+            await websocket.send(json.dumps({"type": "start_ack", "game_key": event["game_key"]}))
+        elif event_type == "error":
+            stats.errors += 1
+        elif event_type in ("bet", "play") and event["player"] == player and sent is not None:
+            if measure():
+                stats.latencies.append(time.perf_counter() - sent)
+            sent = None
+        if "legal" in event:
+            move = choose_move(event["legal"], rng)
+            sent = time.perf_counter()
+            stats.moves += 1
+            await websocket.send(json.dumps(move))
+        if event_type == "game_ended":
+            return
+
+
+async def play_game(uri: str, stats: ClientStats, rng: random.Random, measure, deltas: bool = False,
+                    connect=connect):
+    """
+    Starts a game with one client, joins it with another one and plays it.
+    The clients are opened with connect(uri) (see :mod:`apuestas.inprocess`).
+
+    """
+    async with connect(uri) as first:
+        await first.send(json.dumps({"type": "init", "deltas": deltas}))
+        event = json.loads(await first.recv())
+        stats.messages += 1
+        if event["type"] != "init":
+            stats.errors += 1
+            return
+        async with connect(uri) as second:
+            await second.send(json.dumps({"type": "init", "join": event["join"], "deltas": deltas}))
+            await asyncio.gather(
+                play_player(first, "red", stats, rng, measure),
+                play_player(second, "blue", stats, rng, measure),
+            )
+    stats.games += 1
+
+
+async def run_clients(uri: str, games: int, duration: float, ramp: float = 0.0, warmup: float = 0.0,
+                      seed: int = 0, deltas: bool = False, connect=connect) -> ClientStats:
+    """
+    Plays games concurrently for duration seconds (the games that are being
+    played when it expires are finished). The games start spread over ramp
+    seconds, and the latencies are measured after warmup seconds.
+
+    """
+    stats = ClientStats()
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = start + duration
+
+    def measure():
+        return measure_from <= time.perf_counter() < stop_at
+
+    async def play_games(index):
+        rng = random.Random(seed * 1_000_003 + index)
+        await asyncio.sleep(ramp * index / games)
+        while time.perf_counter() < stop_at:
+            try:
+                await play_game(uri, stats, rng, measure, deltas, connect)
+            except (ConnectionClosed, OSError):
+                stats.errors += 1
+                await asyncio.sleep(0.1)
+
+    await asyncio.gather(*(play_games(index) for index in range(games)))
+    return stats
+
+
+def _run_chunk(uri: str, games: int, duration: float, ramp: float, warmup: float, seed: int,
+               deltas: bool) -> ClientStats:
+    try:
+        import resource
+        # two sockets for each game
+        _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+    return asyncio.run(run_clients(uri, games, duration, ramp, warmup, seed, deltas))
+
+
+def read_process_usage(pid: int):
+    """Returns the CPU time (in seconds) and the resident memory (in bytes) of a process, or None if unknown"""
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            # the command name can have spaces, the fields are counted after it
+            fields = file.read().rpartition(")")[2].split()
+        with open(f"/proc/{pid}/statm") as file:
+            resident_pages = int(file.read().split()[1])
+    except OSError:
+        return None
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return cpu_seconds, resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def read_server_usage(pid: int):
+    """
+    Returns the CPU time and the resident memory of a process and its
+    children (the workers of the server), or None if unknown.
+
+    """
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as file:
+            children = [int(child) for child in file.read().split()]
+    except OSError:
+        children = []
+    usage = read_process_usage(pid)
+    if usage is None:
+        return None
+    cpu_seconds, memory = usage
+    for child in children:
+        # a child can exit while it is read
+        child_usage = read_process_usage(child)
+        if child_usage is not None:
+            cpu_seconds += child_usage[0]
+            memory += child_usage[1]
+    return cpu_seconds, memory
+
+
+def run_step(uri: str, games: int, duration: float, ramp: float, warmup: float, processes: int = 1,
+             seed: int = 0, deltas: bool = False, pid: int = None, base_memory: int = 0) -> dict:
+    """
+    Plays games concurrently, split in processes (in this one if it is 1),
+    and returns the results of the step. The memory of the server per game
+    is measured over its base_memory.
+
+    """
+    usage = read_server_usage(pid) if pid is not None else None
+    stats = ClientStats()
+    start = time.perf_counter()
+    if processes == 1:
+        stats.merge(_run_chunk(uri, games, duration, ramp, warmup, seed, deltas))
+    else:
+        chunks = [games // processes + (1 if index < games % processes else 0) for index in range(processes)]
+        with ProcessPoolExecutor(processes) as executor:
+            futures = [
+                executor.submit(_run_chunk, uri, chunk, duration, ramp, warmup, seed + index, deltas)
+                for index, chunk in enumerate(chunks) if chunk
+            ]
+            for future in futures:
+                stats.merge(future.result())
+    elapsed = time.perf_counter() - start
+    latencies = sorted(stats.latencies)
+    result = {
+        "games": games,
+        "clients": 2 * games,
+        "finished_games": stats.games,
+        "moves": stats.moves,
+        "errors": stats.errors,
+        "elapsed": elapsed,
+        "messages_per_second": stats.messages / elapsed,
+        "moves_per_second": stats.moves / elapsed,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p99": percentile(latencies, 0.99),
+        "latency_p999": percentile(latencies, 0.999),
+        "cpu_per_game": None,
+        "memory_per_game": None,
+    }
+    end_usage = read_server_usage(pid) if usage is not None else None
+    if end_usage is not None:
+        # fraction of a core used by each concurrent game, and resident memory of the server per game
+        result["cpu_per_game"] = (end_usage[0] - usage[0]) / elapsed / games
+        result["memory_per_game"] = (end_usage[1] - base_memory) / games
+    return result
+
+
+def find_degradation(steps: list[dict], factor: float) -> int:
+    """Returns the games of the first step whose p99 latency is factor times the one of the first step, or None"""
+    if not steps:
+        return None
+    baseline = steps[0]["latency_p99"]
+    for step in steps[1:]:
+        if step["latency_p99"] > factor * baseline:
+            return step["games"]
+    return None
+
+
+def get_scaling(runs: list[dict]) -> list[dict]:
+    """
+    Returns the highest messages per second of the steps of each run, and
+    its speedup and efficiency (the speedup per worker) over the run with the
+    fewest workers.
+
+    """
+    if not runs:
+        return []
+    peaks = sorted((run["workers"], max(step["messages_per_second"] for step in run["steps"])) for run in runs)
+    base_workers, base_rate = peaks[0]
+    scaling = []
+    for workers, rate in peaks:
+        speedup = rate / base_rate if base_rate else 0.0
+        scaling.append({
+            "workers": workers,
+            "messages_per_second": rate,
+            "speedup": speedup,
+            "efficiency": speedup * base_workers / workers,
+        })
+    return scaling
+
+
+def start_server(port: int, max_games: int, workers: int = 1) -> subprocess.Popen:
+    """Starts python -m apuestas.app on port and waits until it accepts connections"""
+    # the metrics are not served, their port could be used by another server
+    env = {
+        **os.environ,
+        "APUESTAS_PORT": str(port),
+        "APUESTAS_MAX_GAMES": str(max_games),
+        "APUESTAS_METRICS_PORT": "0",
+        "APUESTAS_WORKERS": str(workers),
+    }
+    if workers > 1:
+        # the workers use the ports that follow this one to forward the players between them
+        env["APUESTAS_SHARD_PORT"] = str(get_free_port())
+    server = subprocess.Popen(
+        [sys.executable, "-m", "apuestas.app"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except OSError:
+            if server.poll() is not None or time.monotonic() > deadline:
+                server.kill()
+                raise RuntimeError("The server did not start.")
+            time.sleep(0.05)
+
+
+def stop_server(server: subprocess.Popen):
+    """Stops a server started by start_server. The supervisor of the workers stops them on an interrupt"""
+    server.send_signal(signal.SIGINT)
+    try:
+        server.wait(10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_load_test(uri: str, steps: list[int], duration: float, ramp: float, warmup: float, processes: int = 1,
+                  degradation: float = 2.0, seed: int = 0, deltas: bool = False, pid: int = None,
+                  workers: int = None) -> dict:
+    """Runs a step for each amount of concurrent games and returns the results"""
+    usage = read_server_usage(pid) if pid is not None else None
+    base_memory = 0 if usage is None else usage[1]
+    results = []
+    for games in steps:
+        results.append(run_step(uri, games, duration, ramp, warmup, processes, seed, deltas, pid, base_memory))
+    return {
+        "uri": uri,
+        "duration": duration,
+        "ramp": ramp,
+        "warmup": warmup,
+        "processes": processes,
+        "deltas": deltas,
+        "workers": workers,
+        "steps": results,
+        "degraded_at": find_degradation(results, degradation),
+    }
+
+
+def _print_run(results: dict):
+    if results["workers"] is not None:
+        print(f"workers: {results['workers']}")
+    print(f"{'games':>7} {'msgs/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'p999 ms':>8} {'cpu/game':>9} "
+          f"{'KB/game':>8} {'errors':>6}")
+    for step in results["steps"]:
+        cpu = "-" if step["cpu_per_game"] is None else f"{step['cpu_per_game']:.5f}"
+        memory = "-" if step["memory_per_game"] is None else f"{step['memory_per_game'] / 1024:.1f}"
+        print(f"{step['games']:>7} {step['messages_per_second']:>9.0f} {1000 * step['latency_p50']:>8.2f} "
+              f"{1000 * step['latency_p99']:>8.2f} {1000 * step['latency_p999']:>8.2f} {cpu:>9} {memory:>8} "
+              f"{step['errors']:>6}")
+    if results["degraded_at"] is None:
+        print("the latency did not degrade")
+    else:
+        print(f"the latency degrades at {results['degraded_at']} games")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plays games with websocket clients against a server.")
+    parser.add_argument("--uri", help="server to test (by default, a new one is started)")
+    parser.add_argument("--pid", type=int, help="process of the server given with --uri, to measure it")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1],
+                        help="worker processes of the started server, a run for each one")
+    parser.add_argument("--steps", type=int, nargs="+", default=[100, 500, 1000, 2000],
+                        help="concurrent games of each step")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of each step")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds to start the games of a step")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds before the latency is measured")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="processes of the clients")
+    parser.add_argument("--degradation", type=float, default=2.0)
+    parser.add_argument("--deltas", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file for the results")
+    args = parser.parse_args()
+    if args.uri is not None and args.workers != [1]:
+        parser.error("--workers starts the servers, it can't be used with --uri")
+
+    runs = []
+    for workers in args.workers:
+        server = None
+        uri, pid = args.uri, args.pid
+        if uri is None:
+            port = get_free_port()
+            server = start_server(port, 2 * max(args.steps) + 100, workers)
+            uri, pid = f"ws://127.0.0.1:{port}/", server.pid
+        try:
+            runs.append(run_load_test(uri, args.steps, args.duration, args.ramp, args.warmup, args.processes,
+                                      args.degradation, args.seed, args.deltas, pid,
+                                      None if args.uri else workers))
+        finally:
+            if server is not None:
+                stop_server(server)
+        _print_run(runs[-1])
+
+    results = runs[0]
+    if len(runs) > 1:
+        results = {"runs": runs, "scaling": get_scaling(runs)}
+        print(f"{'workers':>7} {'msgs/s':>9} {'speedup':>8} {'efficiency':>10}")
+        for row in results["scaling"]:
+            print(f"{row['workers']:>7} {row['messages_per_second']:>9.0f} {row['speedup']:>8.2f} "
+                  f"{row['efficiency']:>10.2f}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
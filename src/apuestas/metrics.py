@@ -0,0 +1,206 @@
+"""Metrics of the server, exposed in the Prometheus text format.
+
+The histograms have fixed buckets and their counts are a list allocated when they are created, so recording a value
+is a binary search of the bucket and an increment: nothing is allocated and nothing is locked (the metrics are only
+recorded by the event loop). The gauges are functions called when the metrics are scraped, so the values that the
+server already keeps (the live games, the open connections...) cost nothing until then.
+
+:data:`METRICS` has the metrics of the server. The actors record the latency of the commands of each event type,
+the completed turns and games and the errors sent, and :class:`~apuestas.connections.Connections` the players and
+bytes of each broadcast. :func:`serve_metrics` answers ``GET /metrics`` on a local HTTP port. Measure the cost of
+recording a value with::
+
+    python -m apuestas.metrics
+"""
+import asyncio
+import bisect
+import time
+
+
+# seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+FANOUT_BUCKETS = (1, 2, 3, 4, 6, 8, 16, 32)
+BYTES_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+
+# the event types of the commands whose latency is recorded
+EVENT_TYPES = ("start_ack", "bet", "play", "game_info", "resync")
+
+# the kinds of the "error" events that are counted. The messages are not used as labels, some of them are made from
+# what the clients send
+ERROR_KINDS = (
+    "invalid_json", "invalid_event", "invalid_state", "invalid_game_key", "invalid_player", "illegal_move",
+    "game_not_found", "game_full", "not_started", "too_many_games", "internal", "other",
+)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Counts of the values in each bucket (the values up to each bound, and the larger ones) and their sum"""
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def render(self, name: str, labels: dict = None) -> list[str]:
+        """Returns the lines of the cumulative buckets, the sum and the count"""
+        labels = labels or {}
+        lines = []
+        total = 0
+        for bound, count in zip(self.bounds + ("+Inf",), self.counts):
+            total += count
+            lines.append(f"{name}_bucket{_format_labels({**labels, 'le': bound})} {total}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {total}")
+        return lines
+
+
+class Metrics:
+    """The metrics of the server. The values are recorded directly in its attributes"""
+
+    def __init__(self):
+        self.handler_latency = {event_type: Histogram(LATENCY_BUCKETS) for event_type in EVENT_TYPES}
+        self.broadcast_fanout = Histogram(FANOUT_BUCKETS)
+        self.broadcast_bytes = Histogram(BYTES_BUCKETS)
+        self.turns_completed = 0
+        self.games_completed = 0
+        # "error" events sent, by kind
+        self.errors = dict.fromkeys(ERROR_KINDS, 0)
+        # name: (kind, help, function returning the value or a {label value: value} dict, label name)
+        self._gauges = {}
+
+    def observe_command(self, event_type: str, latency: float):
+        histogram = self.handler_latency.get(event_type)
+        if histogram is not None:
+            histogram.observe(latency)
+
+    def observe_broadcast(self, connections: int, size: int):
+        """A message of size bytes was sent to connections players"""
+        self.broadcast_fanout.observe(connections)
+        self.broadcast_bytes.observe(size)
+
+    def count_error(self, kind: str):
+        """Counts an error of a kind of ERROR_KINDS, the unknown ones are counted as "other" """
+        if kind not in self.errors:
+            kind = "other"
+        self.errors[kind] += 1
+
+    def add_gauge(self, name: str, help: str, function, label: str = None, kind: str = "gauge"):
+        """
+        Adds a value read when the metrics are rendered: function() returns
+        it, or a dict of values by the value of label. kind is "counter" for
+        the values that only grow.
+
+        """
+        self._gauges[name] = (kind, help, function, label)
+
+    def render(self) -> str:
+        """Returns the metrics in the Prometheus text format"""
+        lines = [
+            "# HELP apuestas_handler_latency_seconds Time from receiving a command to applying it.",
+            "# TYPE apuestas_handler_latency_seconds histogram",
+        ]
+        for event_type, histogram in self.handler_latency.items():
+            lines.extend(histogram.render("apuestas_handler_latency_seconds", {"event": event_type}))
+        lines.extend([
+            "# HELP apuestas_broadcast_fanout Players that receive each broadcast.",
+            "# TYPE apuestas_broadcast_fanout histogram",
+            *self.broadcast_fanout.render("apuestas_broadcast_fanout"),
+            "# HELP apuestas_broadcast_bytes Bytes of the messages of each broadcast.",
+            "# TYPE apuestas_broadcast_bytes histogram",
+            *self.broadcast_bytes.render("apuestas_broadcast_bytes"),
+            "# HELP apuestas_turns_completed_total Turns played to the end.",
+            "# TYPE apuestas_turns_completed_total counter",
+            f"apuestas_turns_completed_total {self.turns_completed}",
+            "# HELP apuestas_games_completed_total Games played to the end.",
+            "# TYPE apuestas_games_completed_total counter",
+            f"apuestas_games_completed_total {self.games_completed}",
+            "# HELP apuestas_errors_total Error events sent to the players, by kind.",
+            "# TYPE apuestas_errors_total counter",
+        ])
+        for kind, count in self.errors.items():
+            lines.append(f"apuestas_errors_total{_format_labels({'kind': kind})} {count}")
+        for name, (kind, help, function, label) in self._gauges.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            value = function()
+            if label is None:
+                lines.append(f"{name} {_format_value(value)}")
+            else:
+                for label_value, item_value in value.items():
+                    lines.append(f"{name}{_format_labels({label: label_value})} {_format_value(item_value)}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+async def _answer(metrics: Metrics, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request = await reader.readuntil(b"\r\n\r\n")
+        method, path, _ = request.split(b"\r\n", 1)[0].decode("latin-1").split(" ", 2)
+        if method == "GET" and path.split("?", 1)[0] == "/metrics":
+            status, content_type, body = "200 OK", "text/plain; version=0.0.4; charset=utf-8", metrics.render()
+        else:
+            status, content_type, body = "404 Not Found", "text/plain; charset=utf-8", "Not found.\n"
+        body = body.encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(metrics: Metrics = METRICS, host: str = "127.0.0.1", port: int = 8002) -> asyncio.Server:
+    """Starts an HTTP server that answers GET /metrics with the rendered metrics"""
+    return await asyncio.start_server(lambda reader, writer: _answer(metrics, reader, writer), host, port)
+
+
+def benchmark(values: int = 1_000_000) -> dict:
+    """Returns the nanoseconds to record a latency and a broadcast"""
+    metrics = Metrics()
+    latencies = [(index % 1000) / 1e5 for index in range(values)]
+    start = time.perf_counter()
+    for latency in latencies:
+        metrics.observe_command("bet", latency)
+    command_ns = (time.perf_counter() - start) / values * 1e9
+    start = time.perf_counter()
+    for index in range(values):
+        metrics.observe_broadcast(2, index & 4095)
+    broadcast_ns = (time.perf_counter() - start) / values * 1e9
+    return {"observe_command_ns": command_ns, "observe_broadcast_ns": broadcast_ns}
+
+
+def main():
+    for name, nanoseconds in benchmark().items():
+        print(f"{name:<22} {nanoseconds:6.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,235 @@
+import hashlib
 import random
+import struct
 
 
 CARD_NUMBERS = [i for i in range(1, 13)]
 CARD_SUITS = ["Oro", "Espada", "Basto", "Copa"]
 
+CARDS_PER_SUIT = len(CARD_NUMBERS)
+DECK_SIZE = len(CARD_SUITS) * CARDS_PER_SUIT
+
+SUIT_INDEX = {suit: index for index, suit in enumerate(CARD_SUITS)}
+
+# Every card is identified by an integer between 0 and 47: suit_index * 12 + number - 1.
+# It is the same order a new Deck is built with. The tables below are indexed by that id.
+CARD_ID_SUIT = [card_id // CARDS_PER_SUIT for card_id in range(DECK_SIZE)]
+CARD_ID_NUMBER = [CARD_NUMBERS[card_id % CARDS_PER_SUIT] for card_id in range(DECK_SIZE)]
+# Order of the numbers inside a suit, from the weakest to the strongest one
+NUMBERS_ORDER = [2, 4, 5, 6, 7, 8, 9, 10, 11, 12, 3, 1]
+# Value of the card inside its suit (between 1 and 12). The greater, the stronger.
+CARD_ID_RANK = [NUMBERS_ORDER.index(number) + 1 for number in CARD_ID_NUMBER]
+# Bits of all the cards of each suit, used by the hands masks
+SUIT_MASKS = [((1 << CARDS_PER_SUIT) - 1) << (suit_index * CARDS_PER_SUIT) for suit_index in range(len(CARD_SUITS))]
+
+
+def _get_trick_strength(muestra_suit_index: int, current_suit_index: int, card_id: int) -> int:
+    suit_index = CARD_ID_SUIT[card_id]
+    if suit_index == muestra_suit_index:
+        return 2 * CARDS_PER_SUIT + CARD_ID_RANK[card_id]
+    if suit_index == current_suit_index:
+        return CARDS_PER_SUIT + CARD_ID_RANK[card_id]
+    # the card has no value in this round
+    return 0
+
+
+# Strength of each card in a round, indexed by [muestra suit index][current suit index][card id].
+# The card with the greatest strength wins the round. Any card of the muestra suit beats the cards
+# of the current suit, which beat the cards of the other suits (they have no value). Many rounds at once are resolved
+# with it as an array, with one argmax (see :mod:`apuestas.simulation.batch`).
+TRICK_STRENGTH = [
+    [
+        [_get_trick_strength(muestra_suit_index, current_suit_index, card_id) for card_id in range(DECK_SIZE)]
+        for current_suit_index in range(len(CARD_SUITS))
+    ]
+    for muestra_suit_index in range(len(CARD_SUITS))
+]
+
+
+def get_trick_winner(muestra_suit_index: int, current_suit_index: int, card_ids) -> int:
+    """Returns the position (in card_ids) of the card that wins the round"""
+    strength = TRICK_STRENGTH[muestra_suit_index][current_suit_index]
+    strengths = [strength[card_id] for card_id in card_ids]
+    return strengths.index(max(strengths))
+
+
+def get_card_id(number, suit) -> int:
+    """Returns the id of the card. Raises :exc:`ValueError` if the card does not exist"""
+    try:
+        return _CARD_IDS[(number, suit)]
+    except (KeyError, TypeError):
+        raise ValueError("Invalid card.") from None
+
+
+def get_card(card_id: int) -> "Card":
+    """Returns the (unique) card with the given id"""
+    return CARDS[card_id]
+
 
 class Card:
-    def __init__(self, number, suit):
-        if number not in CARD_NUMBERS or suit not in CARD_SUITS:
-            raise ValueError("Invalid card.")
+    """A Spanish deck card.
 
-        self.number = number
-        self.suit = suit
-    
-    def __eq__(self, other_card):
-        return self.number == other_card.number and self.suit == other_card.suit
+    There is only one instance per card: ``Card(1, "Oro") is Card(1, "Oro")``. So cards are compared
+    by identity and they can be used as keys without hashing their values.
+    """
+    __slots__ = ("id", "bit", "number", "suit", "suit_index", "rank", "_json")
+
+    def __new__(cls, number, suit):
+        return CARDS[get_card_id(number, suit)]
+
+    @classmethod
+    def _create(cls, card_id: int) -> "Card":
+        card = object.__new__(cls)
+        card.id = card_id
+        card.bit = 1 << card_id
+        card.number = CARD_ID_NUMBER[card_id]
+        card.suit_index = CARD_ID_SUIT[card_id]
+        card.suit = CARD_SUITS[card.suit_index]
+        card.rank = CARD_ID_RANK[card_id]
+        card._json = {
+            "number": card.number,
+            "suit": card.suit,
+        }
+        return card
 
     def __hash__(self):
-        return hash((self.number, self.suit))
-    
+        return self.id
+
+    def __reduce__(self):
+        # keep the cards unique when they are copied or sent to another process
+        return get_card, (self.id,)
+
     def __repr__(self):
         return f"Card({self.number}, {self.suit})"
-    
+
     def to_json(self):
-        return {
-            "number": self.number,
-            "suit": self.suit,
-        }
+        """Returns the serialized card. It is shared by all the callers, so it must not be modified"""
+        return self._json
+
+
+CARDS = [Card._create(card_id) for card_id in range(DECK_SIZE)]
+_CARD_IDS = {(card.number, card.suit): card.id for card in CARDS}
+
+
+class Hand:
+    """A set of cards stored as a 48 bits mask, where the bit ``card.id`` is set if the card is in the hand.
+
+    It behaves like a set of cards. The cards are iterated in the order of their id.
+    """
+    __slots__ = ("mask", "_json")
+
+    def __init__(self, cards=()):
+        mask = 0
+        for card in cards:
+            mask |= card.bit
+        self.mask = mask
+        self._json = None
+
+    @classmethod
+    def from_mask(cls, mask: int) -> "Hand":
+        hand = cls()
+        hand.mask = mask
+        return hand
+
+    def __contains__(self, card):
+        return self.mask & card.bit != 0
+
+    def __len__(self):
+        return self.mask.bit_count()
+
+    def __bool__(self):
+        return self.mask != 0
+
+    def __iter__(self):
+        mask = self.mask
+        while mask:
+            lowest_bit = mask & -mask
+            yield CARDS[lowest_bit.bit_length() - 1]
+            mask ^= lowest_bit
+
+    def __eq__(self, other):
+        if isinstance(other, Hand):
+            return self.mask == other.mask
+        if isinstance(other, (set, frozenset)):
+            return set(self) == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Hand({list(self)})"
+
+    def add(self, card: Card):
+        self.mask |= card.bit
+        self._json = None
+
+    def remove(self, card: Card):
+        """Removes the card from the hand. Raises :exc:`KeyError` if the hand does not have it"""
+        if self.mask & card.bit == 0:
+            raise KeyError(card)
+        self.mask ^= card.bit
+        self._json = None
+
+    def suit_mask(self, suit_index: int) -> int:
+        """Returns the mask of the cards of the given suit"""
+        return self.mask & SUIT_MASKS[suit_index]
+
+    def has_suit(self, suit_index: int) -> bool:
+        return self.mask & SUIT_MASKS[suit_index] != 0
+
+    def cards_with_suit(self, suit_index: int) -> "Hand":
+        return Hand.from_mask(self.mask & SUIT_MASKS[suit_index])
+
+    def to_json(self):
+        """Returns the serialized cards. It is cached until the hand changes, so it must not be modified"""
+        if self._json is None:
+            self._json = [card.to_json() for card in self]
+        return self._json
+
+
+class DealRandom:
+    """The random numbers of the deals of a game.
+
+    The bits of the n-th deal are a hash of the seed and n, so a game is dealt again from its seed and its state is
+    only the two numbers (saved in the snapshots). Each game has its own, the games don't share a random state.
+    """
+    __slots__ = ("seed", "deals")
+
+    def __init__(self, seed: int = None, deals: int = 0):
+        self.seed = random.getrandbits(64) if seed is None else seed
+        self.deals = deals
+
+    def next_bits(self) -> int:
+        """Returns the 256 random bits of the next deal"""
+        digest = hashlib.blake2b(_DEAL_KEY.pack(self.seed, self.deals), digest_size=32).digest()
+        self.deals += 1
+        return int.from_bytes(digest, "little")
+
+
+_DEAL_KEY = struct.Struct("<QQ")
 
 
 class Deck:
     def __init__(self):
-        self.cards = []
-        for suit in CARD_SUITS:
-            for number in CARD_NUMBERS:
-                self.cards.append(Card(number, suit))
-    
-    def shuffle(self):
-        random.shuffle(self.cards)
-    
-    def get_hands(self, players: int, cards_per_player: int):
+        self.cards = list(CARDS)
+
+    def shuffle(self, rng: random.Random = None):
+        (random if rng is None else rng).shuffle(self.cards)
+
+    def get_hands(self, players: int, cards_per_player: int, bits: int = None):
+        """Deals the cards in the order of the deck, one to each player at a time, and the next one is the muestra.
+
+        With bits (see :meth:`DealRandom.next_bits`) a new deck is shuffled first, but only the cards that are dealt:
+        a partial Fisher-Yates shuffle, where the bits give the position of each drawn card.
+        """
         total_cards = players * cards_per_player
-        hands = [[] for _ in range(players)]
-        for i in range(total_cards):
-            hands[i % players].append(self.cards[i])
-        muestra = self.cards[total_cards]
-        return hands, muestra
+        if bits is not None:
+            cards = list(CARDS)
+            for i in range(total_cards + 1):
+                bits, j = divmod(bits, DECK_SIZE - i)
+                j += i
+                cards[i], cards[j] = cards[j], cards[i]
+            self.cards = cards
+        cards = self.cards
+        hands = [cards[i:total_cards:players] for i in range(players)]
+        return hands, cards[total_cards]
@@ -1,6 +1,6 @@
-from functools import cmp_to_key
+import json
 
-from apuestas.models.card import Card, Deck
+from apuestas.models.card import SUIT_INDEX, SUIT_MASKS, Card, DealRandom, Deck, Hand, get_trick_winner
 from apuestas.models.player import Player
 
 
@@ -9,39 +9,6 @@ __all__ = ["PLAYER1", "PLAYER2", "Apuestas"]
 PLAYER1, PLAYER2 = "red", "yellow"
 
 
-def get_round_compare_function(muestra_suit: str, current_suit: str):
-    """Given the current 'muestra' suit and current suit, it returns a function that compares two players card plays
-    and returns the one that wins"""
-    def card_comparison(first_player: Player, second_player: Player):
-        valuable_suits = (muestra_suit, current_suit)
-        first_card = first_player.current_card
-        second_card = second_player.current_card
-        if first_card.suit == second_card.suit:
-            return first_card.number - second_card.number
-        if first_card.suit not in valuable_suits and second_card.suit not in valuable_suits:
-            # Both cards have no value for this round. The result does not matter
-            # So we return 1. 
-            return 1
-        # At least one of them has a suit of the muestra or the current one.
-        if first_card.suit == muestra_suit:
-            # First one has the muestra suit. The second one, at best has the current suit
-            # So the first one wins
-            return 1
-        if second_card.suit == muestra_suit:
-            # Second one has the muestra suit. The first one, at best has the current suit
-            # So the second one wins
-            return -1
-        if first_card.suit == current_suit:
-            # First one has the current suit. The second one has a card with no value
-            # So the first one wins
-            return 1
-        # Second one has the current suit. The first one has a card with no value
-        # So the second one wins
-        return -1
-    return card_comparison
-
-
-
 class Game:
     """
     A Connect Four game.
@@ -54,7 +21,7 @@ class Game:
 
     """
 
-    def __init__(self, max_cards: int = 2):
+    def __init__(self, max_cards: int = 2, seed: int = None):
         self.players: dict[str, Player] = {}
         self.max_cards = max_cards
         self.current_amount_cards = 1
@@ -66,12 +33,26 @@ class Game:
         self.first_turn_player_index = 0
         self.first_round_player_index = 0
         self.deck = Deck()
+        # the deals only depend on the seed (random if it is None): the game is played again with it and the moves
+        self.rng = DealRandom(seed)
         self.current_state = "bet"
+        self.played_cards: list[tuple[str, Card]] = []  # (player name, card) played in the current turn
+        # incremented by each change of the game, the serialized views are cached against it and the players versions
+        self.version = 0
+        self._json = None
+        self._json_text = None
+        self._legal_bets = None
+        # what pop_move needs to undo each move of push_move
+        self._undo = []
+
+    def _get_version(self):
+        return self.version, sum(player.version for player in self.players.values())
 
     def add_player(self, player_name):
         new_player = Player(player_name)
         self.players[new_player.name] = new_player
         self.current_player_order.append(new_player.name)
+        self.version += 1
 
     def bet(self, player_name: str, bet: int):
         if player_name != self.current_player_order[self.current_player_index]:
@@ -79,20 +60,47 @@ class Game:
 
         if bet < 0 or bet > self.current_amount_cards:
             raise ValueError(f"The bet should be a number between 0 and {self.current_amount_cards}.")
-        
-        next_index = self._get_next_player_index(self.current_player_index)
-        if next_index == self.first_round_player_index:
+
+        if not self.legal_bets() >> bet & 1:
             # it is the last player. The sum of all the bets should not be equal to the amount of cards
-            bets = sum([player.current_bet for player in self.players.values()])
-            bets += bet
-            if bets == self.current_amount_cards:
-                raise ValueError(f"You can not bet {bet}. The sum can not be equal to the amount of cards.")
+            raise ValueError(f"You can not bet {bet}. The sum can not be equal to the amount of cards.")
 
         self.players[player_name].bet(bet)
 
+    def legal_bets(self) -> int:
+        """
+        Returns the mask of the bets the current player can do: the bit b is
+        set if it can bet b.
+
+        It is cached until the game changes.
+
+        """
+        version = self._get_version()
+        if self._legal_bets is not None and self._legal_bets[0] == version:
+            return self._legal_bets[1]
+        mask = (1 << (self.current_amount_cards + 1)) - 1
+        if self._get_next_player_index(self.current_player_index) == self.first_round_player_index:
+            # it is the last player. The sum of all the bets should not be equal to the amount of cards
+            forbidden_bet = self.current_amount_cards - sum(player.current_bet for player in self.players.values())
+            if forbidden_bet >= 0:
+                mask &= ~(1 << forbidden_bet)
+        self._legal_bets = (version, mask)
+        return mask
+
+    def legal_cards(self, player: Player) -> int:
+        """Returns the mask of the cards the player can play (see :class:`~apuestas.models.card.Hand`)"""
+        mask = player.current_hand.mask
+        if self.current_suit is not None:
+            # the cards of the suit of the round have to be played, if the player has any
+            suit_mask = mask & SUIT_MASKS[SUIT_INDEX[self.current_suit]]
+            if suit_mask:
+                return suit_mask
+        return mask
+
     def finish_bet_tour(self):
         self.current_player_index = self.first_round_player_index
         self.current_state = "play"
+        self.version += 1
 
     def play(self, player_name, card_number, card_suit) -> Card:
         """
@@ -112,25 +120,27 @@ class Game:
         if player.has_card(card) is False:
             raise ValueError("The player does not have this card.")
 
+        if not self.legal_cards(player) & card.bit:
+            raise ValueError(f"You have to play your card with the suit '{self.current_suit}'.")
+
         if self.current_suit is None:
             # it is the first player. He can choose any card to play
             self.current_suit = card.suit
-        elif card.suit != self.current_suit:
-            # it is not the first player. We need to check it is a valid play
-            # TODO: check if the player has a card of the correct suit
-            if player.has_card_with_suit(self.current_suit):
-                raise ValueError(f"You have to play your card with the suit '{self.current_suit}'.")
 
         player.play_card(card)
+        self.played_cards.append((player_name, card))
+        self.version += 1
 
         return card
 
     def get_round_winner(self) -> Player:
-        comparison_function = get_round_compare_function(self.current_muestra.suit, self.current_suit)
-        cmp_key = cmp_to_key(comparison_function)
-        # we sort the players depending on their cards.
-        # We only want the best one
-        return max(self.players.values(), key=cmp_key)
+        players = [self.players[player_name] for player_name in self.current_player_order]
+        # the first card played in the round defines the current suit
+        first_card = players[self.first_round_player_index].current_card
+        winner_index = get_trick_winner(
+            self.current_muestra.suit_index, first_card.suit_index, [player.current_card.id for player in players]
+        )
+        return players[winner_index]
 
     def _get_next_player_index(self, current_index):
         current_index += 1
@@ -140,13 +150,15 @@ class Game:
         return current_index
 
     def begin_turn(self):
-        self.deck.shuffle()
-
-        hands, muestra = self.deck.get_hands(len(self.current_player_order), self.current_amount_cards)
+        hands, muestra = self.deck.get_hands(
+            len(self.current_player_order), self.current_amount_cards, self.rng.next_bits()
+        )
         self.current_muestra = muestra
         for index, player_name in enumerate(self.current_player_order):
             self.players[player_name].distribute_new_hand(hands[index])
+        self.played_cards = []
         self.current_state = "bet"
+        self.version += 1
 
     def end_turn(self):
         """All the turn rounds have finished. We remove the hands and we update the points.
@@ -157,6 +169,7 @@ class Game:
         self.current_player_index = self.first_turn_player_index
         self.first_round_player_index = self.first_turn_player_index
         self.current_amount_cards += 1
+        self.version += 1
     
     def has_game_ended(self):
         return self.current_amount_cards > self.max_cards
@@ -175,6 +188,7 @@ class Game:
         # we change the index to the winner
         self.first_round_player_index = self.current_player_order.index(winner.name)
         self.current_player_index = self.first_round_player_index
+        self.version += 1
         return winner
 
     def next_player(self) -> Player:
@@ -183,6 +197,7 @@ class Game:
         if next_player_index == self.first_round_player_index:
             return None
         self.current_player_index = next_player_index
+        self.version += 1
         player_name = self.current_player_order[next_player_index]
         return self.players[player_name]
 
@@ -191,7 +206,103 @@ class Game:
         player_name = self.current_player_order[self.current_player_index]
         return self.players[player_name]
     
+    def clone(self) -> "Game":
+        """
+        Returns a copy of the game, to play other moves in it.
+
+        Only the values of the game and the players are copied: the cards are
+        shared (the list of the deck is copied, it is shuffled in place) and
+        the hands are copied as masks. The moves of push_move are not
+        copied (they can't be undone in the copy).
+
+        """
+        new_game = Game.__new__(Game)
+        new_game.__dict__.update(self.__dict__)
+        new_game.players = {}
+        for player_name, player in self.players.items():
+            new_player = Player.__new__(Player)
+            new_player.__dict__.update(player.__dict__)
+            new_player.current_hand = Hand.from_mask(player.current_hand.mask)
+            new_player._views = {}
+            new_game.players[player_name] = new_player
+        new_game.current_player_order = list(self.current_player_order)
+        new_game.played_cards = list(self.played_cards)
+        new_game.deck = Deck.__new__(Deck)
+        new_game.deck.cards = list(self.deck.cards)
+        new_game.rng = DealRandom(self.rng.seed, self.rng.deals)
+        new_game._json = None
+        new_game._json_text = None
+        new_game._legal_bets = None
+        new_game._undo = []
+        return new_game
+
+    def push_move(self, move):
+        """
+        Plays the move of the current player: a bet (a number) or a card. The
+        round and the turn are finished after their last card (the next turn
+        is not begun). Undo it with :meth:`pop_move`.
+
+        Raises :exc:`ValueError` if the move is illegal.
+
+        """
+        player = self.current_player
+        indices = self.current_player_index, self.first_round_player_index, self.first_turn_player_index
+        if self.current_state == "bet":
+            previous_bet = player.current_bet
+            self.bet(player.name, move)
+            if self.next_player() is None:
+                self.finish_bet_tour()
+            self._undo.append((indices, player, previous_bet, None, None, None))
+            return
+        current_suit = self.current_suit
+        self.play(player.name, move.number, move.suit)
+        round_cards = winner = turn_values = None
+        if self.next_player() is None:
+            round_cards = [(round_player, round_player.current_card) for round_player in self.players.values()]
+            winner = self.end_round()
+            if self.has_turn_finished():
+                turn_values = [
+                    (turn_player, turn_player.current_bet, turn_player.current_winning_cards, turn_player.points)
+                    for turn_player in self.players.values()
+                ]
+                self.end_turn()
+        self._undo.append((indices, player, current_suit, round_cards, winner, turn_values))
+
+    def pop_move(self):
+        """Undoes the last move of :meth:`push_move`. Raises :exc:`IndexError` if there are none"""
+        indices, player, previous, round_cards, winner, turn_values = self._undo.pop()
+        if isinstance(previous, int):
+            # a bet, previous is the bet the player had
+            player.current_bet = previous
+            self.current_state = "bet"
+        else:
+            # a card, previous is the suit of the round before it
+            if turn_values is not None:
+                for turn_player, bet, wins, points in turn_values:
+                    turn_player.current_bet = bet
+                    turn_player.current_winning_cards = wins
+                    turn_player.points = points
+                    turn_player.version += 1
+                self.current_amount_cards -= 1
+            if round_cards is not None:
+                for round_player, card in round_cards:
+                    round_player.current_hand.add(card)
+                    round_player.current_card = card
+                    round_player.version += 1
+                winner.current_winning_cards -= 1
+            player.current_card = None
+            self.played_cards.pop()
+            self.current_suit = previous
+        self.current_player_index, self.first_round_player_index, self.first_turn_player_index = indices
+        # the versions only grow, so the views cached for the undone states are not used again
+        self.version += 1
+        player.version += 1
+
     def to_json(self):
+        """The result is cached until the game changes, it should not be modified"""
+        version = self._get_version()
+        if self._json is not None and self._json[0] == version:
+            return self._json[1]
         result = {
             "amount_cards": self.current_amount_cards,
             "muestra": self.current_muestra.to_json(),
@@ -200,4 +311,12 @@ class Game:
             "current_player": self.current_player_order[self.current_player_index],
             "current_state": self.current_state 
         }
-        return result
\ No newline at end of file
+        self._json = (version, result)
+        return result
+
+    def to_json_text(self) -> str:
+        """The encoded to_json, cached until the game changes"""
+        version = self._get_version()
+        if self._json_text is None or self._json_text[0] != version:
+            self._json_text = (version, json.dumps(self.to_json()))
+        return self._json_text[1]
@@ -1,20 +1,26 @@
-from apuestas.models.card import Card
+import json
+
+from apuestas.models.card import SUIT_INDEX, Card, Hand
 
 
 class Player:
     def __init__(self, player_name):
         self.name = player_name
         self.points = 0
+        # incremented by each change of the player, the serialized views are cached against it
+        self.version = 0
+        self._views = {}
         self._initialize_turn()
 
     def _initialize_turn(self):
-        self.current_hand = set()
+        self.current_hand = Hand()
         self.current_winning_cards = 0
         self.current_card: Card = None
         self.current_bet = 0
 
     def distribute_new_hand(self, cards):
-        self.current_hand = set(cards)
+        self.current_hand = Hand(cards)
+        self.version += 1
 
     def calculate_round_points(self) -> int:
         if self.current_winning_cards != self.current_bet:
@@ -26,26 +32,43 @@ class Player:
         points = self.calculate_round_points()
         self.points += points
         self._initialize_turn()
+        self.version += 1
     
     def end_round(self, winning_card: Card):
         if winning_card == self.current_card:
             self.current_winning_cards += 1
         self.current_hand.remove(self.current_card)
         self.current_card = None
+        self.version += 1
 
     def bet(self, new_bet: int):
         self.current_bet = new_bet
+        self.version += 1
 
     def has_card(self, card):
         return card in self.current_hand
     
     def has_card_with_suit(self, suit):
-        return any([card.suit == suit for card in self.current_hand])
+        return self.current_hand.has_suit(SUIT_INDEX[suit])
+
+    def cards_with_suit(self, suit) -> Hand:
+        return self.current_hand.cards_with_suit(SUIT_INDEX[suit])
 
     def play_card(self, card):
         self.current_card = card
-    
+        self.version += 1
+
+    def _get_view(self, key):
+        view = self._views.get(key)
+        if view is not None and view[0] == self.version:
+            return view[1]
+        return None
+
     def to_json(self, show_all:bool=True):
+        """The result is cached until the player changes, it should not be modified"""
+        result = self._get_view(show_all)
+        if result is not None:
+            return result
         result = {
             "name": self.name,
             "points": self.points,
@@ -54,5 +77,16 @@ class Player:
             "turn_wins": self.current_winning_cards
         }
         if show_all:
-            result["hand"] = [card.to_json() for card in self.current_hand]
+            result["hand"] = self.current_hand.to_json()
+        self._views[show_all] = (self.version, result)
         return result
+
+    def to_json_text(self, show_all: bool=True) -> str:
+        """The encoded to_json, cached until the player changes"""
+        key = ("text", show_all)
+        text = self._get_view(key)
+        if text is None:
+            text = json.dumps(self.to_json(show_all))
+            self._views[key] = (self.version, text)
+        return text
+
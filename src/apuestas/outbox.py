@@ -0,0 +1,170 @@
+"""Bounded queues of outgoing messages, one for each connection.
+
+Each connection has a task that writes its messages, so sending to a player never waits for the other players and a
+slow client doesn't block the game. When the queue of a client is full, the policy of the connection decides what
+happens:
+
+- "drop_oldest": the oldest message is dropped.
+- "coalesce": all the queued messages are dropped and only the latest one is kept. Every event has the full game
+  information (or its changes and a sequence number, so the clients that use deltas ask for a resync).
+- "disconnect": the connection is closed.
+"""
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+
+from websockets.exceptions import ConnectionClosed
+
+
+POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+# close code for the clients that can't keep up ("try again later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OutboxStats:
+    queued: int = 0
+    sent: int = 0
+    dropped: int = 0
+    disconnected: int = 0
+
+    def to_json(self):
+        return {
+            "queued": self.queued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "disconnected": self.disconnected,
+        }
+
+
+# totals of all the connections
+STATS = OutboxStats()
+
+
+class Connection:
+    """
+    A websocket whose messages are sent by a writer task.
+
+    :meth:`put` queues a message without waiting. Receiving messages (with
+    :meth:`recv` or iterating) is done directly from the websocket.
+
+    """
+
+    # open connections, to report the depth of their queues
+    live: set["Connection"] = set()
+
+    def __init__(self, websocket, max_size: int = 64, policy: str = "drop_oldest"):
+        if policy not in POLICIES:
+            raise ValueError(f"The policy should be one of {', '.join(POLICIES)}.")
+        self.websocket = websocket
+        self.max_size = max_size
+        self.policy = policy
+        self.stats = OutboxStats()
+        self.max_depth = 0
+        self.closed = False
+        self._queue = deque()
+        self._ready = asyncio.Event()
+        # set when all the queued messages were sent
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._writer = asyncio.create_task(self._write())
+        self._closing = None
+        Connection.live.add(self)
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def put(self, message):
+        """Queue a message. If the queue is full, the policy of the connection is applied"""
+        if self.closed:
+            return
+        if len(self._queue) >= self.max_size:
+            if self.policy == "disconnect":
+                self._drop(len(self._queue) + 1)
+                self._queue.clear()
+                self._disconnect()
+                return
+            if self.policy == "coalesce":
+                self._drop(len(self._queue))
+                self._queue.clear()
+            else:
+                self._drop(1)
+                self._queue.popleft()
+        self._queue.append(message)
+        self.stats.queued += 1
+        STATS.queued += 1
+        self.max_depth = max(self.max_depth, len(self._queue))
+        self._idle.clear()
+        self._ready.set()
+
+    async def send(self, message):
+        """Queue a message, it doesn't wait for it to be sent"""
+        self.put(message)
+
+    async def recv(self):
+        return await self.websocket.recv()
+
+    def __aiter__(self):
+        return aiter(self.websocket)
+
+    def _drop(self, amount):
+        self.stats.dropped += amount
+        STATS.dropped += amount
+
+    def _disconnect(self):
+        logger.info("Closing a slow connection")
+        self.stats.disconnected += 1
+        STATS.disconnected += 1
+        self.closed = True
+        self._writer.cancel()
+        Connection.live.discard(self)
+        self._closing = asyncio.create_task(
+            self.websocket.close(SLOW_CONSUMER_CLOSE_CODE, "Too many messages pending.")
+        )
+
+    async def _write(self):
+        try:
+            while True:
+                while not self._queue:
+                    self._idle.set()
+                    self._ready.clear()
+                    await self._ready.wait()
+                await self.websocket.send(self._queue.popleft())
+                self.stats.sent += 1
+                STATS.sent += 1
+        except ConnectionClosed:
+            self._queue.clear()
+            self._idle.set()
+
+    async def close(self, timeout: float = 1.0):
+        """Stop the writer, after sending the queued messages (waiting at most timeout seconds)"""
+        if self.closed:
+            return
+        self.closed = True
+        Connection.live.discard(self)
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._writer.cancel()
+
+    async def shutdown(self, code: int = 1000, reason: str = ""):
+        """Send the queued messages and close the websocket"""
+        await self.close()
+        await self.websocket.close(code, reason)
+
+
+def get_stats():
+    """Returns the totals of all the connections and the depth of the queues of the open ones"""
+    depths = [connection.depth for connection in Connection.live]
+    return {
+        **STATS.to_json(),
+        "connections": len(depths),
+        "queue_depth": sum(depths),
+        "max_queue_depth": max(depths, default=0),
+    }
@@ -0,0 +1,107 @@
+"""The games that can be joined and watched, with their access keys.
+
+The games that had no activity for ``ttl`` seconds are evicted: their players are notified and disconnected and the
+game is forgotten. The expiries are kept in a heap: updating the activity of a game doesn't touch the heap, the entry
+of the game is pushed again with its new expiry when it reaches the top. So checking the expired games is O(log n) for
+each expired (or pushed again) game, whatever the amount of live games.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import secrets
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class GameRegistry:
+    """
+    Keeps the live games (actors with a ``last_activity`` time.monotonic()
+    and an ``evict()`` method) by their join and watch keys.
+
+    The new keys begin with key_prefix (see :mod:`apuestas.sharding`).
+
+    """
+
+    def __init__(self, ttl: float = 3600.0, max_games: int = 10_000, key_prefix: str = ""):
+        self.ttl = ttl
+        self.max_games = max_games
+        self.key_prefix = key_prefix
+        self.join: dict[str, object] = {}
+        self.watch: dict[str, object] = {}
+        self.evicted = 0
+        self._keys = {}  # actor -> (join key, watch key)
+        self._expiries = []  # heap of (expiry, counter, actor)
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, actor):
+        return actor in self._keys
+
+    def add(self, actor, keys: tuple[str, str] = None) -> tuple[str, str]:
+        """
+        Register a game with new keys (or with keys, the join and watch keys
+        of a restored game). Returns its join and watch keys.
+
+        Raises :exc:`ValueError` if there are too many live games.
+
+        """
+        if len(self._keys) >= self.max_games:
+            raise ValueError("Too many games, try again later.")
+        if keys is None:
+            keys = self.key_prefix + secrets.token_urlsafe(12), self.key_prefix + secrets.token_urlsafe(12)
+        join_key, watch_key = keys
+        self.join[join_key] = actor
+        self.watch[watch_key] = actor
+        self._keys[actor] = join_key, watch_key
+        heapq.heappush(self._expiries, (actor.last_activity + self.ttl, next(self._counter), actor))
+        return join_key, watch_key
+
+    def remove(self, actor):
+        """Forget a game. Its entry in the heap is skipped when it reaches the top"""
+        keys = self._keys.pop(actor, None)
+        if keys is not None:
+            join_key, watch_key = keys
+            del self.join[join_key]
+            del self.watch[watch_key]
+
+    def evict_expired(self, now: float = None) -> list:
+        """Evicts the games without activity for ttl seconds. Returns them"""
+        if now is None:
+            now = time.monotonic()
+        evicted = []
+        expiries = self._expiries
+        while expiries and expiries[0][0] <= now:
+            _, _, actor = heapq.heappop(expiries)
+            if actor not in self._keys:
+                # it was removed
+                continue
+            expiry = actor.last_activity + self.ttl
+            if expiry > now:
+                heapq.heappush(expiries, (expiry, next(self._counter), actor))
+                continue
+            self.remove(actor)
+            self.evicted += 1
+            actor.evict()
+            evicted.append(actor)
+        if evicted:
+            logger.info("Evicted %d games without activity", len(evicted))
+        return evicted
+
+    async def run_reaper(self, interval: float = None):
+        """Evicts the expired games every interval seconds (by default the ttl, at most each minute)"""
+        if interval is None:
+            interval = min(self.ttl, 60.0)
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_expired()
+
+    def stats(self):
+        return {
+            "live_games": len(self._keys),
+            "evicted_games": self.evicted,
+        }
@@ -0,0 +1,125 @@
+"""The games split between worker processes, so the server uses more than one core.
+
+In the supervisor mode (``APUESTAS_WORKERS`` greater than 1), :func:`run_supervisor` starts a worker process for each
+shard. All of them listen on the public port with ``SO_REUSEPORT``, so the kernel spreads the connections between
+them, and each one also listens on a local port of its own. A game is owned by the worker where it was started: its
+join and watch keys begin with the number of that shard (:func:`get_shard`). When a player joins a game from another
+worker, the connection is forwarded to the local port of the owner (:func:`forward`).
+"""
+import asyncio
+import logging
+import multiprocessing
+import multiprocessing.connection
+import time
+
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+
+logger = logging.getLogger(__name__)
+
+# separates the shard from the rest of the key, it is not used by secrets.token_urlsafe
+SEPARATOR = "."
+
+
+def get_key_prefix(shard: int) -> str:
+    """Returns the beginning of the keys of the games of the shard"""
+    return f"{shard}{SEPARATOR}"
+
+
+def get_shard(key: str):
+    """Returns the shard that owns the game of the key, or None if the key doesn't have one"""
+    shard, separator, _ = key.partition(SEPARATOR)
+    if not separator or not shard.isdigit():
+        return None
+    return int(shard)
+
+
+async def _pipe(source, target):
+    try:
+        async for message in source:
+            await target.send(message)
+    except ConnectionClosed:
+        pass
+
+
+async def forward(websocket, init_message, uri: str):
+    """
+    Forward the connection to the worker listening on uri: send it the init
+    message and then relay the messages in both directions until one of the
+    connections is closed.
+
+    """
+    async with connect(uri) as upstream:
+        await upstream.send(init_message)
+        tasks = [
+            asyncio.create_task(_pipe(websocket, upstream)),
+            asyncio.create_task(_pipe(upstream, websocket)),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def run_supervisor(
+    workers: int, target, min_uptime: float = 5.0, backoff: float = 1.0, max_backoff: float = 30.0,
+    max_fast_exits: int = 5,
+):
+    """
+    Run target(shard) in a process for each one of the shards, and start it
+    again if it exits. Returns when it is interrupted, or when all of them
+    were given up.
+
+    A worker that exits before min_uptime seconds (it probably fails on
+    startup) is started again after a delay that doubles from backoff up to
+    max_backoff, and after max_fast_exits of these exits in a row it is not
+    started again.
+
+    """
+    # sentinel: (shard, process, start time)
+    processes = {}
+    fast_exits = [0] * workers
+    # shard: time to start it again
+    restarts = {}
+
+    def start(shard):
+        process = multiprocessing.Process(target=target, args=(shard,), name=f"apuestas-worker-{shard}")
+        process.start()
+        processes[process.sentinel] = shard, process, time.monotonic()
+
+    for shard in range(workers):
+        start(shard)
+    try:
+        while processes or restarts:
+            timeout = max(0.0, min(restarts.values()) - time.monotonic()) if restarts else None
+            for sentinel in multiprocessing.connection.wait(list(processes), timeout):
+                shard, process, started = processes.pop(sentinel)
+                # its exit code is set when it is joined
+                process.join()
+                now = time.monotonic()
+                fast_exits[shard] = fast_exits[shard] + 1 if now - started < min_uptime else 0
+                if fast_exits[shard] >= max_fast_exits:
+                    logger.error(
+                        "Worker %d exited with code %s %d times in a row on startup, it is not started again",
+                        shard, process.exitcode, fast_exits[shard],
+                    )
+                    continue
+                delay = min(backoff * 2 ** (fast_exits[shard] - 1), max_backoff) if fast_exits[shard] else 0.0
+                logger.warning(
+                    "Worker %d exited with code %s, starting it again in %.1f s", shard, process.exitcode, delay,
+                )
+                restarts[shard] = now + delay
+            now = time.monotonic()
+            for shard, restart in list(restarts.items()):
+                if restart <= now:
+                    del restarts[shard]
+                    start(shard)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for _, process, _ in processes.values():
+            process.terminate()
+        for _, process, _ in processes.values():
+            process.join()
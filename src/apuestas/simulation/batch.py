@@ -0,0 +1,231 @@
+"""Vectorized simulation of many independent games at once with NumPy.
+
+It follows the rules of :class:`apuestas.models.game.Game`: the cards are dealt one by one starting with the
+first player of the list, the last player can not make the sum of the bets equal to the amount of cards, the
+players must follow the suit of the first card of the round and the points are computed as in
+:meth:`apuestas.models.player.Player.calculate_round_points`.
+
+The decisions are taken by policies, that choose a move for every game at the same time::
+
+    def policy(simulator: BatchSimulator, seats: np.ndarray, legal: np.ndarray) -> np.ndarray
+
+``seats`` has the player index that has to move in each game and ``legal`` is a boolean matrix with the legal
+bets (one column per bet, from 0 to the amount of cards) or the legal cards (one column per card id).
+The policy returns the chosen column of each game.
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from apuestas.models.card import CARD_ID_SUIT, DECK_SIZE, TRICK_STRENGTH, Deck, get_card
+from apuestas.models.game import Game
+
+
+__all__ = ["BatchSimulator", "random_bet", "random_card", "lowest_card", "simulate", "check_conformance"]
+
+CARD_SUIT = np.array(CARD_ID_SUIT, dtype=np.int8)
+STRENGTH = np.array(TRICK_STRENGTH, dtype=np.int8)
+
+
+def _random_choice(simulator, legal):
+    # the legal moves get a random value in [1, 2) and the illegal ones in [0, 1)
+    noise = simulator.rng.random(legal.shape, dtype=np.float32)
+    noise += legal
+    return noise.argmax(axis=1)
+
+
+def random_bet(simulator, seats, legal_bets):
+    """Bets a random legal value"""
+    return _random_choice(simulator, legal_bets)
+
+
+def random_card(simulator, seats, legal_cards):
+    """Plays a random legal card"""
+    return _random_choice(simulator, legal_cards)
+
+
+def lowest_card(simulator, seats, legal_cards):
+    """Plays the legal card with the lowest id"""
+    return legal_cards.argmax(axis=1)
+
+
+@dataclass
+class TurnRecord:
+    """Everything that happened in a turn, used to replay the games with :class:`Game`"""
+    decks: np.ndarray  # (games, 48) card ids in the order of the shuffled deck
+    bets: np.ndarray  # (games, players) bet of each player
+    cards: np.ndarray  # (games, rounds, players) card ids in the order they were played
+    winners: np.ndarray  # (games, rounds) player index that won each round
+
+
+@dataclass
+class BatchResult:
+    points: np.ndarray  # (games, players)
+    records: list[TurnRecord] = field(default_factory=list)
+
+
+class BatchSimulator:
+    """Plays ``games`` independent games of ``players`` players, from 1 card to ``max_cards`` cards"""
+
+    def __init__(self, games: int, players: int, max_cards: int = 2, seed=None,
+                 bet_policy=random_bet, play_policy=random_card, record: bool = False):
+        if players * max_cards + 1 > DECK_SIZE:
+            raise ValueError(f"There are not enough cards for {players} players and {max_cards} cards.")
+        self.games = games
+        self.players = players
+        self.max_cards = max_cards
+        self.rng = np.random.default_rng(seed)
+        self.bet_policy = bet_policy
+        self.play_policy = play_policy
+        self.record = record
+        self._rows = np.arange(games)
+        # state of the current turn, available for the policies
+        self.amount_cards = 0
+        self.hands = np.zeros((games, players, DECK_SIZE), dtype=bool)
+        self.muestra = np.zeros(games, dtype=np.int64)
+        self.bets = np.zeros((games, players), dtype=np.int64)
+        self.wins = np.zeros((games, players), dtype=np.int64)
+        self.current_suit = np.zeros(games, dtype=np.int8)
+        self.points = np.zeros((games, players), dtype=np.int64)
+
+    def run(self) -> BatchResult:
+        result = BatchResult(self.points)
+        for turn, amount_cards in enumerate(range(1, self.max_cards + 1)):
+            record = self.play_turn(amount_cards, turn % self.players)
+            if self.record:
+                result.records.append(record)
+        return result
+
+    def _deal(self, amount_cards: int) -> np.ndarray:
+        decks = self.rng.permuted(np.tile(np.arange(DECK_SIZE), (self.games, 1)), axis=1)
+        total_cards = self.players * amount_cards
+        # the card i of the deck is given to the player i % players
+        dealt = decks[:, :total_cards].reshape(self.games, amount_cards, self.players)
+        self.hands[:] = False
+        self.hands[self._rows[:, None, None], np.arange(self.players)[None, None, :], dealt] = True
+        self.muestra = decks[:, total_cards]
+        self.amount_cards = amount_cards
+        return decks
+
+    def _choose(self, policy, seats, legal):
+        choices = np.asarray(policy(self, seats, legal))
+        if choices.min() < 0 or choices.max() >= legal.shape[1] or not legal[self._rows, choices].all():
+            raise ValueError("The policy has chosen an illegal move.")
+        return choices
+
+    def _bet(self, first_player: int):
+        amount_cards = self.amount_cards
+        bet_values = np.arange(amount_cards + 1)
+        total_bets = np.zeros(self.games, dtype=np.int64)
+        self.bets[:] = 0
+        for position in range(self.players):
+            seats = np.full(self.games, (first_player + position) % self.players)
+            legal = np.ones((self.games, amount_cards + 1), dtype=bool)
+            if position == self.players - 1:
+                # the sum of all the bets should not be equal to the amount of cards
+                legal &= bet_values[None, :] != (amount_cards - total_bets)[:, None]
+            bets = self._choose(self.bet_policy, seats, legal)
+            self.bets[self._rows, seats] = bets
+            total_bets += bets
+
+    def _play_round(self, first_player: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        rows = self._rows
+        played = np.zeros((self.games, self.players), dtype=np.int64)
+        cards_order = np.zeros((self.games, self.players), dtype=np.int64)
+        for position in range(self.players):
+            seats = (first_player + position) % self.players
+            hand = self.hands[rows, seats]
+            if position == 0:
+                legal = hand
+            else:
+                # the players must play the current suit if they have it
+                same_suit = hand & (CARD_SUIT[None, :] == self.current_suit[:, None])
+                legal = np.where(same_suit.any(axis=1)[:, None], same_suit, hand)
+            cards = self._choose(self.play_policy, seats, legal)
+            if position == 0:
+                self.current_suit = CARD_SUIT[cards]
+            self.hands[rows, seats, cards] = False
+            played[rows, seats] = cards
+            cards_order[:, position] = cards
+        strengths = STRENGTH[CARD_SUIT[self.muestra][:, None], self.current_suit[:, None], played]
+        winners = strengths.argmax(axis=1)
+        self.wins[rows, winners] += 1
+        return winners, cards_order
+
+    def play_turn(self, amount_cards: int, first_player: int = 0) -> TurnRecord:
+        """Plays a turn in all the games, adding the points of the players. Returns what happened in the turn"""
+        decks = self._deal(amount_cards)
+        self._bet(first_player)
+        self.wins[:] = 0
+        round_first_player = np.full(self.games, first_player)
+        cards = np.zeros((self.games, amount_cards, self.players), dtype=np.int64)
+        winners = np.zeros((self.games, amount_cards), dtype=np.int64)
+        for round_index in range(amount_cards):
+            round_first_player, cards[:, round_index] = self._play_round(round_first_player)
+            winners[:, round_index] = round_first_player
+        self.points += np.where(self.wins == self.bets, 10 + self.wins * 5, self.wins)
+        return TurnRecord(decks, self.bets.copy(), cards, winners)
+
+
+def simulate(games: int, players: int, max_cards: int = 2, seed=None,
+             bet_policy=random_bet, play_policy=random_card) -> np.ndarray:
+    """Plays the games and returns the points of each player, a (games, players) matrix"""
+    simulator = BatchSimulator(games, players, max_cards, seed, bet_policy, play_policy)
+    return simulator.run().points
+
+
+class _ReplayDeck(Deck):
+    """A deck that deals the cards in the order given in ``next_cards``"""
+
+    def __init__(self):
+        super().__init__()
+        self.next_cards = self.cards
+
+    def get_hands(self, players: int, cards_per_player: int, bits: int = None):
+        self.cards = self.next_cards
+        return super().get_hands(players, cards_per_player)
+
+
+def _replay_game(game_index: int, players: int, max_cards: int, result: BatchResult) -> bool:
+    """Plays again the game with :class:`Game`. Returns if it got the same results"""
+    game = Game(max_cards)
+    for seat in range(players):
+        game.add_player(str(seat))
+    game.deck = _ReplayDeck()
+    for record in result.records:
+        game.deck.next_cards = [get_card(card_id) for card_id in record.decks[game_index]]
+        game.begin_turn()
+        for _ in range(players):
+            player = game.current_player
+            game.bet(player.name, int(record.bets[game_index, int(player.name)]))
+            if game.next_player() is None:
+                game.finish_bet_tour()
+        for round_index, cards in enumerate(record.cards[game_index]):
+            for card_id in cards:
+                card = get_card(card_id)
+                game.play(game.current_player.name, card.number, card.suit)
+                game.next_player()
+            if int(game.end_round().name) != record.winners[game_index, round_index]:
+                return False
+        game.end_turn()
+    if not game.has_game_ended():
+        return False
+    return all(game.players[str(seat)].points == result.points[game_index, seat] for seat in range(players))
+
+
+def check_conformance(games: int = 100, players: int = 4, max_cards: int = 7, seed=None,
+                      bet_policy=random_bet, play_policy=random_card) -> list[int]:
+    """Simulates the games and plays them again, with the same deals and moves, with :class:`Game`.
+    Returns the indexes of the games that did not get the same results (an empty list if all of them conform)"""
+    simulator = BatchSimulator(games, players, max_cards, seed, bet_policy, play_policy, record=True)
+    result = simulator.run()
+    failed_games = []
+    for game_index in range(games):
+        try:
+            conforms = _replay_game(game_index, players, max_cards, result)
+        except ValueError:
+            # the game considered illegal a move of the simulator
+            conforms = False
+        if not conforms:
+            failed_games.append(game_index)
+    return failed_games
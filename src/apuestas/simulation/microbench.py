@@ -0,0 +1,338 @@
+"""Microbenchmarks of the model layer, with baselines to compare the changes against.
+
+Each benchmark times one operation of the models (dealing, a bet, a card, finishing a round or a turn, the
+serialization...) for each amount of players and cards of a turn, in several rounds, and keeps the microseconds per
+operation of every round. The results are saved as JSON, and ``compare`` reports the benchmarks that are slower than
+in a baseline: the difference of the medians has to be larger than ``--threshold`` and significant with a one-sided
+Mann-Whitney U test of the rounds (the p-value is below ``--alpha``). The default threshold, 15%, is above the
+difference between two runs of the same code. Save a baseline and check a change with::
+
+    python -m apuestas.simulation.microbench run --output baseline.json
+    python -m apuestas.simulation.microbench run --output new.json --compare baseline.json
+
+``run --compare`` exits with status 1 if there are regressions, so it can gate a change.
+"""
+import argparse
+import gc
+import json
+import math
+import platform
+import random
+import statistics
+import sys
+import time
+
+from apuestas.models.card import CARD_SUITS, DECK_SIZE, DealRandom, Deck
+from apuestas.models.game import Game
+from apuestas.simulation.movestack import create_turn
+
+
+PLAYERS = range(2, 9)
+CARDS = range(1, 8)
+
+
+class TurnStates:
+    """Games stopped at the states the benchmarks start from, in a turn of the given players and cards"""
+
+    def __init__(self, players: int, cards: int, seed: int = 0):
+        game, moves = create_turn(players, cards, seed)
+        self.players = players
+        self.cards = cards
+        self.bet = game.clone()
+        bets, cards_played = moves[:players], moves[players:]
+        self.bets = bets
+        for move in bets:
+            game.push_move(move)
+        self.play = game.clone()
+        self.card = cards_played[0]
+        # the last card of the first round is played, the round is not finished
+        self.round = self._play_until(game, cards_played[:players])
+        # the last card of the turn is played and its round finished, the turn is not finished
+        turn = self._play_until(game.clone(), cards_played)
+        turn.end_round()
+        self.turn = turn
+
+    @staticmethod
+    def _play_until(game: Game, cards: list) -> Game:
+        """Returns a copy of the game after playing the cards, without finishing the round of the last one"""
+        game = game.clone()
+        for card in cards[:-1]:
+            game.push_move(card)
+        player = game.current_player
+        game.play(player.name, cards[-1].number, cards[-1].suit)
+        game.next_player()
+        return game
+
+
+def _deck_shuffle(states: TurnStates, number: int):
+    deck = Deck()
+    rng = random.Random(0)
+
+    def run():
+        for _ in range(number):
+            deck.shuffle(rng)
+    return run
+
+
+def _get_hands(states: TurnStates, number: int):
+    deck = Deck()
+    bits = DealRandom(0).next_bits()
+    players, cards = states.players, states.cards
+
+    def run():
+        for _ in range(number):
+            deck.get_hands(players, cards, bits)
+    return run
+
+
+def _bet(states: TurnStates, number: int):
+    games = [states.bet.clone() for _ in range(number)]
+    player_name, bet = states.bet.current_player.name, states.bets[0]
+
+    def run():
+        for game in games:
+            game.bet(player_name, bet)
+    return run
+
+
+def _play(states: TurnStates, number: int):
+    games = [states.play.clone() for _ in range(number)]
+    player_name, card = states.play.current_player.name, states.card
+
+    def run():
+        for game in games:
+            game.play(player_name, card.number, card.suit)
+    return run
+
+
+def _get_round_winner(states: TurnStates, number: int):
+    game = states.round
+
+    def run():
+        for _ in range(number):
+            game.get_round_winner()
+    return run
+
+
+def _end_round(states: TurnStates, number: int):
+    games = [states.round.clone() for _ in range(number)]
+
+    def run():
+        for game in games:
+            game.end_round()
+    return run
+
+
+def _end_turn(states: TurnStates, number: int):
+    games = [states.turn.clone() for _ in range(number)]
+
+    def run():
+        for game in games:
+            game.end_turn()
+    return run
+
+
+def _has_card_with_suit(states: TurnStates, number: int):
+    player = states.bet.current_player
+    suits = CARD_SUITS * (number // len(CARD_SUITS) + 1)
+    suits = suits[:number]
+
+    def run():
+        for suit in suits:
+            player.has_card_with_suit(suit)
+    return run
+
+
+def _game_to_json(states: TurnStates, number: int):
+    # the views are cached, the versions are changed so they are built again
+    game = states.play.clone()
+    players = list(game.players.values())
+
+    def run():
+        for _ in range(number):
+            game.version += 1
+            for player in players:
+                player.version += 1
+            game.to_json()
+    return run
+
+
+def _player_to_json(states: TurnStates, number: int):
+    player = states.bet.clone().current_player
+
+    def run():
+        for _ in range(number):
+            player.version += 1
+            player.to_json()
+    return run
+
+
+# name: function(states, number) returning a function that runs the operation number times
+BENCHMARKS = {
+    "deck_shuffle": _deck_shuffle,
+    "get_hands": _get_hands,
+    "bet": _bet,
+    "play": _play,
+    "get_round_winner": _get_round_winner,
+    "end_round": _end_round,
+    "end_turn": _end_turn,
+    "has_card_with_suit": _has_card_with_suit,
+    "game_to_json": _game_to_json,
+    "player_to_json": _player_to_json,
+}
+
+
+def get_key(name: str, players: int, cards: int) -> str:
+    return f"{name}/{players}p/{cards}c"
+
+
+def measure(setup, states: TurnStates, number: int) -> float:
+    """Returns the microseconds per operation of a round. The garbage collector is disabled while timing"""
+    run = setup(states, number)
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+    finally:
+        if enabled:
+            gc.enable()
+    return elapsed / number * 1e6
+
+
+def run_suite(players=PLAYERS, cards=CARDS, names=None, number: int = 200, rounds: int = 7) -> dict:
+    """
+    Runs the benchmarks (all of them if names is None) for each amount of
+    players and cards that can be dealt, and returns the results.
+
+    Each round runs all the benchmarks once, so a change of the speed of the
+    machine during the run spreads the samples of all of them instead of
+    moving the ones that were running.
+
+    """
+    names = list(BENCHMARKS) if names is None else names
+    # there have to be enough cards for the hands and the muestra
+    all_states = [
+        TurnStates(players_amount, cards_amount)
+        for players_amount in players for cards_amount in cards if players_amount * cards_amount + 1 <= DECK_SIZE
+    ]
+    samples = {}
+    for _ in range(rounds):
+        for states in all_states:
+            for name in names:
+                key = get_key(name, states.players, states.cards)
+                samples.setdefault(key, []).append(measure(BENCHMARKS[name], states, number))
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "number": number,
+        "rounds": rounds,
+        "results": {
+            key: {"median": statistics.median(key_samples), "samples": key_samples}
+            for key, key_samples in samples.items()
+        },
+    }
+
+
+def mann_whitney_p(baseline: list[float], new: list[float]) -> float:
+    """
+    Returns the one-sided p-value of the new samples being larger than the
+    baseline ones (Mann-Whitney U test, normal approximation with continuity
+    correction).
+
+    """
+    n1, n2 = len(baseline), len(new)
+    if not n1 or not n2:
+        return 1.0
+    u = sum(1.0 if value > base else 0.5 if value == base else 0.0 for value in new for base in baseline)
+    mean = n1 * n2 / 2
+    deviation = math.sqrt(n1 * n2 * (n1 + n2 + 1) / 12)
+    z = (u - mean - 0.5) / deviation
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def compare(baseline: dict, new: dict, threshold: float = 0.15, alpha: float = 0.01) -> list[dict]:
+    """
+    Returns the benchmarks of both results that changed: the ratio of the
+    medians is more than threshold away from 1 and the change is significant.
+    Each one has "regression" set if it is slower.
+
+    """
+    changes = []
+    for key, result in new["results"].items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        ratio = result["median"] / base["median"]
+        if ratio > 1 + threshold:
+            p_value = mann_whitney_p(base["samples"], result["samples"])
+        elif ratio < 1 - threshold:
+            p_value = mann_whitney_p(result["samples"], base["samples"])
+        else:
+            continue
+        if p_value < alpha:
+            changes.append({
+                "benchmark": key,
+                "baseline": base["median"],
+                "new": result["median"],
+                "ratio": ratio,
+                "p_value": p_value,
+                "regression": ratio > 1,
+            })
+    return changes
+
+
+def _print_changes(changes: list[dict]):
+    if not changes:
+        print("no significant changes")
+    for change in sorted(changes, key=lambda change: -change["ratio"]):
+        kind = "REGRESSION" if change["regression"] else "improvement"
+        print(f"{kind:<12} {change['benchmark']:<32} {change['baseline']:9.3f} -> {change['new']:9.3f} us "
+              f"({change['ratio']:5.2f}x, p={change['p_value']:.4f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the models, compared against a baseline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--players", type=int, nargs="+", default=list(PLAYERS))
+    run_parser.add_argument("--cards", type=int, nargs="+", default=list(CARDS))
+    run_parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS))
+    run_parser.add_argument("--number", type=int, default=200, help="operations of each round")
+    run_parser.add_argument("--rounds", type=int, default=7)
+    run_parser.add_argument("--output", help="JSON file for the results")
+    run_parser.add_argument("--compare", help="baseline to compare the results against")
+    compare_parser = commands.add_parser("compare", help="compare two results")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("new")
+    for command_parser in (run_parser, compare_parser):
+        command_parser.add_argument("--threshold", type=float, default=0.15, help="minimum change of the median")
+        command_parser.add_argument("--alpha", type=float, default=0.01, help="significance level")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        new = run_suite(args.players, args.cards, args.benchmarks, args.number, args.rounds)
+        for key, result in new["results"].items():
+            print(f"{key:<32} {result['median']:9.3f} us")
+        if args.output:
+            with open(args.output, "w") as file:
+                json.dump(new, file, indent=2)
+        if not args.compare:
+            return
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    else:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        with open(args.new) as file:
+            new = json.load(file)
+    changes = compare(baseline, new, args.threshold, args.alpha)
+    _print_changes(changes)
+    if any(change["regression"] for change in changes):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
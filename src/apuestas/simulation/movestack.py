@@ -0,0 +1,81 @@
+"""Microbenchmarks of the ways a search tries a move in a :class:`~apuestas.models.game.Game` and takes it back.
+
+It compares :meth:`Game.push_move` / :meth:`Game.pop_move` and :meth:`Game.clone` with :func:`copy.deepcopy`, in
+microseconds per operation. Run it with::
+
+    python -m apuestas.simulation.movestack --players 4 --cards 7
+"""
+import argparse
+import copy
+import time
+
+from apuestas.models.game import Game
+from apuestas.simulation.policies import RandomPolicy
+
+
+def create_turn(players: int, cards: int, seed: int = 0) -> tuple[Game, list]:
+    """Returns a game at the beginning of a turn of the given cards and the moves (bets and cards) of the turn"""
+    game = Game(cards, seed)
+    for index in range(players):
+        game.add_player(str(index))
+    game.current_amount_cards = cards
+    game.begin_turn()
+    policy = RandomPolicy(seed)
+    moves = []
+    while not game.has_turn_finished():
+        player = game.current_player
+        move = policy.bet(game, player) if game.current_state == "bet" else policy.play(game, player)
+        game.push_move(move)
+        moves.append(move)
+    for _ in moves:
+        game.pop_move()
+    return game, moves
+
+
+def _measure(function, repeat: int) -> float:
+    """Returns the microseconds of each call of function"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def benchmark(players: int = 4, cards: int = 7, repeat: int = 2000) -> dict:
+    """Returns the microseconds of each operation"""
+    game, moves = create_turn(players, cards)
+
+    def push_pop_turn():
+        for move in moves:
+            game.push_move(move)
+        for _ in moves:
+            game.pop_move()
+
+    def clone_move():
+        game.clone().push_move(moves[0])
+
+    def deepcopy_move():
+        copy.deepcopy(game).push_move(moves[0])
+
+    return {
+        "push_pop_move": _measure(push_pop_turn, repeat) / len(moves),
+        "clone": _measure(game.clone, repeat),
+        "deepcopy": _measure(lambda: copy.deepcopy(game), repeat),
+        "clone_and_move": _measure(clone_move, repeat),
+        "deepcopy_and_move": _measure(deepcopy_move, repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures push_move/pop_move and clone against deepcopy.")
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--cards", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    report = benchmark(args.players, args.cards, args.repeat)
+    for name, microseconds in report.items():
+        print(f"{name:<18} {microseconds:8.2f} us")
+    print(f"clone is {report['deepcopy'] / report['clone']:.0f} times faster than deepcopy")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Policies that choose the moves of a player in a :class:`apuestas.models.game.Game`.
+
+A policy has two methods: ``bet(game, player)`` returns the bet of the player and ``play(game, player)`` returns
+the card to play. Both are only called when it is the turn of the player, and they must return a legal move.
+"""
+import abc
+import inspect
+import random
+
+from apuestas.models.card import Card, Hand
+from apuestas.models.game import Game
+from apuestas.models.player import Player
+
+
+def get_legal_bets(game: Game) -> list[int]:
+    """Returns the bets the current player can do"""
+    mask = game.legal_bets()
+    return [bet for bet in range(game.current_amount_cards + 1) if mask >> bet & 1]
+
+
+def get_legal_cards(game: Game, player: Player) -> list[Card]:
+    """Returns the cards the player can play"""
+    return list(Hand.from_mask(game.legal_cards(player)))
+
+
+class Policy(abc.ABC):
+    @abc.abstractmethod
+    def bet(self, game: Game, player: Player) -> int:
+        """Returns the bet of the player"""
+
+    @abc.abstractmethod
+    def play(self, game: Game, player: Player) -> Card:
+        """Returns the card that the player plays"""
+
+
+def create_policy(factory, seed: int) -> Policy:
+    """Returns factory(seed=seed), or factory() if the factory doesn't take a seed (the policy is deterministic)"""
+    try:
+        parameters = inspect.signature(factory).parameters
+    except (TypeError, ValueError):
+        return factory()
+    return factory(seed=seed) if "seed" in parameters else factory()
+
+
+class RandomPolicy(Policy):
+    """Chooses a random legal move"""
+
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
+
+    def bet(self, game, player):
+        return self.random.choice(get_legal_bets(game))
+
+    def play(self, game, player):
+        return self.random.choice(get_legal_cards(game, player))
+
+
+class LowestCardPolicy(Policy):
+    """Bets the lowest legal value and plays the legal card with the lowest id"""
+
+    def bet(self, game, player):
+        return get_legal_bets(game)[0]
+
+    def play(self, game, player):
+        return get_legal_cards(game, player)[0]
@@ -0,0 +1,156 @@
+"""Headless games between policies, without the websocket server.
+
+It is the standard benchmark of the models: it reports the games and moves per second and the time spent in each
+phase of the game. Run it with::
+
+    python -m apuestas.simulation.selfplay --games 10000 --players 4 --max-cards 7 --workers 4
+"""
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from apuestas.models.game import Game
+from apuestas.simulation.policies import Policy, RandomPolicy, create_policy
+
+
+PHASES = ["begin_turn", "bet", "play", "end_round", "end_turn"]
+
+
+@dataclass
+class SelfPlayStats:
+    games: int = 0
+    moves: int = 0  # bets and played cards
+    elapsed: float = 0.0  # wall time, in seconds
+    phase_times: dict[str, float] = field(default_factory=lambda: dict.fromkeys(PHASES, 0.0))
+
+    def merge(self, other: "SelfPlayStats"):
+        """Adds the games, moves and phase times of other. The elapsed time is not changed"""
+        self.games += other.games
+        self.moves += other.moves
+        for phase, phase_time in other.phase_times.items():
+            self.phase_times[phase] += phase_time
+
+    @property
+    def games_per_second(self) -> float:
+        return self.games / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def moves_per_second(self) -> float:
+        return self.moves / self.elapsed if self.elapsed else 0.0
+
+    def report(self) -> str:
+        lines = [
+            f"games: {self.games} in {self.elapsed:.3f}s",
+            f"games/s: {self.games_per_second:.1f}",
+            f"moves/s: {self.moves_per_second:.1f}",
+        ]
+        total_time = sum(self.phase_times.values()) or 1.0
+        for phase, phase_time in self.phase_times.items():
+            lines.append(f"  {phase:<10} {phase_time:8.3f}s {100 * phase_time / total_time:5.1f}%")
+        return "\n".join(lines)
+
+
+def play_game(policies: list[Policy], max_cards: int = 7, stats: SelfPlayStats = None, seed: int = None) -> Game:
+    """Plays a full game, one player per policy. Returns the finished game.
+    The deals come from the seed (see :class:`~apuestas.models.card.DealRandom`).
+    If stats is given, the moves and the time of each phase are added to it"""
+    if stats is None:
+        stats = SelfPlayStats()
+    phase_times = stats.phase_times
+    clock = time.perf_counter
+
+    game = Game(max_cards, seed)
+    player_policies = {}
+    for index, policy in enumerate(policies):
+        player_name = str(index)
+        game.add_player(player_name)
+        player_policies[player_name] = policy
+
+    while not game.has_game_ended():
+        start = clock()
+        game.begin_turn()
+        phase_times["begin_turn"] += clock() - start
+
+        start = clock()
+        while True:
+            player = game.current_player
+            game.bet(player.name, player_policies[player.name].bet(game, player))
+            stats.moves += 1
+            if game.next_player() is None:
+                game.finish_bet_tour()
+                break
+        phase_times["bet"] += clock() - start
+
+        while not game.has_turn_finished():
+            start = clock()
+            player = game.current_player
+            card = player_policies[player.name].play(game, player)
+            game.play(player.name, card.number, card.suit)
+            stats.moves += 1
+            round_ended = game.next_player() is None
+            phase_times["play"] += clock() - start
+            if round_ended:
+                start = clock()
+                game.end_round()
+                phase_times["end_round"] += clock() - start
+
+        start = clock()
+        game.end_turn()
+        phase_times["end_turn"] += clock() - start
+
+    stats.games += 1
+    return game
+
+
+def _run_chunk(games: int, players: int, max_cards: int, policy_class: type, seed) -> SelfPlayStats:
+    # the deals of the games and the policies are seeded from the seed of the chunk
+    rng = random.Random(seed)
+    policies = [create_policy(policy_class, rng.getrandbits(32)) for _ in range(players)]
+    stats = SelfPlayStats()
+    start = time.perf_counter()
+    for _ in range(games):
+        play_game(policies, max_cards, stats, rng.getrandbits(64))
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+def run_benchmark(games: int, players: int = 4, max_cards: int = 7, workers: int = 1,
+                  policy_class: type = RandomPolicy, seed: int = 0) -> SelfPlayStats:
+    """Plays the games split in ``workers`` processes (in this process if it is 1) and returns the stats.
+    The policies are created in each process with ``policy_class(seed=...)``, or ``policy_class()`` if it doesn't
+    take a seed"""
+    stats = SelfPlayStats()
+    start = time.perf_counter()
+    if workers == 1:
+        stats.merge(_run_chunk(games, players, max_cards, policy_class, seed))
+    else:
+        chunks = [games // workers + (1 if index < games % workers else 0) for index in range(workers)]
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [
+                executor.submit(_run_chunk, chunk, players, max_cards, policy_class, seed + index)
+                for index, chunk in enumerate(chunks) if chunk
+            ]
+            for future in futures:
+                stats.merge(future.result())
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plays headless games and reports the throughput.")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--max-cards", type=int, default=7)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    stats = run_benchmark(args.games, args.players, args.max_cards, args.workers, seed=args.seed)
+    print(stats.report())
+
+
+if __name__ == "__main__":
+    main()
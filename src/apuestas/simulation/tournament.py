@@ -0,0 +1,232 @@
+"""Tournaments between policies, played in parallel, with Elo ratings.
+
+The matches are scheduled from a seed, so a tournament can be resumed from its checkpoint file: the matches already
+played are skipped. The deals of each match and the seeds of its policies come from the seed of the match, so it is
+played again in the same way (the policies with a time limit can still choose other moves). The matches are sent to
+the worker processes in chunks and the ratings are updated as soon as each chunk finishes. Run it with::
+
+    python -m apuestas.simulation.tournament --matches 200 --workers 4 --checkpoint tournament.json
+"""
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import partial
+
+from apuestas.bots.montecarlo import MonteCarloBot
+from apuestas.simulation.policies import LowestCardPolicy, RandomPolicy, create_policy
+from apuestas.simulation.selfplay import play_game
+
+
+DEFAULT_POLICIES = {
+    "random": RandomPolicy,
+    "lowest": LowestCardPolicy,
+    "montecarlo": partial(MonteCarloBot, time_limit=0.002),
+}
+
+INITIAL_RATING = 1500.0
+
+
+@dataclass
+class Match:
+    match_id: int
+    policies: list[str]  # name of the policy of each player
+    games: int
+    seed: int
+
+
+@dataclass
+class MatchResult:
+    match_id: int
+    policies: list[str]
+    points: list[list[int]]  # points of each player, for each game
+
+
+def schedule_matches(policy_names, players: int, matches: int, games_per_match: int = 1, seed: int = 0) -> list[Match]:
+    """Returns the matches of the tournament. The same arguments always give the same matches"""
+    rng = random.Random(seed)
+    policy_names = sorted(policy_names)
+    scheduled = []
+    for match_id in range(matches):
+        if len(policy_names) >= players:
+            names = rng.sample(policy_names, players)
+        else:
+            names = rng.choices(policy_names, k=players)
+        scheduled.append(Match(match_id, names, games_per_match, rng.getrandbits(32)))
+    return scheduled
+
+
+def play_matches(policies: dict, matches: list[Match], max_cards: int) -> list[MatchResult]:
+    """
+    Plays the matches in this process. policies has the factory of each
+    policy name, it is given a seed if it takes one (see
+    :func:`~apuestas.simulation.policies.create_policy`).
+
+    """
+    results = []
+    for match in matches:
+        rng = random.Random(match.seed)
+        match_policies = [create_policy(policies[name], rng.getrandbits(32)) for name in match.policies]
+        points = []
+        for _ in range(match.games):
+            game = play_game(match_policies, max_cards, seed=rng.getrandbits(64))
+            points.append([game.players[str(index)].points for index in range(len(match_policies))])
+        results.append(MatchResult(match.match_id, match.policies, points))
+    return results
+
+
+@dataclass
+class TournamentStats:
+    matches: int = 0
+    games: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def games_per_second(self) -> float:
+        return self.games / self.elapsed if self.elapsed else 0.0
+
+
+class Tournament:
+    def __init__(self, policies: dict = None, players: int = 4, max_cards: int = 7, k_factor: float = 16.0,
+                 checkpoint_path=None):
+        self.policies = DEFAULT_POLICIES if policies is None else policies
+        self.players = players
+        self.max_cards = max_cards
+        self.k_factor = k_factor
+        self.checkpoint_path = checkpoint_path
+        self.ratings = {name: INITIAL_RATING for name in self.policies}
+        self.games_played = {name: 0 for name in self.policies}
+        self.completed_matches: set[int] = set()
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            self.load_checkpoint()
+
+    def update_ratings(self, result: MatchResult):
+        """Updates the Elo ratings with each game of the match: every player plays against each other one"""
+        names = result.policies
+        for points in result.points:
+            deltas = dict.fromkeys(names, 0.0)
+            for first in range(len(names)):
+                for second in range(first + 1, len(names)):
+                    first_name, second_name = names[first], names[second]
+                    if first_name == second_name:
+                        continue
+                    if points[first] == points[second]:
+                        score = 0.5
+                    else:
+                        score = 1.0 if points[first] > points[second] else 0.0
+                    expected = 1 / (1 + 10 ** ((self.ratings[second_name] - self.ratings[first_name]) / 400))
+                    delta = self.k_factor * (score - expected) / (len(names) - 1)
+                    deltas[first_name] += delta
+                    deltas[second_name] -= delta
+            for name, delta in deltas.items():
+                self.ratings[name] += delta
+                self.games_played[name] += 1
+        self.completed_matches.add(result.match_id)
+
+    def run(self, matches: list[Match], workers: int = 1, chunk_size: int = 8, on_result=None) -> TournamentStats:
+        """Plays the matches that were not played yet. The results are applied (and on_result is called with each one
+        of them) as soon as their chunk finishes, and the checkpoint is saved after each chunk"""
+        pending = [match for match in matches if match.match_id not in self.completed_matches]
+        chunks = [pending[index:index + chunk_size] for index in range(0, len(pending), chunk_size)]
+        stats = TournamentStats()
+        start = time.perf_counter()
+
+        def apply(results):
+            for result in results:
+                self.update_ratings(result)
+                stats.matches += 1
+                stats.games += len(result.points)
+                if on_result is not None:
+                    on_result(result)
+            self.save_checkpoint()
+
+        if workers == 1:
+            for chunk in chunks:
+                apply(play_matches(self.policies, chunk, self.max_cards))
+        else:
+            with ProcessPoolExecutor(workers) as executor:
+                futures = [executor.submit(play_matches, self.policies, chunk, self.max_cards) for chunk in chunks]
+                for future in as_completed(futures):
+                    apply(future.result())
+        stats.elapsed = time.perf_counter() - start
+        return stats
+
+    def standings(self) -> list[tuple[str, float, int]]:
+        """Returns the (name, rating, games) of each policy, from the best rating to the worst"""
+        return sorted(
+            ((name, rating, self.games_played[name]) for name, rating in self.ratings.items()),
+            key=lambda standing: standing[1], reverse=True,
+        )
+
+    def save_checkpoint(self):
+        if self.checkpoint_path is None:
+            return
+        checkpoint = {
+            "ratings": self.ratings,
+            "games_played": self.games_played,
+            "completed_matches": sorted(self.completed_matches),
+        }
+        temporary_path = f"{self.checkpoint_path}.tmp"
+        with open(temporary_path, "w") as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def load_checkpoint(self):
+        with open(self.checkpoint_path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        self.ratings.update(checkpoint["ratings"])
+        self.games_played.update(checkpoint["games_played"])
+        self.completed_matches = set(checkpoint["completed_matches"])
+
+
+def scaling_report(worker_counts, matches: int = 64, games_per_match: int = 1, players: int = 4,
+                   max_cards: int = 7, chunk_size: int = 4, policies: dict = None) -> list[dict]:
+    """Plays the same tournament with each amount of workers. Returns the games per second of each one and the
+    efficiency compared to a linear scaling of the first one"""
+    report = []
+    base_rate = None
+    for workers in worker_counts:
+        tournament = Tournament(policies, players, max_cards)
+        scheduled = schedule_matches(tournament.policies, players, matches, games_per_match)
+        stats = tournament.run(scheduled, workers, chunk_size)
+        rate = stats.games_per_second
+        if base_rate is None:
+            base_rate = rate / workers
+        report.append({"workers": workers, "games_per_second": rate, "efficiency": rate / (base_rate * workers)})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plays a tournament between the default policies.")
+    parser.add_argument("--matches", type=int, default=100)
+    parser.add_argument("--games-per-match", type=int, default=1)
+    parser.add_argument("--players", type=int, default=3)
+    parser.add_argument("--max-cards", type=int, default=7)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--checkpoint", help="file to save the progress to, and to resume it from")
+    parser.add_argument("--scaling", action="store_true", help="report the throughput from 1 worker to --workers")
+    args = parser.parse_args()
+
+    if args.scaling:
+        worker_counts = sorted({2 ** power for power in range(args.workers.bit_length())} | {args.workers})
+        for row in scaling_report(worker_counts, args.matches, args.games_per_match, args.players,
+                                  args.max_cards, args.chunk_size):
+            print(f"workers: {row['workers']:3}  games/s: {row['games_per_second']:8.1f}  "
+                  f"efficiency: {100 * row['efficiency']:5.1f}%")
+        return
+
+    tournament = Tournament(players=args.players, max_cards=args.max_cards, checkpoint_path=args.checkpoint)
+    matches = schedule_matches(tournament.policies, args.players, args.matches, args.games_per_match, args.seed)
+    stats = tournament.run(matches, args.workers, args.chunk_size)
+    print(f"{stats.matches} matches, {stats.games} games in {stats.elapsed:.2f}s ({stats.games_per_second:.1f} games/s)")
+    for name, rating, games in tournament.standings():
+        print(f"{name:<12} {rating:7.1f} {games:6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""A compact binary format for the state of the games, to rebuild them without replaying all their moves.
+
+A game is packed with :mod:`struct` in a few dozen bytes: the state of its random deals, the muestra, the turn
+indices, the cards played and, for each player, its name, points, bet, wins, played card and the mask of its hand (see
+:class:`~apuestas.models.card.Hand`). A snapshot file has the packed live games and the first segment of the event log
+with the moves that are not in the snapshot (see :meth:`apuestas.eventlog.EventLog.snapshot`).
+
+Measure the time to read a snapshot with::
+
+    python -m apuestas.snapshot --games 100000 --players 2 --max-cards 7
+"""
+import argparse
+import gc
+import os
+import random
+import struct
+import tempfile
+import time
+
+from apuestas.models.card import CARD_SUITS, CARDS, SUIT_INDEX, DealRandom, Deck, Hand
+from apuestas.models.game import Game
+from apuestas.models.player import Player
+
+
+# marks the fields without a value (no muestra, no current suit, no played card)
+NONE = 255
+STATES = ["bet", "play"]
+
+_MAGIC = b"APSN"
+# magic, first segment of the event log after the snapshot, id of the next game, amount of games
+_FILE_HEADER = struct.Struct("<4sIII")
+# game id, records of the game to skip in the event log, length of the keys (followed by the keys in UTF-8 separated
+# by spaces and the packed game)
+_ENTRY = struct.Struct("<IIB")
+# max cards, amount of cards, muestra, current suit, current player, first player of the turn, first player of the
+# round, state, amount of players, amount of played cards, seed and amount of deals (see DealRandom)
+_GAME = struct.Struct("<10BQI")
+# length of the name (followed by the name in UTF-8), points, bet, wins, played card, hand mask
+_PLAYER = struct.Struct("<BIBBBQ")
+# index of the player (in the order of the game) and id of each played card
+_PLAYED = struct.Struct("<BB")
+_GAME_UNPACK_FROM = _GAME.unpack_from
+_PLAYER_UNPACK_FROM = _PLAYER.unpack_from
+_PLAYED_ITER_UNPACK = _PLAYED.iter_unpack
+
+
+def pack_game(game: Game) -> bytes:
+    """Returns the packed state of the game"""
+    order = game.current_player_order
+    parts = [_GAME.pack(
+        game.max_cards,
+        game.current_amount_cards,
+        NONE if game.current_muestra is None else game.current_muestra.id,
+        NONE if game.current_suit is None else SUIT_INDEX[game.current_suit],
+        game.current_player_index,
+        game.first_turn_player_index,
+        game.first_round_player_index,
+        STATES.index(game.current_state),
+        len(order),
+        len(game.played_cards),
+        game.rng.seed,
+        game.rng.deals,
+    )]
+    for player_name in order:
+        player = game.players[player_name]
+        name = player_name.encode()
+        parts.append(_PLAYER.pack(
+            len(name),
+            player.points,
+            player.current_bet,
+            player.current_winning_cards,
+            NONE if player.current_card is None else player.current_card.id,
+            player.current_hand.mask,
+        ))
+        parts.append(name)
+    parts.append(bytes(index for played in game.played_cards for index in (order.index(played[0]), played[1].id)))
+    return b"".join(parts)
+
+
+def unpack_game(data: bytes, offset: int = 0) -> tuple[Game, int]:
+    """
+    Returns the game packed at offset of data and the offset after it.
+
+    It is most of the time of the restore of the live games, so the game
+    and its players are built without their ``__init__`` (like
+    :meth:`~apuestas.models.game.Game.clone` does).
+
+    """
+    (max_cards, amount_cards, muestra, suit, player_index, first_turn_index, first_round_index, state, players,
+     played, seed, deals) = _GAME_UNPACK_FROM(data, offset)
+    offset += _GAME.size
+    game_players = {}
+    order = []
+    for _ in range(players):
+        name_length, points, bet, wins, card, mask = _PLAYER_UNPACK_FROM(data, offset)
+        offset += _PLAYER.size
+        name = data[offset:offset + name_length].decode()
+        offset += name_length
+        hand = Hand.__new__(Hand)
+        hand.mask = mask
+        hand._json = None
+        player = Player.__new__(Player)
+        player.name = name
+        player.points = points
+        player.version = 0
+        player._views = {}
+        player.current_hand = hand
+        player.current_winning_cards = wins
+        player.current_card = None if card == NONE else CARDS[card]
+        player.current_bet = bet
+        game_players[name] = player
+        order.append(name)
+    played_cards = data[offset:offset + 2 * played]
+    offset += 2 * played
+    game = Game.__new__(Game)
+    game.players = game_players
+    game.max_cards = max_cards
+    game.current_amount_cards = amount_cards
+    game.current_muestra = None if muestra == NONE else CARDS[muestra]
+    game.current_suit = None if suit == NONE else CARD_SUITS[suit]
+    game.winner = None
+    game.current_player_order = order
+    game.current_player_index = player_index
+    game.first_turn_player_index = first_turn_index
+    game.first_round_player_index = first_round_index
+    game.deck = Deck()
+    game.rng = rng = DealRandom.__new__(DealRandom)
+    rng.seed = seed
+    rng.deals = deals
+    game.current_state = STATES[state]
+    game.played_cards = [(order[index], CARDS[card_id]) for index, card_id in _PLAYED_ITER_UNPACK(played_cards)]
+    game.version = 0
+    game._json = None
+    game._json_text = None
+    game._legal_bets = None
+    game._undo = []
+    return game, offset
+
+
+def write_snapshot(path: str, first_segment: int, next_game_id: int, entries):
+    """
+    Writes the entries, (game id, records to skip, keys, packed game)
+    tuples, to the snapshot in path.
+
+    The file is replaced when the new one has been synced, so a crash
+    leaves the previous snapshot.
+
+    """
+    entries = list(entries)
+    parts = [_FILE_HEADER.pack(_MAGIC, first_segment, next_game_id, len(entries))]
+    for game_id, skip, keys, packed_game in entries:
+        keys = " ".join(keys).encode()
+        parts.append(_ENTRY.pack(game_id, skip, len(keys)))
+        parts.append(keys)
+        parts.append(packed_game)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(b"".join(parts))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+
+def read_snapshot(path: str) -> tuple[int, int, list[tuple[int, int, tuple[str, ...], Game]]]:
+    """
+    Returns the first segment of the event log after the snapshot in path,
+    the id of the next game and the (game id, records to skip, keys, game)
+    tuples of its games.
+
+    Raises :exc:`ValueError` if the file is not a snapshot.
+
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    magic, first_segment, next_game_id, amount = _FILE_HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError(f"{path} is not a snapshot.")
+    offset = _FILE_HEADER.size
+    entries = []
+    entry_size = _ENTRY.size
+    unpack_entry = _ENTRY.unpack_from
+    for _ in range(amount):
+        game_id, skip, keys_length = unpack_entry(data, offset)
+        offset += entry_size
+        keys = tuple(data[offset:offset + keys_length].decode().split())
+        game, offset = unpack_game(data, offset + keys_length)
+        entries.append((game_id, skip, keys, game))
+    return first_segment, next_game_id, entries
+
+
+class long_lived_objects:
+    """
+    Context manager to create many objects that are kept, like the games of
+    a recovery: the garbage collector is disabled meanwhile, otherwise its
+    collections traverse all of them, which takes longer than creating them.
+    The objects that existed before are also frozen (see :func:`gc.freeze`),
+    so an explicit collection meanwhile does not traverse them.
+
+    Both are undone at the exit: the objects are collected as usual after
+    the recovery (the games that end are freed).
+
+    """
+
+    def __enter__(self):
+        self._enabled = gc.isenabled()
+        gc.disable()
+        gc.freeze()
+
+    def __exit__(self, *exc_info):
+        gc.unfreeze()
+        if self._enabled:
+            gc.enable()
+
+
+def create_games(games: int, players: int, max_cards: int, seed: int = 0) -> list[Game]:
+    """Returns games stopped at random moves of random policies"""
+    from apuestas.eventlog import play_bet, play_card
+    from apuestas.simulation.policies import RandomPolicy
+
+    rng = random.Random(seed)
+    policy = RandomPolicy(seed)
+    result = []
+    for _ in range(games):
+        game = Game(max_cards, rng.getrandbits(64))
+        for index in range(players):
+            game.add_player(str(index))
+        for _ in range(rng.randrange(players * max_cards * (max_cards + 1))):
+            if game.has_turn_finished():
+                game.begin_turn()
+            player = game.current_player
+            if game.current_state == "bet":
+                play_bet(game, game.current_player_index, policy.bet(game, player))
+            else:
+                play_card(game, game.current_player_index, policy.play(game, player).id)
+            if game.has_game_ended():
+                break
+        result.append(game)
+    return result
+
+
+def benchmark(games: int, players: int = 2, max_cards: int = 7) -> dict:
+    """Writes a snapshot of live games and reads it. Returns its size and the time to read it"""
+    live_games = create_games(games, players, max_cards)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "events.snapshot")
+        start = time.perf_counter()
+        write_snapshot(path, 0, games, ((game_id, 0, (), pack_game(game)) for game_id, game in enumerate(live_games)))
+        write_seconds = time.perf_counter() - start
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        with long_lived_objects():
+            read_snapshot(path)
+        read_seconds = time.perf_counter() - start
+    return {
+        "games": games,
+        "bytes": size,
+        "write_seconds": write_seconds,
+        "read_seconds": read_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the time to write and read a snapshot of live games.")
+    parser.add_argument("--games", type=int, default=100_000)
+    parser.add_argument("--players", type=int, default=2)
+    parser.add_argument("--max-cards", type=int, default=7)
+    args = parser.parse_args()
+    report = benchmark(args.games, args.players, args.max_cards)
+    print(f"games: {report['games']}  snapshot: {report['bytes'] / 1e6:.1f} MB  "
+          f"write: {report['write_seconds']:.2f} s  read: {report['read_seconds']:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
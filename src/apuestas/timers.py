@@ -0,0 +1,168 @@
+"""A hierarchical timing wheel, to keep the deadlines of the moves of all the games.
+
+The time is divided in ticks. The first wheel has a slot for each one of the next ``wheel_size`` ticks, the second
+wheel a slot for each ``wheel_size`` ticks after them, and so on. Scheduling, rescheduling and cancelling a timer only
+moves it between slots, so they are O(1) whatever the amount of timers. When the first wheel completes a revolution,
+the timers of the next slot of the second wheel are spread in the first one (and so on for the other wheels).
+
+A single task advances the wheel, instead of one event loop timer for each game. Compare the cost of rearming the
+timers with the amount of games with::
+
+    python -m apuestas.timers --games 1000 10000 100000
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+    __slots__ = ("expiry", "callback", "_slot")
+
+    def __init__(self, callback):
+        self.expiry = 0  # tick
+        self.callback = callback
+        self._slot = None
+
+    @property
+    def active(self) -> bool:
+        return self._slot is not None
+
+    def cancel(self):
+        if self._slot is not None:
+            self._slot.discard(self)
+            self._slot = None
+
+
+class TimingWheel:
+    def __init__(self, tick: float = 0.1, wheel_size: int = 64, levels: int = 4, clock=time.monotonic):
+        self.tick = tick
+        self.wheel_size = wheel_size
+        self.levels = levels
+        self.clock = clock
+        self.wheels = [[set() for _ in range(wheel_size)] for _ in range(levels)]
+        # ticks covered by a slot of each wheel
+        self._slot_ticks = [wheel_size ** level for level in range(levels)]
+        self._max_ticks = wheel_size ** levels - 1
+        self.start = clock()
+        self.current = 0  # last tick processed
+        self.fired = 0
+
+    def __len__(self):
+        return sum(len(slot) for wheel in self.wheels for slot in wheel)
+
+    def schedule(self, delay: float, callback) -> Timer:
+        """Calls callback (without arguments) in delay seconds"""
+        timer = Timer(callback)
+        self.reschedule(timer, delay)
+        return timer
+
+    def reschedule(self, timer: Timer, delay: float):
+        """Moves the timer to delay seconds from now"""
+        timer.cancel()
+        ticks = max(1, round((self.clock() - self.start + delay) / self.tick) - self.current)
+        timer.expiry = self.current + min(ticks, self._max_ticks)
+        self._insert(timer)
+
+    def _insert(self, timer: Timer):
+        ticks = timer.expiry - self.current
+        level = 0
+        while level < self.levels - 1 and ticks >= self._slot_ticks[level + 1]:
+            level += 1
+        slot = self.wheels[level][(timer.expiry // self._slot_ticks[level]) % self.wheel_size]
+        slot.add(timer)
+        timer._slot = slot
+
+    def _cascade(self, level: int):
+        """Spreads the timers of the current slot of the wheel in the lower wheels"""
+        slot = self.wheels[level][(self.current // self._slot_ticks[level]) % self.wheel_size]
+        timers = list(slot)
+        slot.clear()
+        for timer in timers:
+            self._insert(timer)
+
+    def advance(self, now: float = None) -> int:
+        """Processes the ticks until now, calling the callbacks of the expired timers. Returns how many fired"""
+        if now is None:
+            now = self.clock()
+        target = int((now - self.start) / self.tick)
+        fired = 0
+        while self.current < target:
+            self.current += 1
+            for level in range(1, self.levels):
+                if self.current % self._slot_ticks[level]:
+                    break
+                self._cascade(level)
+            slot = self.wheels[0][self.current % self.wheel_size]
+            if not slot:
+                continue
+            timers = list(slot)
+            slot.clear()
+            for timer in timers:
+                timer._slot = None
+                fired += 1
+                try:
+                    timer.callback()
+                except Exception:
+                    logger.exception("Error in a timer callback")
+        self.fired += fired
+        return fired
+
+    async def run(self):
+        """Advances the wheel each tick"""
+        while True:
+            await asyncio.sleep(self.tick)
+            self.advance()
+
+
+def benchmark(games_counts, rearms: int = 100_000, tick: float = 0.1) -> list[dict]:
+    """Schedules a timer for each game, then rearms random timers (as if each game made a move) while the time
+    advances one tick every 1000 rearms. Returns the time per rearm, with the wheel and with event loop timers"""
+    import random
+
+    report = []
+    for games in games_counts:
+        rng = random.Random(0)
+        now = [0.0]
+        wheel = TimingWheel(tick, clock=lambda: now[0])
+        timers = [wheel.schedule(rng.uniform(1, 60), lambda: None) for _ in range(games)]
+        order = [rng.randrange(games) for _ in range(rearms)]
+        start = time.perf_counter()
+        for index, game in enumerate(order):
+            wheel.reschedule(timers[game], 60.0)
+            if index % 1000 == 0:
+                now[0] += tick
+                wheel.advance()
+        wheel_time = (time.perf_counter() - start) / rearms
+
+        loop = asyncio.new_event_loop()
+        try:
+            handles = [loop.call_later(rng.uniform(1, 60), lambda: None) for _ in range(games)]
+            start = time.perf_counter()
+            for game in order:
+                handles[game].cancel()
+                handles[game] = loop.call_later(60.0, lambda: None)
+            loop_time = (time.perf_counter() - start) / rearms
+            for handle in handles:
+                handle.cancel()
+        finally:
+            loop.close()
+        report.append({"games": games, "wheel_rearm_us": wheel_time * 1e6, "loop_rearm_us": loop_time * 1e6})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the cost of rearming the move timers.")
+    parser.add_argument("--games", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    parser.add_argument("--rearms", type=int, default=100_000)
+    args = parser.parse_args()
+    for row in benchmark(args.games, args.rearms):
+        print(f"games: {row['games']:8}  wheel: {row['wheel_rearm_us']:6.2f} us/rearm  "
+              f"event loop timers: {row['loop_rearm_us']:6.2f} us/rearm")
+
+
+if __name__ == "__main__":
+    main()
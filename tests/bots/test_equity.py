@@ -0,0 +1,90 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from apuestas.bots.equity import EquityEntry, EquityTable, generate_entries, get_hand_pattern, write_table
+from apuestas.models.card import SUIT_INDEX, Card, get_card
+
+
+class TestHandPattern:
+    def test_other_suits_are_equivalent(self):
+        muestra_suit = SUIT_INDEX["Oro"]
+        hand = [Card(1, "Oro"), Card(3, "Espada"), Card(2, "Espada"), Card(7, "Copa")]
+        same_hand = [Card(12, "Oro"), Card(1, "Basto"), Card(4, "Basto"), Card(5, "Espada")]
+        assert get_hand_pattern(hand, muestra_suit) == get_hand_pattern(same_hand, muestra_suit)
+
+    def test_muestra_suit_is_not_equivalent(self):
+        hand = [Card(1, "Oro"), Card(2, "Espada")]
+        assert get_hand_pattern(hand, SUIT_INDEX["Oro"]) != get_hand_pattern(hand, SUIT_INDEX["Espada"])
+
+    def test_rank_classes(self):
+        muestra_suit = SUIT_INDEX["Copa"]
+        assert get_hand_pattern([Card(1, "Oro")], muestra_suit) == get_hand_pattern([Card(12, "Oro")], muestra_suit)
+        assert get_hand_pattern([Card(1, "Oro")], muestra_suit) != get_hand_pattern([Card(11, "Oro")], muestra_suit)
+        assert get_hand_pattern([Card(8, "Oro")], muestra_suit) != get_hand_pattern([Card(7, "Oro")], muestra_suit)
+
+
+class TestEquityEntry:
+    def test_best_bet(self):
+        entry = EquityEntry(100, 1.0, [0.2, 0.6, 0.2])
+        assert entry.expected_points(1) == pytest.approx(0.6 * 15 + 0.2 * 2)
+        assert entry.best_bet([0, 1, 2]) == 1
+        assert entry.best_bet([0, 2]) == 2
+
+
+class TestEquityTable:
+    def test_write_and_get(self, tmp_path):
+        path = tmp_path / "equity.bin"
+        write_table(path, generate_entries([2, 3], max_cards=2, games=500, min_samples=1, seed=1))
+        table = EquityTable(path)
+
+        entry = table.get(2, 2, 0, [Card(1, "Oro"), Card(3, "Oro")], Card(5, "Oro"))
+        assert entry is not None
+        assert len(entry.probabilities) == 3
+        assert sum(entry.probabilities) == pytest.approx(1.0, abs=1e-3)
+        assert 0 <= entry.expected_wins <= 2
+        # there are no tables for 4 players
+        assert table.get(4, 2, 0, [Card(1, "Oro"), Card(3, "Oro")], Card(5, "Oro")) is None
+        table.close()
+
+    def test_all_simulated_hands_are_found(self, tmp_path):
+        from apuestas.simulation.batch import BatchSimulator
+
+        path = tmp_path / "equity.bin"
+        games = 300
+        write_table(path, generate_entries([3], max_cards=3, games=games, min_samples=1, seed=2))
+        table = EquityTable(path)
+
+        record = BatchSimulator(games, 3, 3, seed=2).play_turn(3)
+        samples = 0
+        for deck in record.decks:
+            hand = [get_card(card_id) for card_id in deck[0:9:3]]
+            entry = table.get(3, 3, 0, hand, get_card(deck[9]))
+            assert entry is not None
+            samples += 1
+        assert samples == games
+        assert len(table) > 0
+
+    def test_invalid_file(self, tmp_path):
+        path = tmp_path / "equity.bin"
+        path.write_bytes(b"0" * 64)
+
+        with pytest.raises(ValueError):
+            len(EquityTable(path))
+
+
+def test_bot_uses_the_table(tmp_path):
+    from apuestas.bots.montecarlo import MonteCarloBot
+    from apuestas.models.game import Game
+
+    path = tmp_path / "equity.bin"
+    write_table(path, generate_entries([2], max_cards=1, games=2000, min_samples=1, seed=1))
+    game = Game(1)
+    game.add_player("red")
+    game.add_player("blue")
+    game.begin_turn()
+    player = game.current_player
+    entry = EquityTable(path).get(2, 1, 0, player.current_hand, game.current_muestra)
+
+    bot = MonteCarloBot(time_limit=10, equity_table=EquityTable(path), equity_min_samples=1)
+    assert bot.bet(game, player) == entry.best_bet([0, 1])
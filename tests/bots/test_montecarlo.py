@@ -0,0 +1,139 @@
+import itertools
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from apuestas.bots import montecarlo
+from apuestas.bots.montecarlo import MonteCarloBot, copy_game
+from apuestas.models.card import Card
+from apuestas.models.game import Game
+from apuestas.simulation.policies import RandomPolicy, get_legal_bets, get_legal_cards
+from apuestas.simulation.selfplay import play_game
+
+
+class TestMonteCarloBot:
+    def setup_method(self):
+        self.game = Game(3)
+        self.game.add_player("red")
+        self.game.add_player("blue")
+        self.game.add_player("green")
+        self.game.current_amount_cards = 3
+        self.game.begin_turn()
+        self.bot = MonteCarloBot(time_limit=0.01, seed=1)
+
+    def test_copy_game(self):
+        hands = {name: player.current_hand.mask for name, player in self.game.players.items()}
+        new_game = copy_game(self.game, hands)
+
+        assert new_game.to_json() == self.game.to_json()
+        for name, player in self.game.players.items():
+            assert new_game.players[name] is not player
+            assert new_game.players[name].current_hand == player.current_hand
+
+    def test_bet(self):
+        player = self.game.current_player
+        bet = self.bot.bet(self.game, player)
+        assert bet in get_legal_bets(self.game)
+
+    def test_bet_respects_time_limit(self, monkeypatch):
+        # each reading of the clock advances it 1 ms
+        clock = (index / 1000 for index in itertools.count())
+        monkeypatch.setattr(montecarlo, "time", SimpleNamespace(perf_counter=lambda: next(clock)))
+        self.bot.bet(self.game, self.game.current_player)
+        # the first world is always sampled, and then one for each reading up to the 10 ms of the time limit
+        assert len(self.bot._worlds) == 11
+
+    def test_play(self):
+        self.game.finish_bet_tour()
+        first_player = self.game.current_player
+        self.game.play(first_player.name, *self._any_card(first_player))
+        self.game.next_player()
+
+        player = self.game.current_player
+        card = self.bot.play(self.game, player)
+        assert card in get_legal_cards(self.game, player)
+
+    def test_worlds_are_consistent(self):
+        self.game.finish_bet_tour()
+        first_player = self.game.current_player
+        number, suit = self._any_card(first_player)
+        self.game.play(first_player.name, number, suit)
+        self.game.next_player()
+        player = self.game.current_player
+
+        worlds = list(self.bot._get_worlds(self.game, player, time.perf_counter() + 0.005))
+
+        assert len(worlds) > 0
+        muestra = self.game.current_muestra
+        for world in worlds:
+            assert player.name not in world
+            assert Card(number, suit).bit & world[first_player.name]
+            all_cards = player.current_hand.mask
+            for hand in world.values():
+                assert hand.bit_count() == 3
+                assert hand & all_cards == 0
+                assert hand & muestra.bit == 0
+                all_cards |= hand
+
+    def test_worlds_are_reused_in_the_same_turn(self):
+        player = self.game.current_player
+        self.bot.bet(self.game, player)
+        sampled_worlds = list(self.bot._worlds)
+
+        assert len(sampled_worlds) > 0
+        worlds = self.bot._get_worlds(self.game, player, time.perf_counter())
+        assert next(worlds) is sampled_worlds[0]
+
+    def test_solver_falls_back_to_rollouts(self, monkeypatch):
+        game = Game(7, seed=3)
+        for index in range(6):
+            game.add_player(str(index))
+        game.current_amount_cards = 7
+        game.begin_turn()
+        game.finish_bet_tour()
+        player = game.current_player
+        searches = []
+        solve = montecarlo.solve
+
+        def count_search(game, player_name, utility, max_nodes, deadline):
+            searches.append(max_nodes)
+            return solve(game, player_name, utility, max_nodes, deadline)
+        monkeypatch.setattr(montecarlo, "solve", count_search)
+        bot = MonteCarloBot(time_limit=0.01, solver_cards=7, solver_nodes=100, seed=1)
+        assert bot.play(game, player) in get_legal_cards(game, player)
+        # the first search is too large (the turn takes seconds to solve), the worlds are played with rollouts
+        assert searches == [100]
+        assert len(bot._worlds) > 1
+
+    def test_solver_stops_at_time_limit(self):
+        game = Game(7, seed=2)
+        for index in range(8):
+            game.add_player(str(index))
+        game.current_amount_cards = 5
+        game.begin_turn()
+        game.finish_bet_tour()
+        player = game.current_player
+        # the searches of 8 players with 5 cards take longer than the time limit, there is no limit of positions
+        bot = MonteCarloBot(time_limit=0.05, solver_cards=5, solver_nodes=10 ** 9, seed=1)
+        start = time.perf_counter()
+        assert bot.play(game, player) in get_legal_cards(game, player)
+        assert time.perf_counter() - start < 0.07
+
+    def test_single_legal_card(self):
+        self.game.finish_bet_tour()
+        player = self.game.current_player
+        player.distribute_new_hand([Card(1, "Oro")])
+        assert self.bot.play(self.game, player) == Card(1, "Oro")
+
+    @staticmethod
+    def _any_card(player):
+        card = next(iter(player.current_hand))
+        return card.number, card.suit
+
+
+@pytest.mark.parametrize("players", [2, 4])
+def test_full_game_with_bots(players):
+    policies = [MonteCarloBot(time_limit=0.001, seed=index) for index in range(players - 1)] + [RandomPolicy(seed=1)]
+    game = play_game(policies, max_cards=3)
+    assert game.has_game_ended() is True
@@ -0,0 +1,129 @@
+import random
+import time
+
+import pytest
+
+from apuestas.bots.montecarlo import copy_game, play_card
+from apuestas.bots.solver import (
+    DEADLINE_CHECK_NODES, SUPPORTED_CARDS_IN_PLAY, SUPPORTED_NODES, SearchLimitExceeded, Solver, get_points_utility,
+    solve, solve_all,
+)
+from apuestas.models.card import Card
+from apuestas.models.game import Game
+from apuestas.simulation.policies import get_legal_cards
+
+
+def minimax(game, player_name, utility):
+    """Searches all the moves without any pruning"""
+    if game.has_turn_finished():
+        wins = game.players[player_name].current_winning_cards
+        return utility(wins) if utility else wins
+    player = game.current_player
+    values = []
+    for card in get_legal_cards(game, player):
+        new_game = copy_game(game, {name: other.current_hand.mask for name, other in game.players.items()})
+        play_card(new_game, new_game.players[player.name], card)
+        values.append(minimax(new_game, player_name, utility))
+    return max(values) if player.name == player_name else min(values)
+
+
+def create_game(players, cards, seed, played_cards=0):
+    """Returns a game in the play state after playing random cards"""
+    rng = random.Random(seed)
+    game = Game(7, seed)
+    for index in range(players):
+        game.add_player(str(index))
+    game.current_amount_cards = cards
+    game.begin_turn()
+    game.finish_bet_tour()
+    for _ in range(played_cards):
+        player = game.current_player
+        play_card(game, player, rng.choice(get_legal_cards(game, player)))
+    return game
+
+
+class TestSolver:
+    def setup_method(self):
+        self.game = Game(3)
+        for name in ["red", "blue", "green"]:
+            self.game.add_player(name)
+        self.game.current_amount_cards = 2
+        self.game.begin_turn()
+        self.game.current_muestra = Card(1, "Copa")
+        hands = {
+            "red": [Card(1, "Oro"), Card(2, "Espada")],
+            "blue": [Card(3, "Oro"), Card(1, "Espada")],
+            "green": [Card(2, "Copa"), Card(12, "Basto")],
+        }
+        for name, cards in hands.items():
+            self.game.players[name].distribute_new_hand(cards)
+        self.game.finish_bet_tour()
+
+    def test_solve(self):
+        # green has the only card of the muestra suit and the only Basto, so it wins both rounds
+        assert solve_all(self.game) == {"red": 0, "blue": 0, "green": 2}
+
+    def test_best_card(self):
+        card, value = Solver(self.game, "red").best_card()
+        assert card in self.game.players["red"].current_hand
+        assert value == 0
+
+    def test_best_card_with_utility(self):
+        # green trumps the round red can win, so red can get the points of a bet of 0 but not of a bet of 1
+        card, value = Solver(self.game, "red", get_points_utility(0)).best_card()
+        assert card in self.game.players["red"].current_hand
+        assert value == 10
+
+        card, value = Solver(self.game, "red", get_points_utility(1)).best_card()
+        assert value == 0
+
+    def test_best_card_raises_if_not_player_turn(self):
+        with pytest.raises(ValueError) as e:
+            Solver(self.game, "blue").best_card()
+
+        assert "It isn't the turn of the player." in str(e.value)
+
+    @pytest.mark.parametrize("seed", range(12))
+    def test_solve_matches_minimax(self, seed):
+        players = 2 + seed % 3
+        cards = 1 + seed % 4
+        game = create_game(players, cards, seed, seed % (players * cards))
+        for player_name in game.current_player_order:
+            for utility in [None, get_points_utility(seed % 3)]:
+                assert solve(game, player_name, utility) == minimax(game, player_name, utility)
+
+    @pytest.mark.parametrize("players,cards", [(2, 9), (3, 6), (4, 4), (6, 3), (8, 2)])
+    def test_solve_supported_range(self, players, cards):
+        # the supported turns are solved within the positions of the docs, with and without utility
+        assert players * cards <= SUPPORTED_CARDS_IN_PLAY
+        for seed in range(10):
+            game = create_game(players, cards, seed)
+            for player_name in game.current_player_order:
+                for utility in [None, get_points_utility(seed % 3)]:
+                    solve(game, player_name, utility, max_nodes=SUPPORTED_NODES)
+
+    def test_solve_seven_cards(self):
+        game = create_game(4, 7, seed=1)
+        solver = Solver(game, "0")
+        value = solver.solve()
+        assert 0 <= value <= 7
+        assert len(solver.table) > 0
+
+    def test_max_nodes(self):
+        game = create_game(6, 7, seed=1)
+        solver = Solver(game, "0", max_nodes=1000)
+        with pytest.raises(SearchLimitExceeded):
+            solver.solve()
+        assert solver.nodes == 1001
+        # a search within the limit is not changed
+        small_game = create_game(4, 3, seed=1)
+        assert solve(small_game, "0", max_nodes=1000) == solve(small_game, "0")
+
+    def test_deadline(self):
+        game = create_game(6, 7, seed=1)
+        solver = Solver(game, "0", deadline=time.perf_counter())
+        with pytest.raises(SearchLimitExceeded) as e:
+            solver.solve()
+        assert "The deadline of the search has passed." in str(e.value)
+        # the clock is only read once every some positions
+        assert solver.nodes == DEADLINE_CHECK_NODES
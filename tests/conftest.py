@@ -0,0 +1,18 @@
+import json
+
+import pytest
+
+
+def _get_game_state(game):
+    return (
+        json.dumps(game.to_json()),
+        [game.players[name].to_json_text() for name in game.current_player_order],
+        list(game.played_cards),
+        (game.first_round_player_index, game.first_turn_player_index),
+    )
+
+
+@pytest.fixture
+def get_state():
+    """Returns a function that returns the values of a game to compare it with another one"""
+    return _get_game_state
@@ -1,6 +1,12 @@
+import copy
+import pickle
+
 import pytest
 
-from apuestas.models.card import Card, Deck
+from apuestas.models.card import (
+    CARD_ID_NUMBER, CARD_ID_SUIT, CARD_SUITS, DECK_SIZE, SUIT_INDEX, Card, DealRandom, Deck, Hand, get_card, get_card_id,
+    get_trick_winner
+)
 
 
 class TestCard:
@@ -10,6 +16,106 @@ class TestCard:
         assert number == card.number
         assert suit == card.suit
 
+    @pytest.mark.parametrize("number,suit", [(0, "Basto"), (13, "Oro"), (1, "Corazon"), ([1], "Oro")])
+    def test_init_raises_if_invalid(self, number, suit):
+        with pytest.raises(ValueError) as e:
+            Card(number, suit)
+
+        assert "Invalid card." in str(e.value)
+
+    def test_cards_are_unique(self):
+        assert Card(1, "Basto") is Card(1, "Basto")
+        assert Card(1, "Basto") == Card(1, "Basto")
+        assert Card(1, "Basto") != Card(1, "Oro")
+        assert len({Card(1, "Basto"), Card(1, "Basto"), Card(1, "Oro")}) == 2
+
+    @pytest.mark.parametrize("number,suit,expected_id", [(1, "Oro", 0), (12, "Oro", 11), (1, "Espada", 12), (12, "Copa", 47)])
+    def test_card_id(self, number, suit, expected_id):
+        card = Card(number, suit)
+        assert card.id == expected_id
+        assert get_card_id(number, suit) == expected_id
+        assert get_card(expected_id) is card
+        assert CARD_ID_NUMBER[expected_id] == number
+        assert CARD_SUITS[CARD_ID_SUIT[expected_id]] == suit
+
+    def test_to_json(self):
+        card = Card(3, "Oro")
+        assert card.to_json() == {"number": 3, "suit": "Oro"}
+        assert card.to_json() is card.to_json()
+
+    def test_copy_keeps_the_card_unique(self):
+        card = Card(5, "Copa")
+        assert copy.deepcopy(card) is card
+        assert pickle.loads(pickle.dumps(card)) is card
+
+
+class TestTrickWinner:
+    @pytest.mark.parametrize("muestra_suit,current_suit,cards,expected_winner", [
+        # same suit: the order is 1, 3, 12, 11, ..., 4, 2
+        ("Oro", "Basto", [(2, "Basto"), (12, "Basto"), (5, "Basto")], 1),
+        ("Oro", "Basto", [(12, "Basto"), (3, "Basto"), (1, "Basto")], 2),
+        ("Oro", "Basto", [(4, "Basto"), (2, "Basto")], 0),
+        # the muestra suit beats the current one
+        ("Oro", "Basto", [(1, "Basto"), (2, "Oro"), (3, "Basto")], 1),
+        ("Oro", "Basto", [(1, "Basto"), (2, "Oro"), (4, "Oro")], 2),
+        # other suits have no value
+        ("Oro", "Basto", [(2, "Basto"), (1, "Copa"), (1, "Espada")], 0),
+        # the current suit is the muestra suit
+        ("Copa", "Copa", [(7, "Copa"), (1, "Oro"), (11, "Copa")], 2),
+    ])
+    def test_get_trick_winner(self, muestra_suit, current_suit, cards, expected_winner):
+        card_ids = [get_card_id(number, suit) for number, suit in cards]
+        assert get_trick_winner(SUIT_INDEX[muestra_suit], SUIT_INDEX[current_suit], card_ids) == expected_winner
+
+
+class TestHand:
+    def test_init(self):
+        hand = Hand([Card(1, "Basto"), Card(12, "Oro"), Card(1, "Basto")])
+        assert len(hand) == 2
+        assert Card(1, "Basto") in hand
+        assert Card(12, "Oro") in hand
+        assert Card(1, "Oro") not in hand
+        assert hand == set([Card(1, "Basto"), Card(12, "Oro")])
+        assert hand == Hand([Card(12, "Oro"), Card(1, "Basto")])
+        # cards are iterated in the order of their id
+        assert list(hand) == [Card(12, "Oro"), Card(1, "Basto")]
+
+    def test_empty(self):
+        hand = Hand()
+        assert len(hand) == 0
+        assert not hand
+        assert hand == set()
+        assert list(hand) == []
+
+    def test_add_and_remove(self):
+        hand = Hand()
+        hand.add(Card(4, "Copa"))
+        assert hand == set([Card(4, "Copa")])
+
+        hand.remove(Card(4, "Copa"))
+        assert hand == set()
+
+        with pytest.raises(KeyError):
+            hand.remove(Card(4, "Copa"))
+
+    def test_suits(self):
+        hand = Hand([Card(1, "Basto"), Card(7, "Basto"), Card(2, "Oro")])
+        assert hand.has_suit(SUIT_INDEX["Basto"]) is True
+        assert hand.has_suit(SUIT_INDEX["Oro"]) is True
+        assert hand.has_suit(SUIT_INDEX["Copa"]) is False
+        assert hand.cards_with_suit(SUIT_INDEX["Basto"]) == set([Card(1, "Basto"), Card(7, "Basto")])
+        assert hand.suit_mask(SUIT_INDEX["Oro"]) == Card(2, "Oro").bit
+        assert hand.suit_mask(SUIT_INDEX["Espada"]) == 0
+
+    def test_to_json_is_cached_until_the_hand_changes(self):
+        hand = Hand([Card(2, "Oro"), Card(1, "Basto")])
+        result = hand.to_json()
+        assert result == [{"number": 2, "suit": "Oro"}, {"number": 1, "suit": "Basto"}]
+        assert hand.to_json() is result
+
+        hand.remove(Card(2, "Oro"))
+        assert hand.to_json() == [{"number": 1, "suit": "Basto"}]
+
 
 class TestDeck:
     def test_init(self):
@@ -17,6 +123,7 @@ class TestDeck:
         amunt_of_suits = 4
         amunt_of_card_per_suit = 12
         assert len(deck.cards) == amunt_of_suits * amunt_of_card_per_suit
+        assert [card.id for card in deck.cards] == list(range(DECK_SIZE))
 
     def test_shufle(self):
         first_deck = Deck()
@@ -40,3 +147,36 @@ class TestDeck:
             assert hands[i][0] == deck.cards[i]
         assert muestra == deck.cards[players * cards]
 
+    @pytest.mark.parametrize("players,cards", [(2, 1), (4, 7), (6, 7)])
+    def test_get_hands_with_bits(self, players, cards):
+        rng = DealRandom(1)
+        hands, muestra = Deck().get_hands(players, cards, rng.next_bits())
+        dealt = [card for hand in hands for card in hand] + [muestra]
+        assert all(len(hand) == cards for hand in hands)
+        assert len(set(dealt)) == players * cards + 1
+        # the same bits deal the same cards, whatever the order of the deck
+        deck = Deck()
+        deck.shuffle()
+        assert deck.get_hands(players, cards, DealRandom(1).next_bits()) == (hands, muestra)
+        assert Deck().get_hands(players, cards, rng.next_bits()) != (hands, muestra)
+
+    def test_get_hands_with_bits_is_uniform(self):
+        rng = DealRandom(2)
+        counts = [0] * DECK_SIZE
+        for _ in range(4800):
+            _, muestra = Deck().get_hands(2, 3, rng.next_bits())
+            counts[muestra.id] += 1
+        assert 50 < min(counts) and max(counts) < 150
+
+
+class TestDealRandom:
+    def test_seed(self):
+        rng = DealRandom(3)
+        bits = [rng.next_bits() for _ in range(3)]
+        assert len(set(bits)) == 3
+        assert rng.deals == 3
+        # the bits of a deal only depend on the seed and the deal
+        assert DealRandom(3, deals=2).next_bits() == bits[2]
+        assert DealRandom(4).next_bits() != bits[0]
+        assert DealRandom().seed != DealRandom().seed
+
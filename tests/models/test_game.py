@@ -1,7 +1,9 @@
+import json
+import random
 from unittest.mock import patch
 import pytest
 
-from apuestas.models.card import Card
+from apuestas.models.card import Card, Hand
 from apuestas.models.player import Player
 from apuestas.models.game import Game
 
@@ -52,6 +54,17 @@ class TestGame:
         for player in self.game.players.values():
             assert len(player.current_hand) == cards_per_player
     
+    def test_begin_turn_with_seed(self):
+        games = [Game(self.max_cards, seed=5) for _ in range(2)]
+        for game in games:
+            for player_name in self.game.current_player_order:
+                game.add_player(player_name)
+            game.begin_turn()
+        hands = [{name: player.current_hand.mask for name, player in game.players.items()} for game in games]
+        assert hands[0] == hands[1]
+        assert games[0].current_muestra is games[1].current_muestra
+        assert games[0].rng.deals == 1
+
     @pytest.mark.parametrize("turn_index, round_index, player_index, expected_index", [(0, 0, 2, 1), (1, 2, 1, 2), (2, 1, 0, 0)])
     def test_end_turn(self, turn_index, round_index, player_index, expected_index):
         self.game.first_turn_player_index = turn_index
@@ -104,6 +117,23 @@ class TestGame:
         assert self.game.current_player_index == expacted_winner_index
         assert self.game.first_round_player_index == expacted_winner_index
 
+    @pytest.mark.parametrize("round_index, cards, expected_winner_index", [
+        (0, [Card(3, "Espada"), Card(1, "Espada"), Card(1, "Oro")], 1),
+        (1, [Card(3, "Espada"), Card(1, "Oro"), Card(2, "Basto")], 2),
+        (2, [Card(3, "Oro"), Card(1, "Espada"), Card(5, "Oro")], 0),
+    ])
+    def test_get_round_winner(self, round_index, cards, expected_winner_index):
+        self.game.current_muestra = Card(1, "Basto")
+        self.game.first_round_player_index = round_index
+        for index, player_name in enumerate(self.game.current_player_order):
+            self.game.players[player_name].distribute_new_hand([cards[index]])
+            self.game.players[player_name].play_card(cards[index])
+        expected_winner_name = self.game.current_player_order[expected_winner_index]
+
+        winner = self.game.get_round_winner()
+
+        assert winner.name == expected_winner_name
+
     def test_has_turn_finished(self):
         assert self.game.has_turn_finished() is True
 
@@ -167,6 +197,7 @@ class TestGame:
 
         assert played_card == card
         assert self.game.players[player_name].current_card == card
+        assert self.game.played_cards == [(player_name, card)]
     
     def test_play_as_second_player(self):
         self.game.begin_turn()
@@ -315,10 +346,65 @@ class TestGame:
         assert self.game.first_turn_player_index == 2
         assert self.game.has_game_ended() is True
 
+    def test_to_json_is_cached_until_the_game_changes(self):
+        self.game.begin_turn()
+        result = self.game.to_json()
+        assert self.game.to_json() is result
+        assert self.game.to_json_text() == json.dumps(result)
+
+        player_name = self.game.current_player.name
+        self.game.bet(player_name, 1)
+        assert self.game.to_json() is not result
+        assert self.game.to_json()["players_info"][player_name]["turn_bet"] == 1
+        assert json.loads(self.game.to_json_text()) == self.game.to_json()
+
+        result = self.game.to_json()
+        self.game.next_player()
+        assert self.game.to_json()["current_player"] != result["current_player"]
+
+
+class TestLegalMoves:
+    def setup_method(self):
+        self.game = Game(3, seed=4)
+        for player_name in ["red", "blue", "green"]:
+            self.game.add_player(player_name)
+        self.game.current_amount_cards = 3
+        self.game.begin_turn()
+
+    def test_legal_bets(self):
+        game = self.game
+        assert game.legal_bets() == 0b1111
+        game.push_move(2)
+        assert game.legal_bets() == 0b1111
+        game.push_move(0)
+        # the last player can not make the sum equal to the amount of cards
+        assert game.legal_bets() == 0b1101
+        with pytest.raises(ValueError):
+            game.bet("green", 1)
+        game.pop_move()
+        game.push_move(1)
+        assert game.legal_bets() == 0b1110
+
+    def test_legal_cards(self):
+        game = self.game
+        for bet in [0, 0, 0]:
+            game.push_move(bet)
+        first_player = game.current_player
+        assert game.legal_cards(first_player) == first_player.current_hand.mask
+        game.push_move(next(iter(first_player.current_hand)))
+        for player in game.players.values():
+            legal = Hand.from_mask(game.legal_cards(player))
+            assert all(player.has_card(card) for card in legal)
+            if player.has_card_with_suit(game.current_suit):
+                assert legal == player.cards_with_suit(game.current_suit)
+            else:
+                assert legal == player.current_hand
+
 
 class TestSimulateGame:
     """Simulate the game but with some workflows. But, to make it easier to test,
     the cards will not be shuffled, and hte max cards will be 2. 
+    Remember the order of the cards of a suit is 1, 3, 12, 11, 10, 9, 8, 7, 6, 5, 4, 2
     """
     def test_full_game(self):
         # prepare game
@@ -337,7 +423,7 @@ class TestSimulateGame:
 
         # start game
         # First turn
-        with patch("apuestas.models.card.random"):
+        with patch("apuestas.models.card.DealRandom.next_bits", return_value=0):
             game.begin_turn()
         
         assert len(red_player.current_hand) == 1
@@ -385,10 +471,10 @@ class TestSimulateGame:
 
         # First Round finished
         round_winner = game.end_round()
-        assert round_winner.name == green_player.name
-        assert red_player.current_winning_cards == 0
+        assert round_winner.name == red_player.name
+        assert red_player.current_winning_cards == 1
         assert blue_player.current_winning_cards == 0
-        assert green_player.current_winning_cards == 1
+        assert green_player.current_winning_cards == 0
 
         # The first turn has also finished
         assert game.has_turn_finished() is True
@@ -396,20 +482,20 @@ class TestSimulateGame:
         assert blue_player.points == 0
         assert green_player.points == 0
         assert game.first_turn_player_index == 0
-        assert game.first_round_player_index == 2  # Was the player that won
-        assert game.current_player_index == 2  # Was the player that won
+        assert game.first_round_player_index == 0  # Was the player that won
+        assert game.current_player_index == 0  # Was the player that won
 
         game.end_turn()
-        assert red_player.points == 0
+        assert red_player.points == 15
         assert blue_player.points == 0
-        assert green_player.points == 15
+        assert green_player.points == 0
         assert game.first_turn_player_index == 1
         assert game.first_round_player_index == 1
         assert game.current_player_index == 1
         assert game.has_game_ended() is False
 
         # Start Second turn
-        with patch("apuestas.models.card.random"):
+        with patch("apuestas.models.card.DealRandom.next_bits", return_value=0):
             game.begin_turn()
 
         assert len(red_player.current_hand) == 2
@@ -486,27 +572,90 @@ class TestSimulateGame:
 
         # Round finished
         round_winner = game.end_round()
-        assert round_winner.name == blue_player.name
-        assert red_player.current_winning_cards == 0
-        assert blue_player.current_winning_cards == 1
+        assert round_winner.name == red_player.name
+        assert red_player.current_winning_cards == 1
+        assert blue_player.current_winning_cards == 0
         assert green_player.current_winning_cards == 1
         assert game.first_turn_player_index == 1
-        assert game.first_round_player_index == 1  # Was the player that won
-        assert game.current_player_index == 1
+        assert game.first_round_player_index == 0  # Was the player that won
+        assert game.current_player_index == 0
 
         # The second turn has also finished
         assert game.has_turn_finished() is True
-        assert red_player.points == 0
+        assert red_player.points == 15
         assert blue_player.points == 0
-        assert green_player.points == 15
+        assert green_player.points == 0
 
         game.end_turn()
-        assert red_player.points == 10
-        assert blue_player.points == 15
-        assert green_player.points == 16
+        assert red_player.points == 16
+        assert blue_player.points == 0
+        assert green_player.points == 1
         assert game.first_turn_player_index == 2
         assert game.first_round_player_index == 2
         assert game.current_player_index == 2
 
         # We have arrived to the maximum cards and the game has finished
-        assert game.has_game_ended() is True
\ No newline at end of file
+        assert game.has_game_ended() is True
+
+
+class TestMoveStack:
+    @pytest.mark.parametrize("players, cards", [(2, 1), (3, 3), (4, 7)])
+    def test_push_pop_move(self, players, cards, get_state):
+        from apuestas.simulation.policies import RandomPolicy
+
+        game = Game(cards, seed=players)
+        for index in range(players):
+            game.add_player(str(index))
+        game.current_amount_cards = cards
+        game.begin_turn()
+        policy = RandomPolicy(cards)
+        states = []
+        while not game.has_turn_finished():
+            states.append(get_state(game))
+            player = game.current_player
+            game.push_move(policy.bet(game, player) if game.current_state == "bet" else policy.play(game, player))
+        assert game.current_amount_cards == cards + 1
+        assert sum(player.points for player in game.players.values()) > 0
+        while states:
+            game.pop_move()
+            assert get_state(game) == states.pop()
+        with pytest.raises(IndexError):
+            game.pop_move()
+
+    def test_push_illegal_move(self):
+        game = Game(2, seed=1)
+        game.add_player("red")
+        game.add_player("blue")
+        game.begin_turn()
+        game.push_move(1)
+        with pytest.raises(ValueError):
+            game.push_move(0)
+        game.pop_move()
+        game.push_move(0)
+        assert game.current_state == "bet"
+
+    def test_clone(self, get_state):
+        game = Game(3, seed=2)
+        game.add_player("red")
+        game.add_player("blue")
+        game.begin_turn()
+        game.push_move(0)
+        new_game = game.clone()
+        assert get_state(new_game) == get_state(game)
+        new_game.push_move(0)
+        new_game.push_move(next(iter(new_game.current_player.current_hand)))
+        assert new_game.current_state == "play"
+        assert game.current_state == "bet"
+        assert game.players["blue"].current_card is None
+        new_game.pop_move()
+        new_game.pop_move()
+        # the moves before the clone are not undone in it
+        with pytest.raises(IndexError):
+            new_game.pop_move()
+        # the clone deals the same cards
+        assert new_game.rng.next_bits() == game.rng.next_bits()
+        # the deck of the clone is shuffled on its own
+        cards = list(game.deck.cards)
+        new_game.deck.shuffle(random.Random(0))
+        assert game.deck.cards == cards
+        assert new_game.deck.cards != cards
@@ -1,3 +1,5 @@
+import json
+
 import pytest
 
 from apuestas.models.card import Card
@@ -73,3 +75,38 @@ class TestPlayer:
         assert player.has_card_with_suit("Oro") is True
         assert player.has_card_with_suit("Espada") is False
         assert player.has_card_with_suit("Copa") is False
+
+    def test_cards_with_suit(self):
+        player = Player("red")
+        cards = [Card(1, "Basto"), Card(5, "Basto"), Card(1, "Oro")]
+        player.distribute_new_hand(cards)
+
+        assert player.cards_with_suit("Basto") == set([Card(1, "Basto"), Card(5, "Basto")])
+        assert player.cards_with_suit("Copa") == set()
+
+    def test_to_json(self):
+        player = Player("red")
+        player.distribute_new_hand([Card(1, "Basto"), Card(1, "Oro")])
+
+        assert player.to_json(False) == {
+            "name": "red",
+            "points": 0,
+            "played_card": None,
+            "turn_bet": 0,
+            "turn_wins": 0,
+        }
+        assert player.to_json()["hand"] == [{"number": 1, "suit": "Oro"}, {"number": 1, "suit": "Basto"}]
+
+    def test_to_json_is_cached_until_the_player_changes(self):
+        player = Player("red")
+        player.distribute_new_hand([Card(1, "Basto"), Card(1, "Oro")])
+        result = player.to_json()
+        assert player.to_json() is result
+        assert player.to_json(False) is not result
+        assert player.to_json_text() == json.dumps(result)
+
+        player.play_card(Card(1, "Oro"))
+        assert player.to_json()["played_card"] == {"number": 1, "suit": "Oro"}
+        player.end_round(Card(1, "Oro"))
+        assert player.to_json()["hand"] == [{"number": 1, "suit": "Basto"}]
+        assert json.loads(player.to_json_text()) == player.to_json()
@@ -0,0 +1,30 @@
+import asyncio
+import json
+
+
+class FakeConnection:
+    """A connection of a player that keeps the events put in it"""
+
+    def __init__(self):
+        self.events = []
+
+    def put(self, message):
+        self.events.append(json.loads(message))
+
+    async def send(self, message):
+        self.put(message)
+
+    async def shutdown(self, code=1000, reason=""):
+        self.close_code = code
+
+
+async def wait_commands(actor):
+    while not actor._queue.empty():
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+
+async def wait_turn(game, player_name):
+    """Waits for the bots to play"""
+    while not game.has_game_ended() and (game.current_muestra is None or game.current_player.name != player_name):
+        await asyncio.sleep(0.001)
@@ -0,0 +1,243 @@
+import asyncio
+
+import pytest
+
+from apuestas.actor import Bet, GameActor, Info, Leave, Play, Ready, Timeouts
+from apuestas.models.game import Game
+from apuestas.simulation.policies import LowestCardPolicy, get_legal_bets
+from apuestas.timers import TimingWheel
+
+from tests.server.conftest import FakeConnection, wait_commands, wait_turn
+
+
+class TestGameActor:
+    def test_commands_before_start(self):
+        async def run():
+            actor = GameActor(Game(max_cards=2), "key")
+            task = actor.start()
+            red, blue = FakeConnection(), FakeConnection()
+            assert await actor.join("red", red)
+            assert await actor.join("blue", blue)
+            actor.submit(Bet("blue", blue, 0))
+            actor.submit(Ready("blue", blue, "other key"))
+            actor.submit(Ready("blue", blue, "key"))
+            # the game starts when the first player is ready
+            actor.submit(Bet("blue", blue, 0))
+            actor.submit(Leave("red", red))
+            actor.submit(Leave("blue", blue))
+            await task
+            assert [event.get("message") for event in blue.events] == [
+                None,  # "start"
+                "Invalid event type. We are in state 'start_ack'",
+                "Invalid game_key",
+                "The game has not started.",
+                None,  # "left" of red
+            ]
+            # the commands queued together are applied in the same batch
+            assert actor.stats.commands == 8
+            assert actor.stats.batches == 3
+        asyncio.run(run())
+
+    def test_join_full_game(self):
+        async def run():
+            actor = GameActor(Game(max_cards=2), "key")
+            task = actor.start()
+            assert await actor.join("red", FakeConnection())
+            assert await actor.join("blue", None, bot=LowestCardPolicy())
+            connection = FakeConnection()
+            assert not await actor.join("blue", connection)
+            assert connection.events == [{"type": "error", "message": "The game is full."}]
+            actor.submit(Leave("red", None))
+            await task
+        asyncio.run(run())
+
+    def test_take_seat_of_player_that_left(self):
+        async def run():
+            actor = GameActor(Game(max_cards=2), "key", seat_keys={"red": "red key", "blue": "blue key"})
+            task = actor.start()
+            red, blue = FakeConnection(), FakeConnection()
+            assert await actor.join("red", red)
+            assert await actor.join("blue", blue)
+            actor.submit(Leave("red", red))
+            # the seats can only be taken again in the restored games, even with their keys
+            assert not await actor.join("red", blue, seat_key="red key")
+            assert not await actor.join("red", FakeConnection())
+            actor.submit(Leave("blue", blue))
+            await task
+        asyncio.run(run())
+
+    def test_moves_of_player_that_left(self):
+        async def run():
+            game = Game(max_cards=2)
+            actor = GameActor(game, "key")
+            task = actor.start()
+            red, blue = FakeConnection(), FakeConnection()
+            policy = LowestCardPolicy()
+            assert await actor.join("red", red)
+            assert await actor.join("blue", blue)
+            actor.submit(Ready("red", red, "key"))
+            actor.submit(Leave("blue", blue))
+            # red plays alone, the moves of blue are played when it is its turn
+            await wait_turn(game, "red")
+            while not game.has_game_ended():
+                player = game.players["red"]
+                if game.current_state == "bet":
+                    actor.submit(Bet("red", red, policy.bet(game, player)))
+                else:
+                    card = policy.play(game, player)
+                    actor.submit(Play("red", red, card.number, card.suit))
+                await wait_commands(actor)
+                await wait_turn(game, "red")
+            actor.submit(Leave("red", red))
+            await task
+
+            assert {"type": "left", "player": "blue"} in red.events
+            assert [event["type"] for event in red.events][-1] == "game_ended"
+            assert not any(event["type"] == "error" for event in red.events)
+        asyncio.run(asyncio.wait_for(run(), 5))
+
+    def test_resync_keeps_sequence_of_other_players(self):
+        async def run():
+            game = Game(max_cards=2)
+            actor = GameActor(game, "key")
+            task = actor.start()
+            red, blue = FakeConnection(), FakeConnection()
+            assert await actor.join("red", red, deltas=True)
+            assert await actor.join("blue", blue, deltas=True)
+            actor.submit(Ready("red", red, "key"))
+            await wait_commands(actor)
+            seq = blue.events[-1]["seq"]
+            # the information of the game is built again, as if it had changed
+            game.version += 1
+            actor.submit(Info("red", red, event_type="resync"))
+            await wait_commands(actor)
+            assert red.events[-1]["type"] == "resync"
+            assert red.events[-1]["seq"] == seq
+            player = game.current_player
+            actor.submit(Bet(player.name, {"red": red, "blue": blue}[player.name], 0))
+            await wait_commands(actor)
+            # blue receives the next sequence number, without a gap
+            assert blue.events[-1]["type"] == "bet"
+            assert blue.events[-1]["seq"] == seq + 1
+            assert "game_delta" in blue.events[-1]
+            actor.submit(Leave("red", red))
+            actor.submit(Leave("blue", blue))
+            await task
+        asyncio.run(run())
+
+    def test_game_against_bot(self):
+        async def run():
+            game = Game(max_cards=3)
+            actor = GameActor(game, "key")
+            task = actor.start()
+            connection = FakeConnection()
+            policy = LowestCardPolicy()
+            assert await actor.join("red", connection)
+            assert await actor.join("blue", None, bot=LowestCardPolicy())
+            actor.submit(Ready("red", connection, "key"))
+            await wait_turn(game, "red")
+            while not game.has_game_ended():
+                player = game.players["red"]
+                if game.current_state == "bet":
+                    actor.submit(Bet("red", connection, policy.bet(game, player)))
+                else:
+                    card = policy.play(game, player)
+                    actor.submit(Play("red", connection, card.number, card.suit))
+                await wait_commands(actor)
+                await wait_turn(game, "red")
+            actor.submit(Info("red", connection))
+            actor.submit(Leave("red", connection))
+            await task
+
+            event_types = [event["type"] for event in connection.events]
+            assert event_types[0] == "start"
+            assert event_types.count("start_turn") == 3
+            assert event_types[-2:] == ["game_ended", "game_info"]
+            assert "error" not in event_types
+            assert connection.events[-1]["game_info"] == game.to_json()
+            assert actor.stats.max_latency >= actor.stats.mean_latency > 0
+        asyncio.run(run())
+
+    def test_illegal_moves(self):
+        async def run():
+            game = Game(max_cards=2)
+            actor = GameActor(game, "key")
+            task = actor.start()
+            red, blue = FakeConnection(), FakeConnection()
+            await actor.join("red", red)
+            await actor.join("blue", blue)
+            actor.submit(Ready("red", red, "key"))
+            actor.submit(Ready("blue", blue, "key"))
+            actor.submit(Bet("blue", blue, 0))
+            actor.submit(Play("red", red, 1, "Oro"))
+            await wait_commands(actor)
+            assert blue.events[-1] == {"type": "error", "message": "It isn't your turn."}
+            assert red.events[-1] == {"type": "error", "message": "Invalid event type. We are in state 'play'"}
+
+            actor.submit(Bet("red", red, get_legal_bets(game)[0]))
+            await wait_commands(actor)
+            assert red.events[-1]["type"] == blue.events[-1]["type"] == "bet"
+            actor.submit(Leave("red", red))
+            actor.submit(Leave("blue", blue))
+            await task
+        asyncio.run(run())
+
+    def test_evict(self):
+        async def run():
+            actor = GameActor(Game(max_cards=2), "key")
+            task = actor.start()
+            red, blue = FakeConnection(), FakeConnection()
+            await actor.join("red", red)
+            await actor.join("blue", blue)
+            actor.evict()
+            await wait_commands(actor)
+            await asyncio.sleep(0)
+            for connection in [red, blue]:
+                assert connection.events[-1] == {"type": "error", "message": "The game has expired."}
+                assert connection.close_code == 1001
+            actor.submit(Leave("red", red))
+            actor.submit(Leave("blue", blue))
+            await task
+            assert not await actor.join("green", FakeConnection())
+        asyncio.run(run())
+
+    @pytest.mark.parametrize("move, turn, expected_timeouts, expected_moves", [
+        # the bet of red, each time the deadline expires
+        (5, None, 1, 2),
+        # all the moves of the turn of red
+        (None, 5, 2, 4),
+    ])
+    def test_timeouts(self, move, turn, expected_timeouts, expected_moves):
+        async def run():
+            now = [0.0]
+            wheel = TimingWheel(tick=1.0, clock=lambda: now[0])
+            game = Game(max_cards=2)
+            actor = GameActor(game, "key", timeouts=Timeouts(wheel, move, turn))
+            task = actor.start()
+            red = FakeConnection()
+            await actor.join("red", red)
+            await actor.join("blue", None, bot=LowestCardPolicy())
+            actor.submit(Ready("red", red, "key"))
+            await wait_commands(actor)
+            await wait_turn(game, "red")
+            assert actor.moves == 0
+
+            now[0] = 4
+            wheel.advance()
+            await wait_commands(actor)
+            assert actor.moves == 0
+            now[0] = 5
+            wheel.advance()
+            while actor.moves < expected_moves:
+                await asyncio.sleep(0.001)
+            await wait_turn(game, "red")
+            assert [event["player"] for event in red.events if event["type"] == "timeout"] == ["red"] * expected_timeouts
+            if turn:
+                # the 1 card turn has finished
+                assert game.current_amount_cards == 2
+            else:
+                assert game.current_state == "play"
+            actor.submit(Leave("red", red))
+            await task
+            assert not actor._move_timer.active and not actor._turn_timer.active
+        asyncio.run(run())
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from apuestas.connections import Connections, get_player_to_move
+from apuestas.delta import DeltaStream, apply_delta, diff
+from apuestas.models.card import Hand
+from apuestas.models.game import Game
+
+
+class TestDelta:
+    @pytest.mark.parametrize("old, new, expected_changes", [
+        ({"a": 1, "b": 2}, {"a": 1, "b": 3}, {"b": 3}),
+        ({"a": {"b": 1, "c": 2}}, {"a": {"b": 1, "c": 3}}, {"a": {"c": 3}}),
+        ({"a": [1, 2]}, {"a": [1, 3]}, {"a": [1, 3]}),
+        ({"a": None}, {"a": {"b": 1}}, {"a": {"b": 1}}),
+        ({"a": 1, "b": 2}, {"a": 1}, {"b": None}),
+        ({}, {"a": None}, {"a": None}),
+    ])
+    def test_diff(self, old, new, expected_changes):
+        changes = diff(old, new)
+        assert changes == expected_changes
+        assert apply_delta(old, changes) == {**new, **{key: None for key in old.keys() - new.keys()}}
+
+    def test_game_deltas(self):
+        game = Game(max_cards=2)
+        for player_name in ["red", "blue", "green"]:
+            game.add_player(player_name)
+        game.begin_turn()
+        stream = DeltaStream()
+        game_info = apply_delta({}, stream.publish(game.to_json()))
+        for player_name in game.current_player_order:
+            game.bet(player_name, 0)
+            game.next_player()
+            game_info = apply_delta(game_info, stream.publish(game.to_json()))
+        assert game_info == game.to_json()
+        assert stream.seq == 4
+
+
+class TestConnections:
+    def setup_method(self):
+        self.game = Game(max_cards=2)
+        self.game.add_player("red")
+        self.game.add_player("blue")
+        self.game.begin_turn()
+        self.connected = Connections({"red": object(), "blue": object()})
+
+    def test_encode(self):
+        connected = self.connected
+        connected.enable_deltas("red")
+        connected.publish(self.game)
+        event = {"type": "bet"}
+        full_event = {"type": "bet", "game_info": self.game.to_json()}
+        assert json.loads(connected.encode("blue", event, self.game)) == full_event
+        # the first message of the player has the full information, and its legal moves as it has to move
+        legal = {"bets": [0, 1]}
+        assert json.loads(connected.encode("red", event, self.game)) == {**full_event, "seq": 1, "legal": legal}
+
+        self.game.bet(self.game.current_player.name, 1)
+        connected.publish(self.game)
+        full_event = {"type": "bet", "game_info": self.game.to_json()}
+        player_name = self.game.current_player.name
+        assert json.loads(connected.encode("red", event, self.game)) == {
+            "type": "bet", "game_delta": {"players_info": {player_name: {"turn_bet": 1}}}, "seq": 2, "legal": legal
+        }
+        assert json.loads(connected.encode("red", event, self.game, full=True)) == {
+            **full_event, "seq": 2, "legal": legal
+        }
+
+    def test_publish_only_changes(self):
+        self.connected.enable_deltas("red")
+        self.connected.publish(self.game)
+        self.connected.publish(self.game)
+        assert self.connected.stream.seq == 1
+        self.game.next_player()
+        self.connected.publish(self.game)
+        assert self.connected.stream.seq == 2
+
+    def test_encode_player(self):
+        player = self.game.players["red"]
+        event = json.loads(self.connected.encode("red", {"type": "game_info"}, self.game, player))
+        assert event == {
+            "type": "game_info", "player": player.to_json(), "game_info": self.game.to_json(), "legal": {"bets": [0, 1]},
+        }
+
+    def test_legal_cards(self):
+        for bet in [0, 0]:
+            self.game.bet(self.game.current_player.name, bet)
+            self.game.next_player()
+        self.game.finish_bet_tour()
+        player = self.game.current_player
+        event = json.loads(self.connected.encode(player.name, {"type": "bet"}, self.game))
+        assert event["legal"] == {"cards": player.current_hand.to_json()}
+        other_player = next(name for name in self.game.players if name != player.name)
+        assert "legal" not in json.loads(self.connected.encode(other_player, {"type": "bet"}, self.game))
+
+        # nobody has to move until the round is finished
+        for _ in range(2):
+            player = self.game.current_player
+            card = Hand.from_mask(self.game.legal_cards(player)).to_json()[0]
+            self.game.play(player.name, card["number"], card["suit"])
+            round_ended = self.game.next_player() is None
+        assert round_ended
+        assert get_player_to_move(self.game) is None
+
+    def test_delete(self):
+        self.connected.enable_deltas("red")
+        del self.connected["red"]
+        assert list(self.connected) == ["blue"]
+        assert self.connected.delta_players == set()
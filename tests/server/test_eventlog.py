@@ -0,0 +1,175 @@
+import asyncio
+
+import pytest
+
+from apuestas import app
+from apuestas.actor import GameActor, Leave, Ready
+from apuestas.eventlog import (
+    GAME, PLAYER, EventLog, LoggedGame, benchmark, list_segments, play_bet, read_records, replay, segment_path,
+    write_games,
+)
+from apuestas.models.game import Game
+from apuestas.simulation.policies import LowestCardPolicy
+
+from tests.server.conftest import FakeConnection, wait_turn
+
+
+class TestEventLog:
+    def test_records(self, tmp_path):
+        path = tmp_path / "events.log"
+        log = EventLog(path)
+        game_id = log.new_game(3, 7, "game", "join", "watch")
+        log.add_player(game_id, "red")
+        log.close()
+        data = open(segment_path(path, 1), "rb").read()
+        assert list(read_records(data)) == [
+            (GAME, 0, [3, 7, "game join watch"]),
+            (PLAYER, 0, ["red"]),
+        ]
+        assert log.stats.to_json() == {"records": 2, "bytes": len(data), "commits": 1}
+
+    def test_cut_record(self, tmp_path):
+        path = tmp_path / "events.log"
+        log = EventLog(path)
+        game_id = log.new_game(3, 7)
+        log.add_player(game_id, "red")
+        log.close()
+        data = open(segment_path(path, 1), "rb").read()
+        assert len(list(read_records(data[:-1]))) == 1
+        with pytest.raises(ValueError):
+            list(read_records(b"\x00" + data))
+
+    def test_replay(self, tmp_path):
+        path = tmp_path / "events.log"
+        log = EventLog(path)
+        write_games(log, games=3, players=3, max_cards=4)
+        games = {}
+        for index in range(2):
+            game = Game(max_cards=4, seed=index)
+            game_id = log.new_game(4, index, "key")
+            for name in ["red", "blue"]:
+                game.add_player(name)
+                log.add_player(game_id, name)
+            game.begin_turn()
+            log.begin_turn(game_id)
+            games[game_id] = game
+        for game_id in [0, 1, 2, 4]:
+            log.end_game(game_id)
+        log.close()
+
+        replayed, next_game_id = replay(path)
+        assert next_game_id == 5
+        # the ended games are not rebuilt
+        assert list(replayed) == [3]
+        assert replayed[3].keys == ("key",)
+        assert replayed[3].game.to_json() == games[3].to_json()
+        assert replay(tmp_path / "missing.log") == ({}, 0)
+
+    def test_actor(self, tmp_path):
+        async def run():
+            path = tmp_path / "events.log"
+            log = EventLog(path)
+            game = Game(max_cards=3)
+            actor = GameActor(game, "key", event_log=log, game_id=log.new_game(3, game.rng.seed, "key", "join", "watch"))
+            task = actor.start()
+            red = FakeConnection()
+            await actor.join("red", red)
+            await actor.join("blue", None, bot=LowestCardPolicy())
+            actor.submit(Ready("red", red, "key"))
+            await wait_turn(game, "red")
+            log.flush()
+
+            replayed, _ = replay(path)
+            assert replayed[0].game.to_json() == game.to_json()
+            assert replayed[0].game.players["red"].to_json() == game.players["red"].to_json()
+
+            # the rebuilt game has started, its players only join it again with the keys of their seats
+            restored = GameActor(replayed[0].game, "key", seat_keys={"red": "red key"}, restored=True)
+            assert restored.ready == {"red", "blue"}
+            restored_task = restored.start()
+            assert not await restored.join("red", FakeConnection())
+            assert not await restored.join("red", FakeConnection(), seat_key="blue key")
+            assert await restored.join("red", FakeConnection(), seat_key="red key")
+            assert not await restored.join("red", FakeConnection(), seat_key="red key")
+            # the seats without a key can't be taken
+            assert not await restored.join("blue", FakeConnection(), seat_key="red key")
+            restored.submit(Leave("red", None))
+            await restored_task
+
+            actor.submit(Leave("red", red))
+            await task
+            log.close()
+            # the games that all the players left are not rebuilt
+            assert replay(path) == ({}, 1)
+        asyncio.run(run())
+
+    def test_restore_game_against_bot(self, monkeypatch):
+        monkeypatch.setattr(app, "BOT_TIME_LIMIT", 0.001)
+        game = Game(max_cards=3, seed=1)
+        game.add_player("red")
+        game.add_player("blue")
+        game.begin_turn()
+        if game.current_player.name == "red":
+            play_bet(game, game.current_player_index, 0)
+        # the seat of the bot is logged without a key
+        logged = LoggedGame(game, ("key", "join", "watch", "red:red key", "blue:"))
+
+        async def run():
+            app.restore_games({0: logged})
+            actor = app.REGISTRY.join["join"]
+            assert set(actor.bots) == {"blue"}
+            red = FakeConnection()
+            assert await actor.join("red", red, seat_key="red key")
+            # the new bot plays its move when red joins, without waiting for the deadline of the move
+            await wait_turn(game, "red")
+            assert actor.moves >= 1
+            assert not any(event["type"] == "timeout" for event in red.events)
+            actor.submit(Leave("red", red))
+            await actor._task
+        asyncio.run(asyncio.wait_for(run(), 5))
+        assert len(app.REGISTRY) == 0
+
+    def test_snapshot(self, tmp_path):
+        async def run():
+            path = str(tmp_path / "events.log")
+            log = EventLog(path)
+            games = {}
+            for max_cards in [2, 3, 4]:
+                game = Game(max_cards)
+                game_id = log.new_game(max_cards, game.rng.seed, "key")
+                for name in ["red", "blue"]:
+                    game.add_player(name)
+                    log.add_player(game_id, name)
+                games[game_id] = LoggedGame(game, ("key",))
+            log.end_game(0)
+            del games[0]
+            snapshot = asyncio.create_task(log.snapshot(games, slice_size=1))
+            while log.segment == 1:
+                await asyncio.sleep(0.001)
+            # the moves played while the games are packed are in the new segment
+            for game_id in [2, 1]:
+                games[game_id].game.begin_turn()
+                log.begin_turn(game_id)
+                await asyncio.sleep(0)
+            new_game_id = log.new_game(5, 0)
+            await snapshot
+            play_bet(games[2].game, 0, 0)
+            log.bet(2, 0, 0)
+            log.close()
+            assert list_segments(path) == [2]
+
+            log, replayed = EventLog.recover(path)
+            assert sorted(replayed) == [1, 2, new_game_id]
+            for game_id, logged in games.items():
+                assert replayed[game_id].keys == ("key",)
+                assert replayed[game_id].game.to_json() == logged.game.to_json()
+            assert log.next_game_id == new_game_id + 1
+            assert log.segment == 3
+            log.close()
+        asyncio.run(run())
+
+    def test_benchmark(self):
+        report = benchmark(games=10, players=2, max_cards=3)
+        assert report["games"] == 10
+        assert report["moves"] > 0
+        assert report["moves_per_second"] > 0
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import socket
+
+import pytest
+from websockets.exceptions import ConnectionClosed
+
+from apuestas import app
+from apuestas.inprocess import InProcessServer, run_benchmark, socket_pair
+from apuestas.loadtest import run_clients
+from apuestas.sharding import get_key_prefix
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 5))
+
+
+async def receive(websocket):
+    return json.loads(await websocket.recv())
+
+
+class TestMemoryWebSocket:
+    def test_messages(self):
+        async def check():
+            server_side, client_side = socket_pair()
+            await client_side.send("init")
+            assert await server_side.recv() == "init"
+            await server_side.send("a")
+            await server_side.send("b")
+            await server_side.close(1001)
+            # the messages sent before closing are received
+            assert [message async for message in client_side] == ["a", "b"]
+            assert client_side.close_code == 1001
+            with pytest.raises(ConnectionClosed):
+                await client_side.send("c")
+            with pytest.raises(ConnectionClosed):
+                await server_side.recv()
+        run(check())
+
+
+class TestHandler:
+    def test_game(self):
+        async def check():
+            server = InProcessServer(app.handler)
+            async with server.connect() as red:
+                await red.send(json.dumps({"type": "init"}))
+                init = await receive(red)
+                assert init["type"] == "init"
+                async with server.connect() as blue:
+                    await blue.send(json.dumps({"type": "init", "join": init["join"]}))
+                    for websocket in (red, blue):
+                        event = await receive(websocket)
+                        assert event["type"] == "start"
+                    # each player receives the key of its seat
+                    seat = await receive(blue)
+                    assert seat["type"] == "seat" and seat["player"] == "blue"
+                    assert seat["seat_key"] != init["seat_key"]
+                    await blue.send(json.dumps({"type": "bet", "bet": 0}))
+                    assert (await receive(blue))["message"] == "Invalid event type. We are in state 'start_ack'"
+                    await blue.send("not json")
+                    assert (await receive(blue))["type"] == "error"
+                    # the game starts when the first player is ready
+                    await red.send(json.dumps({"type": "start_ack", "game_key": event["game_key"]}))
+                    for websocket in (red, blue):
+                        event = await receive(websocket)
+                        assert event["type"] == "start_turn"
+                        assert ("legal" in event) == (event["first_player"] == event["player"]["name"])
+            await server.wait_closed()
+            assert server.connections == 2
+        run(check())
+
+    @pytest.mark.parametrize("event, message", [
+        ({"type": "init", "join": "missing"}, "Game not found."),
+        ({"type": "init", "join": "missing", "player": "green"}, "Invalid player."),
+    ])
+    def test_join_errors(self, event, message):
+        async def check():
+            server = InProcessServer(app.handler)
+            async with server.connect() as websocket:
+                await websocket.send(json.dumps(event))
+                assert await receive(websocket) == {"type": "error", "message": message}
+                # the server closes the connection
+                assert [message async for message in websocket] == []
+        run(check())
+
+    def test_join_worker_down(self, monkeypatch):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            free_port = sock.getsockname()[1]
+        # this is the worker of shard 0, and nothing listens on the port of shard 1
+        monkeypatch.setattr(app, "SHARD", 0)
+        monkeypatch.setattr(app, "SHARD_PORT", free_port - 1)
+
+        async def check():
+            server = InProcessServer(app.handler)
+            async with server.connect() as websocket:
+                await websocket.send(json.dumps({"type": "init", "join": get_key_prefix(1) + "key"}))
+                assert await receive(websocket) == {"type": "error", "message": "Game not found."}
+                assert [message async for message in websocket] == []
+        run(check())
+
+    @pytest.mark.parametrize("deltas", [False, True])
+    def test_full_games(self, deltas):
+        async def check():
+            server = InProcessServer(app.handler)
+            stats = await run_clients("memory", games=4, duration=0.1, deltas=deltas, connect=server.connect)
+            await server.wait_closed()
+            return stats
+        stats = run(check())
+        assert stats.errors == 0
+        assert stats.games >= 4
+        # the games are forgotten when their players leave
+        assert len(app.REGISTRY) == 0
+
+    def test_benchmark(self):
+        report = run(run_benchmark(games=2, duration=0.1))
+        assert report["errors"] == 0
+        assert report["moves_per_second"] > 0
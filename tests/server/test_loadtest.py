@@ -0,0 +1,72 @@
+import asyncio
+import os
+import random
+
+from websockets.asyncio.server import serve
+
+from apuestas import app
+from apuestas.loadtest import (
+    choose_move, find_degradation, get_scaling, percentile, read_process_usage, read_server_usage, run_clients,
+)
+
+
+class TestLoadTest:
+    def test_percentile(self):
+        values = [float(value) for value in range(1, 1001)]
+        assert percentile(values, 0.5) == 501.0
+        assert percentile(values, 0.99) == 991.0
+        assert percentile(values, 0.999) == 1000.0
+        assert percentile([], 0.5) == 0.0
+
+    def test_choose_move(self):
+        rng = random.Random(0)
+        assert choose_move({"bets": [1]}, rng) == {"type": "bet", "bet": 1}
+        card = {"number": 3, "suit": "oro"}
+        assert choose_move({"cards": [card]}, rng) == {"type": "play", **card}
+
+    def test_find_degradation(self):
+        steps = [{"games": 10, "latency_p99": 0.01}, {"games": 20, "latency_p99": 0.015},
+                 {"games": 40, "latency_p99": 0.03}]
+        assert find_degradation(steps, 2.0) == 40
+        assert find_degradation(steps, 4.0) is None
+        assert find_degradation([], 2.0) is None
+
+    def test_read_process_usage(self):
+        usage = read_process_usage(os.getpid())
+        if usage is not None:
+            cpu_seconds, memory = usage
+            assert cpu_seconds > 0
+            assert memory > 0
+
+    def test_get_scaling(self):
+        runs = [
+            {"workers": 2, "steps": [{"messages_per_second": 1500.0}, {"messages_per_second": 3000.0}]},
+            {"workers": 1, "steps": [{"messages_per_second": 2000.0}]},
+            {"workers": 4, "steps": [{"messages_per_second": 6000.0}]},
+        ]
+        assert get_scaling(runs) == [
+            {"workers": 1, "messages_per_second": 2000.0, "speedup": 1.0, "efficiency": 1.0},
+            {"workers": 2, "messages_per_second": 3000.0, "speedup": 1.5, "efficiency": 0.75},
+            {"workers": 4, "messages_per_second": 6000.0, "speedup": 3.0, "efficiency": 0.75},
+        ]
+        assert get_scaling([]) == []
+
+    def test_read_server_usage(self):
+        usage = read_process_usage(os.getpid())
+        server_usage = read_server_usage(os.getpid())
+        if usage is not None:
+            # the children of this process are added
+            assert server_usage[0] >= usage[0]
+            assert server_usage[1] >= usage[1]
+
+    def test_run_clients(self):
+        async def run():
+            async with serve(app.handler, "127.0.0.1", 0) as server:
+                uri = f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}/"
+                return await run_clients(uri, games=3, duration=0.3)
+        stats = asyncio.run(asyncio.wait_for(run(), 10))
+        # the clients only play legal moves, once for each message that asks them to move
+        assert stats.errors == 0
+        assert stats.games >= 3
+        # the moves of the games finished after the duration are not measured
+        assert 0 < len(stats.latencies) <= stats.moves
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import socket
+
+from apuestas import app
+from apuestas.inprocess import InProcessServer
+from apuestas.loadtest import run_clients
+from apuestas.metrics import ERROR_KINDS, METRICS, Histogram, Metrics, serve_metrics
+
+
+class TestHistogram:
+    def test_observe(self):
+        histogram = Histogram((1, 2, 4))
+        for value in [0.5, 1, 1.5, 3, 10]:
+            histogram.observe(value)
+        assert histogram.counts == [2, 1, 1, 1]
+        assert histogram.count == 5
+        assert histogram.render("sizes", {"kind": "a"}) == [
+            'sizes_bucket{kind="a",le="1"} 2',
+            'sizes_bucket{kind="a",le="2"} 3',
+            'sizes_bucket{kind="a",le="4"} 4',
+            'sizes_bucket{kind="a",le="+Inf"} 5',
+            'sizes_sum{kind="a"} 16.0',
+            'sizes_count{kind="a"} 5',
+        ]
+
+
+class TestMetrics:
+    def test_render(self):
+        metrics = Metrics()
+        metrics.observe_command("bet", 0.002)
+        metrics.observe_command("unknown", 0.002)
+        metrics.observe_broadcast(2, 300)
+        metrics.count_error("illegal_move")
+        metrics.count_error("Expecting value: line 1 column 6 (char 5)")
+        metrics.add_gauge("live", "Live things.", lambda: 3)
+        metrics.add_gauge("keys", "Keys.", lambda: {"join": 1, "watch": 2}, label="kind")
+        lines = metrics.render().splitlines()
+        assert 'apuestas_handler_latency_seconds_bucket{event="bet",le="0.0025"} 1' in lines
+        assert 'apuestas_handler_latency_seconds_count{event="play"} 0' in lines
+        assert "apuestas_broadcast_fanout_count 1" in lines
+        assert 'apuestas_broadcast_bytes_bucket{le="256"} 0' in lines
+        assert 'apuestas_broadcast_bytes_bucket{le="512"} 1' in lines
+        assert 'apuestas_errors_total{kind="illegal_move"} 1' in lines
+        # the unknown kinds don't add series
+        assert 'apuestas_errors_total{kind="other"} 1' in lines
+        assert len([line for line in lines if line.startswith("apuestas_errors_total{")]) == len(ERROR_KINDS)
+        assert "# TYPE live gauge" in lines
+        assert "live 3" in lines
+        assert 'keys{kind="watch"} 2' in lines
+
+    def test_invalid_json(self):
+        async def run():
+            server = InProcessServer(app.handler)
+            async with server.connect() as websocket:
+                await websocket.send(json.dumps({"type": "init"}))
+                await websocket.recv()
+                for payload in ["{", "[1,", "nope", '{"a": }', "{}}"]:
+                    await websocket.send(payload)
+                    await websocket.recv()
+            await server.wait_closed()
+        invalid_json = METRICS.errors["invalid_json"]
+        asyncio.run(asyncio.wait_for(run(), 5))
+        assert METRICS.errors["invalid_json"] - invalid_json == 5
+        assert set(METRICS.errors) == set(ERROR_KINDS)
+
+    def test_serve(self):
+        async def get(port, path):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+            response = await reader.read()
+            writer.close()
+            return response.decode()
+
+        async def run():
+            metrics = Metrics()
+            metrics.games_completed = 7
+            server = await serve_metrics(metrics, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                return await get(port, "/metrics"), await get(port, "/other")
+            finally:
+                server.close()
+        found, not_found = asyncio.run(asyncio.wait_for(run(), 5))
+        assert found.startswith("HTTP/1.1 200 OK\r\n")
+        assert "\r\n\r\n" in found and "apuestas_games_completed_total 7\n" in found
+        assert not_found.startswith("HTTP/1.1 404")
+
+    def test_server_metrics(self):
+        turns, games = METRICS.turns_completed, METRICS.games_completed
+        bets = METRICS.handler_latency["bet"].count
+        broadcasts = METRICS.broadcast_fanout.count
+
+        async def run():
+            server = InProcessServer(app.handler)
+            stats = await run_clients("memory", games=2, duration=0.05, connect=server.connect)
+            await server.wait_closed()
+            return stats
+        stats = asyncio.run(asyncio.wait_for(run(), 5))
+        # two turns in each game of two cards
+        assert METRICS.games_completed - games == stats.games
+        assert METRICS.turns_completed - turns == 2 * stats.games
+        assert METRICS.handler_latency["bet"].count - bets == 4 * stats.games
+        assert METRICS.broadcast_fanout.count > broadcasts
+
+        app.add_gauges()
+        lines = METRICS.render().splitlines()
+        assert 'apuestas_live_games{keys="join"} 0' in lines
+        assert "apuestas_connected_sockets 0" in lines
+
+    def test_start_metrics_port_in_use(self):
+        async def run():
+            with socket.socket() as sock:
+                sock.bind(("127.0.0.1", 0))
+                sock.listen()
+                return await app.start_metrics(sock.getsockname()[1])
+        assert asyncio.run(run()) is None
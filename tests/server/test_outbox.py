@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from apuestas.outbox import SLOW_CONSUMER_CLOSE_CODE, Connection, get_stats
+
+
+class FakeWebsocket:
+    """Keeps the sent messages. The sends wait while it is blocked"""
+
+    def __init__(self):
+        self.messages = []
+        self.unblocked = asyncio.Event()
+        self.unblocked.set()
+        self.close_code = None
+
+    async def send(self, message):
+        await self.unblocked.wait()
+        self.messages.append(message)
+
+    async def close(self, code=1000, reason=""):
+        self.close_code = code
+
+
+async def wait_sent(connection):
+    for _ in range(100):
+        if connection.depth == 0:
+            break
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+
+class TestConnection:
+    def test_invalid_policy(self):
+        async def run():
+            with pytest.raises(ValueError):
+                Connection(FakeWebsocket(), policy="wait")
+        asyncio.run(run())
+
+    def test_put_does_not_wait(self):
+        async def run():
+            slow, fast = FakeWebsocket(), FakeWebsocket()
+            slow.unblocked.clear()
+            connections = [Connection(slow), Connection(fast)]
+            for connection in connections:
+                connection.put("a")
+            await wait_sent(connections[1])
+            assert fast.messages == ["a"]
+            assert slow.messages == []
+            slow.unblocked.set()
+            await wait_sent(connections[0])
+            assert slow.messages == ["a"]
+            for connection in connections:
+                await connection.close()
+        asyncio.run(run())
+
+    @pytest.mark.parametrize("policy, expected_messages, expected_dropped", [
+        ("drop_oldest", ["4", "5"], 3),
+        ("coalesce", ["5"], 4),
+    ])
+    def test_full_queue(self, policy, expected_messages, expected_dropped):
+        async def run():
+            websocket = FakeWebsocket()
+            websocket.unblocked.clear()
+            connection = Connection(websocket, max_size=2, policy=policy)
+            connection.put("0")
+            # the writer takes the first message and waits to send it
+            await asyncio.sleep(0)
+            for message in ["1", "2", "3", "4", "5"]:
+                connection.put(message)
+            assert connection.stats.dropped == expected_dropped
+            websocket.unblocked.set()
+            await connection.close()
+            assert websocket.messages == ["0"] + expected_messages
+        asyncio.run(run())
+
+    def test_disconnect(self):
+        async def run():
+            websocket = FakeWebsocket()
+            websocket.unblocked.clear()
+            connection = Connection(websocket, max_size=2, policy="disconnect")
+            for message in ["0", "1", "2", "3"]:
+                connection.put(message)
+            await asyncio.sleep(0)
+            assert connection.closed
+            assert connection.stats.disconnected == 1
+            assert websocket.close_code == SLOW_CONSUMER_CLOSE_CODE
+            connection.put("4")
+            assert connection.depth == 0
+        asyncio.run(run())
+
+    def test_stats(self):
+        async def run():
+            websocket = FakeWebsocket()
+            websocket.unblocked.clear()
+            connection = Connection(websocket)
+            for message in ["0", "1", "2"]:
+                connection.put(message)
+            stats = get_stats()
+            assert stats["connections"] >= 1
+            assert stats["max_queue_depth"] >= 3
+            websocket.unblocked.set()
+            await connection.close()
+            assert connection.stats.sent == 3
+            assert connection.max_depth == 3
+            assert connection not in Connection.live
+        asyncio.run(run())
@@ -0,0 +1,68 @@
+import pytest
+
+from apuestas.registry import GameRegistry
+
+
+class FakeActor:
+    def __init__(self, last_activity=0.0):
+        self.last_activity = last_activity
+        self.evicted = False
+
+    def evict(self):
+        self.evicted = True
+
+
+class TestGameRegistry:
+    def test_add(self):
+        registry = GameRegistry()
+        actor = FakeActor()
+        join_key, watch_key = registry.add(actor)
+        assert join_key != watch_key
+        assert registry.join[join_key] is actor
+        assert registry.watch[watch_key] is actor
+        assert actor in registry
+        assert registry.stats() == {"live_games": 1, "evicted_games": 0}
+
+    def test_max_games(self):
+        registry = GameRegistry(max_games=2)
+        actors = [FakeActor(), FakeActor()]
+        for actor in actors:
+            registry.add(actor)
+        with pytest.raises(ValueError):
+            registry.add(FakeActor())
+        registry.remove(actors[0])
+        registry.add(FakeActor())
+        assert len(registry) == 2
+
+    def test_remove(self):
+        registry = GameRegistry(ttl=10)
+        actor = FakeActor()
+        join_key, watch_key = registry.add(actor)
+        registry.remove(actor)
+        registry.remove(actor)
+        assert join_key not in registry.join
+        assert watch_key not in registry.watch
+        assert registry.evict_expired(now=100) == []
+        assert not actor.evicted
+
+    def test_evict_expired(self):
+        registry = GameRegistry(ttl=10)
+        idle, active, new = FakeActor(0), FakeActor(0), FakeActor(5)
+        for actor in [idle, active, new]:
+            registry.add(actor)
+        active.last_activity = 8
+
+        assert registry.evict_expired(now=9) == []
+        assert registry.evict_expired(now=10) == [idle]
+        assert idle.evicted
+        assert idle not in registry
+        assert registry.evict_expired(now=15) == [new]
+        assert registry.evict_expired(now=17) == []
+        assert registry.evict_expired(now=18) == [active]
+        assert registry.stats() == {"live_games": 0, "evicted_games": 3}
+
+    def test_add_with_keys(self):
+        registry = GameRegistry()
+        actor = FakeActor()
+        assert registry.add(actor, ("join", "watch")) == ("join", "watch")
+        assert registry.join["join"] is registry.watch["watch"] is actor
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import time
+
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+
+from apuestas.registry import GameRegistry
+from apuestas.sharding import forward, get_key_prefix, get_shard, run_supervisor
+
+
+def exit_on_startup(shard):
+    raise SystemExit(3)
+
+
+class FakeActor:
+    last_activity = 0.0
+
+    def evict(self):
+        pass
+
+
+class TestSharding:
+    def test_get_shard(self):
+        assert get_shard(get_key_prefix(3) + "abc-_def") == 3
+        assert get_shard("abc-_def") is None
+        assert get_shard("x.abc") is None
+
+    def test_registry_keys(self):
+        registry = GameRegistry(key_prefix=get_key_prefix(2))
+        join_key, watch_key = registry.add(FakeActor())
+        assert get_shard(join_key) == 2
+        assert get_shard(watch_key) == 2
+        # the keys of the restored games are kept
+        assert registry.add(FakeActor(), ("join", "watch")) == ("join", "watch")
+
+    def test_forward(self):
+        async def owner(websocket):
+            init = await websocket.recv()
+            await websocket.send(f"owner: {init}")
+            async for message in websocket:
+                await websocket.send(message.upper())
+
+        async def run():
+            async with serve(owner, "127.0.0.1", 0) as upstream:
+                port = upstream.sockets[0].getsockname()[1]
+
+                async def handler(websocket):
+                    await forward(websocket, await websocket.recv(), f"ws://127.0.0.1:{port}/")
+
+                async with serve(handler, "127.0.0.1", 0) as server:
+                    async with connect(f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}/") as client:
+                        await client.send("init")
+                        assert await client.recv() == "owner: init"
+                        await client.send("bet")
+                        assert await client.recv() == "BET"
+        asyncio.run(asyncio.wait_for(run(), 5))
+
+    def test_supervisor_gives_up_workers_that_exit_on_startup(self, caplog):
+        start = time.monotonic()
+        with caplog.at_level(logging.WARNING, logger="apuestas.sharding"):
+            run_supervisor(2, exit_on_startup, backoff=0.1, max_fast_exits=3)
+        # each worker is started 3 times, after waiting 0.1 and 0.2 s
+        assert 0.3 <= time.monotonic() - start < 5
+        messages = [record.getMessage() for record in caplog.records]
+        assert sum("with code 3, starting it again in 0.2 s" in message for message in messages) == 2
+        given_up = "with code 3 3 times in a row on startup, it is not started again"
+        assert sum(given_up in message for message in messages) == 2
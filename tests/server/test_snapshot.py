@@ -0,0 +1,63 @@
+import gc
+
+import pytest
+
+from apuestas.eventlog import play_bet, play_card
+from apuestas.simulation.policies import RandomPolicy
+from apuestas.snapshot import (
+    benchmark, create_games, long_lived_objects, pack_game, read_snapshot, unpack_game, write_snapshot
+)
+
+
+class TestSnapshot:
+    @pytest.mark.parametrize("players", [2, 3, 5])
+    def test_round_trip(self, players, get_state):
+        for game in create_games(30, players, 5, seed=players):
+            if game.current_muestra is None:
+                continue
+            packed = pack_game(game)
+            restored, offset = unpack_game(b"x" + packed, 1)
+            assert offset == len(packed) + 1
+            assert get_state(restored) == get_state(game)
+            # the next deals are the same
+            for current in [game, restored]:
+                policy = RandomPolicy(1)
+                while not current.has_turn_finished():
+                    player = current.current_player
+                    if current.current_state == "bet":
+                        play_bet(current, current.current_player_index, policy.bet(current, player))
+                    else:
+                        play_card(current, current.current_player_index, policy.play(current, player).id)
+                if not current.has_game_ended():
+                    current.begin_turn()
+            assert get_state(restored) == get_state(game)
+
+    def test_file(self, tmp_path):
+        path = tmp_path / "events.snapshot"
+        games = create_games(5, 2, 3)
+        write_snapshot(path, 4, 9, [(game_id, game_id, ("a", "b"), pack_game(game)) for game_id, game in enumerate(games)])
+        first_segment, next_game_id, entries = read_snapshot(path)
+        assert (first_segment, next_game_id) == (4, 9)
+        assert [entry[:3] for entry in entries] == [(game_id, game_id, ("a", "b")) for game_id in range(5)]
+        assert [entry[3].to_json_text() if entry[3].current_muestra else None for entry in entries] == [
+            game.to_json_text() if game.current_muestra else None for game in games
+        ]
+        path.write_bytes(b"none" + path.read_bytes()[4:])
+        with pytest.raises(ValueError):
+            read_snapshot(path)
+
+    def test_long_lived_objects(self):
+        assert gc.isenabled()
+        with long_lived_objects():
+            assert not gc.isenabled()
+            assert gc.get_freeze_count() > 0
+            games = create_games(5, 2, 3)
+        # the state of the collector is restored, the games are not frozen after the recovery
+        assert gc.isenabled()
+        assert gc.get_freeze_count() == 0
+        assert len(games) == 5
+
+    def test_benchmark(self):
+        report = benchmark(games=10)
+        assert report["games"] == 10
+        assert report["bytes"] > 0
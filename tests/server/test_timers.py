@@ -0,0 +1,67 @@
+import pytest
+
+from apuestas.timers import TimingWheel, benchmark
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTimingWheel:
+    def setup_method(self):
+        self.clock = Clock()
+        self.wheel = TimingWheel(tick=1.0, wheel_size=4, levels=3, clock=self.clock)
+        self.fired = []
+
+    def advance(self, seconds):
+        self.clock.now += seconds
+        self.wheel.advance()
+
+    @pytest.mark.parametrize("delay", [1, 3, 4, 5, 15, 16, 17, 40, 63])
+    def test_fires_at_its_tick(self, delay):
+        self.wheel.schedule(delay, lambda: self.fired.append(self.clock.now))
+        for _ in range(70):
+            self.advance(1)
+        assert self.fired == [delay]
+        assert len(self.wheel) == 0
+
+    def test_max_delay(self):
+        timer = self.wheel.schedule(1000, lambda: self.fired.append(self.clock.now))
+        assert timer.expiry == 63
+        self.advance(63)
+        assert self.fired == [63]
+
+    def test_reschedule(self):
+        timer = self.wheel.schedule(5, lambda: self.fired.append(self.clock.now))
+        self.advance(3)
+        self.wheel.reschedule(timer, 5)
+        assert len(self.wheel) == 1
+        self.advance(4)
+        assert self.fired == []
+        self.advance(1)
+        assert self.fired == [8]
+        assert not timer.active
+
+    def test_cancel(self):
+        timer = self.wheel.schedule(5, lambda: self.fired.append(self.clock.now))
+        timer.cancel()
+        timer.cancel()
+        self.advance(10)
+        assert self.fired == []
+        assert self.wheel.fired == 0
+
+    def test_advance_many_ticks(self):
+        for delay in [2, 20, 50]:
+            self.wheel.schedule(delay, lambda: self.fired.append(self.clock.now))
+        self.advance(60)
+        assert self.wheel.fired == 3
+        assert self.wheel.current == 60
+
+    def test_benchmark(self):
+        report = benchmark([10, 100], rearms=1000)
+        assert [row["games"] for row in report] == [10, 100]
+        assert all(row["wheel_rearm_us"] > 0 for row in report)
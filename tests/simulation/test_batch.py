@@ -0,0 +1,54 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from apuestas.simulation.batch import BatchSimulator, check_conformance, lowest_card, simulate
+
+
+class TestBatchSimulator:
+    def test_init_raises_if_not_enough_cards(self):
+        with pytest.raises(ValueError) as e:
+            BatchSimulator(10, 8, 7)
+
+        assert "There are not enough cards for 8 players and 7 cards." in str(e.value)
+
+    @pytest.mark.parametrize("players, max_cards", [(2, 1), (3, 4), (6, 7)])
+    def test_simulate(self, players, max_cards):
+        games = 50
+        points = simulate(games, players, max_cards, seed=1)
+
+        assert points.shape == (games, players)
+        assert (points >= 0).all()
+        # each turn at least one player fails its bet
+        max_points_per_turn = [10 + 5 * amount_cards for amount_cards in range(1, max_cards + 1)]
+        assert (points.sum(axis=1) < players * sum(max_points_per_turn)).all()
+
+    def test_simulate_is_reproducible(self):
+        first_points = simulate(20, 4, 3, seed=7)
+        second_points = simulate(20, 4, 3, seed=7)
+        assert (first_points == second_points).all()
+
+    def test_hands_are_dealt(self):
+        simulator = BatchSimulator(30, 4, 5, seed=2)
+        simulator._deal(5)
+        assert (simulator.hands.sum(axis=2) == 5).all()
+        # no card is given twice, and the muestra is not given
+        assert (simulator.hands.sum(axis=1) <= 1).all()
+        assert not simulator.hands.any(axis=1)[np.arange(30), simulator.muestra].any()
+
+    def test_policy_raises_if_illegal_move(self):
+        def illegal_bet(simulator, seats, legal_bets):
+            return np.full(simulator.games, simulator.amount_cards + 1)
+
+        simulator = BatchSimulator(5, 3, 2, seed=1, bet_policy=illegal_bet)
+        with pytest.raises(ValueError) as e:
+            simulator.run()
+
+        assert "The policy has chosen an illegal move." in str(e.value)
+
+
+class TestConformance:
+    @pytest.mark.parametrize("players, max_cards, play_policy", [(2, 3, None), (3, 7, None), (4, 7, lowest_card), (8, 5, None)])
+    def test_check_conformance(self, players, max_cards, play_policy):
+        kwargs = {"play_policy": play_policy} if play_policy else {}
+        assert check_conformance(40, players, max_cards, seed=3, **kwargs) == []
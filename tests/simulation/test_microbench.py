@@ -0,0 +1,49 @@
+import pytest
+
+from apuestas.simulation.microbench import BENCHMARKS, TurnStates, compare, mann_whitney_p, run_suite
+
+
+def create_results(medians: dict, spread: float = 0.01) -> dict:
+    return {"results": {
+        key: {"median": median, "samples": [median * (1 + spread * offset) for offset in range(-3, 4)]}
+        for key, median in medians.items()
+    }}
+
+
+class TestMicrobench:
+    @pytest.mark.parametrize("players, cards", [(2, 1), (4, 3), (8, 4)])
+    def test_turn_states(self, players, cards):
+        states = TurnStates(players, cards)
+        assert states.bet.current_state == "bet"
+        assert states.play.current_state == "play"
+        assert all(player.current_card is not None for player in states.round.players.values())
+        assert states.turn.has_turn_finished()
+        assert not states.turn.has_game_ended() or cards == states.turn.max_cards
+
+    def test_run_suite(self):
+        report = run_suite(players=[2, 8], cards=[1, 6], number=5, rounds=3)
+        # 8 players can't be dealt 6 cards
+        assert {key.split("/", 1)[1] for key in report["results"]} == {"2p/1c", "2p/6c", "8p/1c"}
+        assert len(report["results"]) == 3 * len(BENCHMARKS)
+        for result in report["results"].values():
+            assert len(result["samples"]) == 3
+            assert result["median"] > 0
+
+    def test_mann_whitney_p(self):
+        baseline = [1.0, 1.1, 1.2, 1.3, 1.4, 1.5, 1.6]
+        assert mann_whitney_p(baseline, [value + 1 for value in baseline]) < 0.01
+        assert mann_whitney_p(baseline, list(baseline)) == pytest.approx(0.5, abs=0.1)
+        assert mann_whitney_p(baseline, [value - 1 for value in baseline]) > 0.99
+
+    def test_compare(self):
+        baseline = create_results({"bet/2p/1c": 1.0, "play/2p/1c": 1.0, "end_turn/2p/1c": 1.0, "get_hands/2p/1c": 1.0})
+        new = create_results({"bet/2p/1c": 1.5, "play/2p/1c": 1.05, "end_turn/2p/1c": 0.5, "other/2p/1c": 1.0})
+        # the change of play is below the threshold
+        changes = {change["benchmark"]: change for change in compare(baseline, new)}
+        assert set(changes) == {"bet/2p/1c", "end_turn/2p/1c"}
+        assert changes["bet/2p/1c"]["regression"]
+        assert changes["bet/2p/1c"]["ratio"] == pytest.approx(1.5)
+        assert not changes["end_turn/2p/1c"]["regression"]
+
+        noisy = create_results({"bet/2p/1c": 1.5}, spread=0.5)
+        assert compare(baseline, noisy) == []
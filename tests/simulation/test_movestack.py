@@ -0,0 +1,16 @@
+from apuestas.simulation.movestack import benchmark, create_turn
+
+
+class TestMoveStack:
+    def test_create_turn(self):
+        game, moves = create_turn(players=3, cards=4)
+        assert game.current_state == "bet"
+        assert len(moves) == 3 * (1 + 4)
+        for move in moves:
+            game.push_move(move)
+        assert game.has_turn_finished()
+
+    def test_benchmark(self):
+        report = benchmark(players=2, cards=2, repeat=10)
+        assert set(report) == {"push_pop_move", "clone", "deepcopy", "clone_and_move", "deepcopy_and_move"}
+        assert all(microseconds > 0 for microseconds in report.values())
@@ -0,0 +1,81 @@
+from functools import partial
+
+import pytest
+
+from apuestas.models.card import Card
+from apuestas.models.game import Game
+from apuestas.simulation.policies import (
+    LowestCardPolicy, Policy, RandomPolicy, create_policy, get_legal_bets, get_legal_cards,
+)
+
+
+class TestLegalMoves:
+    def setup_method(self):
+        self.game = Game(3)
+        self.game.add_player("red")
+        self.game.add_player("blue")
+        self.game.add_player("green")
+        self.game.current_amount_cards = 2
+        self.game.begin_turn()
+
+    def test_get_legal_bets(self):
+        assert get_legal_bets(self.game) == [0, 1, 2]
+
+    @pytest.mark.parametrize("first_bet, second_bet, expected_bets", [(0, 1, [0, 2]), (2, 1, [0, 1, 2]), (0, 0, [0, 1])])
+    def test_get_legal_bets_last_player(self, first_bet, second_bet, expected_bets):
+        self.game.bet("red", first_bet)
+        self.game.next_player()
+        self.game.bet("blue", second_bet)
+        self.game.next_player()
+
+        assert get_legal_bets(self.game) == expected_bets
+
+    def test_get_legal_cards(self):
+        player = self.game.players["red"]
+        player.distribute_new_hand([Card(1, "Basto"), Card(1, "Oro"), Card(5, "Oro")])
+
+        assert get_legal_cards(self.game, player) == [Card(1, "Oro"), Card(5, "Oro"), Card(1, "Basto")]
+
+        self.game.current_suit = "Oro"
+        assert get_legal_cards(self.game, player) == [Card(1, "Oro"), Card(5, "Oro")]
+
+        self.game.current_suit = "Copa"
+        assert get_legal_cards(self.game, player) == [Card(1, "Oro"), Card(5, "Oro"), Card(1, "Basto")]
+
+
+class TestPolicies:
+    def test_lowest_card_policy(self):
+        game = Game(2)
+        game.add_player("red")
+        game.add_player("blue")
+        game.begin_turn()
+        player = game.players["red"]
+        player.distribute_new_hand([Card(5, "Copa"), Card(2, "Espada")])
+        policy = LowestCardPolicy()
+
+        assert policy.bet(game, player) == 0
+        assert policy.play(game, player) == Card(2, "Espada")
+
+    def test_random_policy_is_reproducible(self):
+        game = Game(2)
+        game.add_player("red")
+        game.add_player("blue")
+        game.current_amount_cards = 2
+        game.begin_turn()
+        player = game.players["red"]
+
+        first_moves = [RandomPolicy(seed=3).play(game, player) for _ in range(5)]
+        second_moves = [RandomPolicy(seed=3).play(game, player) for _ in range(5)]
+        assert first_moves == second_moves
+        assert all(card in player.current_hand for card in first_moves)
+
+
+def test_policy_is_abstract():
+    with pytest.raises(TypeError):
+        Policy()
+
+
+def test_create_policy():
+    assert create_policy(RandomPolicy, 3).random.random() == RandomPolicy(seed=3).random.random()
+    assert create_policy(partial(RandomPolicy), 3).random.random() == RandomPolicy(seed=3).random.random()
+    assert isinstance(create_policy(LowestCardPolicy, 3), LowestCardPolicy)
@@ -0,0 +1,46 @@
+import pytest
+
+from apuestas.simulation.policies import LowestCardPolicy, RandomPolicy
+from apuestas.simulation.selfplay import PHASES, SelfPlayStats, play_game, run_benchmark
+
+
+class TestPlayGame:
+    @pytest.mark.parametrize("players, max_cards", [(2, 1), (3, 4), (6, 7)])
+    def test_play_game(self, players, max_cards):
+        stats = SelfPlayStats()
+        policies = [RandomPolicy(seed=index) for index in range(players)]
+
+        game = play_game(policies, max_cards, stats)
+
+        assert game.has_game_ended() is True
+        assert game.has_turn_finished() is True
+        assert stats.games == 1
+        # every turn, each player bets once and plays all its cards
+        assert stats.moves == sum(players * (1 + amount_cards) for amount_cards in range(1, max_cards + 1))
+        assert set(stats.phase_times) == set(PHASES)
+        assert all(phase_time > 0 for phase_time in stats.phase_times.values())
+
+    def test_play_game_is_reproducible(self):
+        points = []
+        for _ in range(2):
+            game = play_game([RandomPolicy(seed=1), RandomPolicy(seed=2)], max_cards=4, seed=7)
+            points.append([player.points for player in game.players.values()])
+        assert points[0] == points[1]
+
+    def test_play_game_with_different_policies(self):
+        game = play_game([LowestCardPolicy(), RandomPolicy(seed=1)], max_cards=3)
+
+        assert game.has_game_ended() is True
+        assert list(game.players) == ["0", "1"]
+
+
+class TestRunBenchmark:
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_run_benchmark(self, workers):
+        stats = run_benchmark(5, players=3, max_cards=2, workers=workers)
+
+        assert stats.games == 5
+        assert stats.moves == 5 * (3 * 2 + 3 * 3)
+        assert stats.elapsed > 0
+        assert stats.games_per_second > 0
+        assert "games/s" in stats.report()
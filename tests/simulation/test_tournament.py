@@ -0,0 +1,93 @@
+import json
+import random
+
+import pytest
+
+from apuestas.simulation.policies import LowestCardPolicy, RandomPolicy
+from apuestas.simulation.tournament import (
+    INITIAL_RATING, MatchResult, Tournament, play_matches, scaling_report, schedule_matches
+)
+
+
+POLICIES = {"random": RandomPolicy, "lowest": LowestCardPolicy}
+
+
+class TestScheduleMatches:
+    def test_schedule_matches_is_reproducible(self):
+        first_matches = schedule_matches(POLICIES, 2, 10, seed=3)
+        second_matches = schedule_matches(POLICIES, 2, 10, seed=3)
+        assert first_matches == second_matches
+        assert [match.match_id for match in first_matches] == list(range(10))
+
+    @pytest.mark.parametrize("players", [2, 4])
+    def test_schedule_matches_players(self, players):
+        for match in schedule_matches(POLICIES, players, 5, games_per_match=2):
+            assert len(match.policies) == players
+            assert set(match.policies) <= set(POLICIES)
+            assert match.games == 2
+
+
+class TestTournament:
+    def test_update_ratings(self):
+        tournament = Tournament(POLICIES, players=2)
+        tournament.update_ratings(MatchResult(0, ["random", "lowest"], [[10, 5], [20, 1]]))
+
+        assert tournament.ratings["random"] > INITIAL_RATING
+        assert tournament.ratings["lowest"] < INITIAL_RATING
+        assert tournament.ratings["random"] + tournament.ratings["lowest"] == pytest.approx(2 * INITIAL_RATING)
+        assert tournament.games_played == {"random": 2, "lowest": 2}
+        assert tournament.completed_matches == {0}
+
+    def test_update_ratings_same_policy(self):
+        tournament = Tournament(POLICIES, players=2)
+        tournament.update_ratings(MatchResult(0, ["random", "random"], [[10, 5]]))
+
+        assert tournament.ratings["random"] == INITIAL_RATING
+
+    def test_play_matches_is_reproducible(self):
+        matches = schedule_matches(POLICIES, 2, 4, games_per_match=2, seed=5)
+        results = play_matches(POLICIES, matches, max_cards=3)
+        # the global random is not used
+        random.seed(1)
+        assert play_matches(POLICIES, matches, max_cards=3) == results
+        assert len({str(result.points) for result in results}) > 1
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_run(self, workers):
+        tournament = Tournament(POLICIES, players=2, max_cards=2)
+        matches = schedule_matches(POLICIES, 2, 6)
+        results = []
+
+        stats = tournament.run(matches, workers=workers, chunk_size=2, on_result=results.append)
+
+        assert stats.matches == 6
+        assert stats.games == 6
+        assert sorted(result.match_id for result in results) == list(range(6))
+        assert sum(tournament.games_played.values()) == 12
+
+    def test_resume_from_checkpoint(self, tmp_path):
+        checkpoint_path = tmp_path / "tournament.json"
+        matches = schedule_matches(POLICIES, 2, 6)
+        tournament = Tournament(POLICIES, players=2, max_cards=2, checkpoint_path=checkpoint_path)
+        tournament.run(matches[:4], chunk_size=2)
+
+        checkpoint = json.loads(checkpoint_path.read_text())
+        assert checkpoint["completed_matches"] == [0, 1, 2, 3]
+
+        resumed_tournament = Tournament(POLICIES, players=2, max_cards=2, checkpoint_path=checkpoint_path)
+        assert resumed_tournament.ratings == tournament.ratings
+        stats = resumed_tournament.run(matches)
+
+        assert stats.matches == 2
+        assert resumed_tournament.completed_matches == set(range(6))
+        assert [name for name, _, _ in resumed_tournament.standings()] == sorted(
+            POLICIES, key=resumed_tournament.ratings.get, reverse=True
+        )
+
+
+def test_scaling_report():
+    report = scaling_report([1, 2], matches=4, players=2, max_cards=2, chunk_size=2, policies=POLICIES)
+
+    assert [row["workers"] for row in report] == [1, 2]
+    assert report[0]["efficiency"] == pytest.approx(1.0)
+    assert all(row["games_per_second"] > 0 for row in report)